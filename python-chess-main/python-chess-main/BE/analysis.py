@@ -0,0 +1,199 @@
+# backend/analysis.py
+
+"""Phân tích sau ván: đánh giá mọi thế cờ của một hoặc nhiều ván trên nhóm worker tìm kiếm.
+
+Các thế cờ của cùng một ván được gửi lần lượt tới cùng một worker (cùng game_key) nên bảng
+chuyển vị của nước trước được dùng lại cho nước sau; nhiều ván chạy song song trên các worker.
+Kết quả trả về theo thứ tự hoàn thành, mỗi thế cờ một dòng JSON (NDJSON).
+
+Chạy: python analysis.py games.pgn --depth 3 --movetime 500 > review.ndjson
+      python analysis.py positions.txt --fens            (mỗi dòng một FEN)
+"""
+
+import argparse
+import io
+import itertools
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import chess # type: ignore
+import chess.pgn # type: ignore
+
+from chess_engine import MATE_SCORE, MATE_BOUND
+from search_service import SearchService
+
+# Ngân sách mặc định cho mỗi thế cờ
+DEFAULT_BUDGET = {'max_depth': 3, 'movetime_ms': 500}
+# Chờ trước khi thử gửi lại khi worker của các ván đang bận (giây)
+RETRY_DELAY = 0.05
+
+
+class AnalysisGame:
+    """Một ván cần phân tích: thế cờ gốc và các nước đi, hoặc một dãy FEN độc lập."""
+
+    def __init__(self, index, start_fen=chess.STARTING_FEN, moves=(), fens=None):
+        self.index = index
+        self.start_fen = start_fen
+        self.moves = list(moves)
+        self.fens = fens
+        self.game_key = f"analysis:{uuid.uuid4()}"
+
+    def positions(self):
+        """Sinh (ply, fen gốc của job, các nước đi tới thế cờ, fen thế cờ, nước đã đi ở thế cờ này)."""
+        if self.fens is not None:
+            for ply, fen in enumerate(self.fens):
+                yield ply, fen, [], fen, None
+            return
+        board = chess.Board(self.start_fen)
+        for ply in range(len(self.moves) + 1):
+            played = self.moves[ply] if ply < len(self.moves) else None
+            yield ply, self.start_fen, self.moves[:ply], board.fen(), played
+            if played is not None:
+                board.push_uci(played)
+
+
+def games_from_pgn(text_or_file):
+    """Đọc lần lượt các ván trong PGN (chuỗi hoặc file đang mở), không nạp cả file vào bộ nhớ."""
+    handle = io.StringIO(text_or_file) if isinstance(text_or_file, str) else text_or_file
+    for index in itertools.count():
+        game = chess.pgn.read_game(handle)
+        if game is None:
+            return
+        if game.errors:
+            raise ValueError(f"Invalid PGN in game {index}: {game.errors[0]}")
+        yield AnalysisGame(index, game.board().fen(), [move.uci() for move in game.mainline_moves()])
+
+
+def games_from_fens(fens):
+    """Một dãy FEN được coi như một ván (dùng chung bảng chuyển vị)."""
+    fens = [fen.strip() for fen in fens if fen.strip()]
+    for fen in fens:
+        if not chess.Board(fen).is_valid():  # chess.Board ném ValueError nếu FEN sai cú pháp
+            raise ValueError(f"Invalid position: {fen}")
+    return [AnalysisGame(0, fens=fens)] if fens else []
+
+
+def _format_score(score):
+    """Điểm theo góc nhìn bên Trắng: (centipawn, số nước tới chiếu hết)."""
+    if score is None:
+        return None, None
+    if score > MATE_BOUND:
+        return None, (MATE_SCORE - score + 1) // 2
+    if score < -MATE_BOUND:
+        return None, -((MATE_SCORE + score + 1) // 2)
+    return score, None
+
+
+def analyze(service, games, budget=None, concurrency=None):
+    """Phân tích các ván (iterable, đọc dần) và sinh kết quả từng thế cờ theo thứ tự hoàn thành.
+
+    Job phân tích có độ ưu tiên thấp như pondering: chỉ chạy trên worker rảnh và bị hủy khi ván
+    đang chơi cần worker đó, thế cờ bị hủy được gửi lại sau. Mỗi ván chỉ có một job tại một thời
+    điểm; tối đa `concurrency` ván cùng lúc (mặc định một nửa số worker). Đóng generator sẽ hủy
+    các job còn đang chạy.
+    """
+    budget = dict(DEFAULT_BUDGET, **(budget or {}))
+    # Phân tích cần điểm số thật, không lấy nước từ sách khai cuộc
+    budget['use_book'] = False
+    concurrency = concurrency or max(1, service.workers // 2)
+    games = iter(games)
+    active = {}   # {future: (job, game, positions iterator, position)}
+    waiting = []  # [(game, positions iterator, position)] chờ worker rảnh hoặc cần gửi lại
+
+    def advance(game, positions):
+        position = next(positions, None)
+        if position is None:
+            return False
+        waiting.append((game, positions, position))
+        return True
+
+    def fill():
+        while len(active) + len(waiting) < concurrency:
+            game = next(games, None)
+            if game is None:
+                return
+            advance(game, game.positions())
+
+    def submit_waiting():
+        for item in list(waiting):
+            game, positions, position = item
+            _, fen, moves, _, _ = position
+            job = service.submit(game.game_key, fen, moves, budget, background=True)
+            if job is not None:
+                waiting.remove(item)
+                active[job.future] = (job, game, positions, position)
+
+    try:
+        fill()
+        while active or waiting:
+            submit_waiting()
+            if not active:
+                # Mọi worker của các ván đang bận: chờ rồi thử lại
+                time.sleep(RETRY_DELAY)
+                continue
+            done, _ = wait(list(active), timeout=RETRY_DELAY if waiting else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, game, positions, position = active.pop(future)
+                try:
+                    result = None if future.cancelled() else future.result()
+                except BrokenProcessPool:
+                    result = None
+                if result is None or result['cancelled']:
+                    # Worker được nhường cho ván đang chơi (hoặc đã chết và được khởi động lại):
+                    # phân tích lại thế cờ này sau
+                    waiting.append((game, positions, position))
+                    continue
+                ply, _, _, fen, played = position
+                cp, mate = _format_score(result['score'])
+                yield {
+                    'game': game.index,
+                    'ply': ply,
+                    'fen': fen,
+                    'played': played,
+                    'best_move': result['move'],
+                    'score_cp': cp,
+                    'mate': mate,
+                    'depth': result['depth'],
+                    'pv': result['pv'],
+                    'nodes': result['nodes'],
+                    'time_ms': result['time_ms'],
+                }
+                if not advance(game, positions):
+                    fill()
+    finally:
+        for job, _, _, _ in active.values():
+            job.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse every position of PGN games or a list of FENs')
+    parser.add_argument('input', help='PGN file, or FEN list with --fens ("-" for stdin)')
+    parser.add_argument('--fens', action='store_true', help='input has one FEN per line')
+    parser.add_argument('--depth', type=int, default=DEFAULT_BUDGET['max_depth'])
+    parser.add_argument('--movetime', type=int, default=DEFAULT_BUDGET['movetime_ms'], help='ms per position')
+    parser.add_argument('--nodes', type=int, default=None, help='node limit per position')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--hash', type=int, default=16, help='transposition table size per game (MB)')
+    args = parser.parse_args(argv)
+
+    handle = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', errors='replace')
+    service = SearchService(workers=args.workers, hash_mb=args.hash)
+    try:
+        games = games_from_fens(handle) if args.fens else games_from_pgn(handle)
+        budget = {'max_depth': args.depth, 'movetime_ms': args.movetime, 'max_nodes': args.nodes}
+        # Dịch vụ tìm kiếm riêng của lệnh này: dùng mọi worker
+        for line in analyze(service, games, budget, concurrency=service.workers):
+            sys.stdout.write(json.dumps(line) + '\n')
+            sys.stdout.flush()
+    finally:
+        service.shutdown()
+        if handle is not sys.stdin:
+            handle.close()
+
+
+if __name__ == '__main__':
+    main()
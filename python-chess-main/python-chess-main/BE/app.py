@@ -1,11 +1,20 @@
 # backend/app.py
 
-from flask import Flask, render_template, request, jsonify # type: ignore
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context # type: ignore
 from flask_sock import Sock # type: ignore
-from chess_engine import ChessEngine
+import chess # type: ignore
+from analysis import analyze, games_from_fens, games_from_pgn
+from chess_engine import HINT_LINES, HINT_MAX_DEPTH, HINT_MOVETIME_MS
+from game_store import GameConflict, create_store
+from matchmaking import Matchmaker
+from ponder import Ponderer
+from search_service import SearchService, SearchQueueFull, SearchRateLimited, SearchTimeout, SearchUnavailable, WORKER_MEMORY_MB
+from search_stats import SearchMetrics
 import json
+import os
 import random
 import string
+import threading
 import uuid
 
 app = Flask(__name__, 
@@ -14,14 +23,46 @@ app = Flask(__name__,
 sock = Sock(app)
 
 # --- Quản lý trạng thái Game ---
-# Sử dụng dictionary để lưu trữ nhiều phiên game (AI, Local, Online)
-games = {} # {game_id: ChessEngine object}
-rooms = {} # {room_code: game_id}
-waiting_player_ws = None # WebSocket của người chơi đang chờ ghép ngẫu nhiên
+# Ván cờ và mã phòng nằm trong kho lưu trữ (bộ nhớ hoặc SQLite, chọn qua CHESS_GAME_STORE)
+# để có thể chạy nhiều worker và giữ ván qua các lần khởi động lại
+store = create_store()
+matchmaker = Matchmaker() # Hàng chờ ghép ngẫu nhiên, chia nhóm theo trình độ/thời gian
 
 # --- Quản lý WebSocket Sessions ---
 ws_sessions = {} # {session_id: ws}
 
+# --- Dịch vụ tìm kiếm AI (nhóm tiến trình worker, khởi tạo khi cần) ---
+search_service = None
+search_service_lock = threading.Lock()
+# Số liệu tìm kiếm cộng dồn cho /metrics
+search_metrics = SearchMetrics()
+# Pondering: tìm trước trong lúc người chơi suy nghĩ (tắt bằng CHESS_PONDER=0)
+ponderer = Ponderer() if os.environ.get('CHESS_PONDER', '1') != '0' else None
+
+def get_search_service():
+    """Khởi tạo nhóm worker tìm kiếm ở lần dùng đầu tiên (số worker lấy từ CHESS_SEARCH_WORKERS,
+    bộ nhớ bảng chuyển vị mỗi worker từ CHESS_WORKER_MEMORY_MB)."""
+    global search_service
+    with search_service_lock:
+        if search_service is None:
+            workers = int(os.environ.get('CHESS_SEARCH_WORKERS', '0')) or None
+            memory_mb = int(os.environ.get('CHESS_WORKER_MEMORY_MB', '0')) or WORKER_MEMORY_MB
+            search_service = SearchService(workers=workers, memory_mb=memory_mb)
+    return search_service
+
+# Giới hạn cho /api/analyze: số thế cờ mỗi request và ngân sách mỗi thế cờ
+MAX_ANALYZE_POSITIONS = 2000
+MAX_ANALYZE_DEPTH = 6
+MAX_ANALYZE_MOVETIME_MS = 2000
+MAX_ANALYZE_NODES = 200000
+# Số nước gợi ý tối đa mỗi request
+MAX_HINT_LINES = 5
+
+@app.errorhandler(GameConflict)
+def game_conflict(e):
+    """Worker khác vừa lưu cùng ván: thay đổi của request này bị bỏ, client đọc lại ván rồi thử lại."""
+    return jsonify({'error': str(e)}), 409
+
 def generate_room_code():
     """Tạo mã phòng ngẫu nhiên 6 chữ số (1-9)."""
     return ''.join(random.choices(string.digits.replace('0', ''), k=6))
@@ -39,8 +80,8 @@ def start_ai_game():
     level = data.get('level', 'Thành Thạo')
     game_id = str(uuid.uuid4())
     
-    engine = ChessEngine()
-    games[game_id] = {'engine': engine, 'level': level, 'mode': 'AI'}
+    game_data = store.create_game(game_id, 'AI', level=level)
+    engine = game_data['engine']
     
     return jsonify({
         'game_id': game_id,
@@ -49,60 +90,208 @@ def start_ai_game():
 
 @app.route('/api/ai_move/<game_id>', methods=['POST'])
 def ai_move(game_id):
-    game_data = games.get(game_id)
+    game_data = store.get_game(game_id)
     if not game_data or game_data['mode'] != 'AI':
         return jsonify({'error': 'Game not found or not AI mode'}), 404
     
     engine = game_data['engine']
     
-    # Lấy nước đi của người chơi
+    # Lấy nước đi của người chơi; nước không hợp lệ bị từ chối trước khi AI tìm kiếm
     player_uci = request.json.get('uci')
-    engine.make_move(player_uci)
+    try:
+        moved = engine.make_move(player_uci)
+    except (ValueError, TypeError):
+        moved = False
+    if not moved:
+        return jsonify({'error': 'Illegal move'}), 400
+
+    # Client có thể yêu cầu bản rút gọn: {"delta": true, "legal_moves": false}
+    delta = bool(request.json.get('delta', False))
+    include_legal_moves = bool(request.json.get('legal_moves', True))
+    # {"stats": true}: trả kèm số liệu tìm kiếm của nước đi AI
+    include_stats = bool(request.json.get('stats', False))
     
     # Kiểm tra kết thúc game sau nước đi người chơi
-    if engine.is_game_over():
-        return jsonify(engine.get_status())
+    if engine.get_status()['game_over']:
+        if ponderer:
+            ponderer.cancel(game_id)
+        store.save_game(game_data)
+        return jsonify(engine.get_status(delta, include_legal_moves))
     
-    # Lấy nước đi của AI
-    ai_uci = engine.get_ai_move(game_data['level'])
+    # Lấy nước đi của AI: tìm kiếm chạy trong tiến trình worker, không chặn luồng web
+    level = game_data['level']
+    budget = {
+        'max_depth': engine.depth_map.get(level, 3),
+        'movetime_ms': engine.time_map.get(level, 1000)
+    }
+    # Người chơi đi đúng nước AI dự đoán: dùng luôn kết quả pondering
+    result = ponderer.take(game_id, engine.board, budget['movetime_ms']) if ponderer else None
+    ponder_hit = result is not None
+    try:
+        if result is None:
+            result = get_search_service().submit_board(game_id, engine.board, budget).result()
+    except (SearchQueueFull, SearchRateLimited, SearchTimeout, SearchUnavailable) as e:
+        # Hoàn tác nước đi của người chơi để client có thể gửi lại đúng request này
+        if moved:
+            engine.undo_move()
+        store.save_game(game_data)
+        if isinstance(e, SearchRateLimited):
+            return jsonify({'error': str(e)}), 429
+        if isinstance(e, SearchTimeout):
+            return jsonify({'error': str(e)}), 504
+        return jsonify({'error': 'AI is busy, please retry'}), 503, {'Retry-After': '1'}
+
+    search_metrics.observe(result.get('stats'))
+    ai_uci = result['move']
     if ai_uci:
         engine.make_move(ai_uci)
+        if ponderer:
+            ponderer.start(get_search_service(), game_id, engine.board, result['pv'], budget)
+    store.save_game(game_data)
         
-    return jsonify(engine.get_status())
+    response = engine.get_status(delta, include_legal_moves)
+    if include_stats:
+        response = dict(response, search_stats=dict(result.get('stats') or {}, ponder_hit=ponder_hit))
+    return jsonify(response)
 
 @app.route('/api/ai_controls/<game_id>', methods=['POST'])
 def ai_controls(game_id):
-    game_data = games.get(game_id)
+    game_data = store.get_game(game_id)
     if not game_data:
         return jsonify({'error': 'Game not found'}), 404
         
     engine = game_data['engine']
-    action = request.json.get('action')
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid request body'}), 400
+    action = data.get('action')
+    if ponderer and action in ('undo', 'redo', 'seek', 'restart'):
+        ponderer.cancel(game_id)
     
     if action == 'undo':
         engine.undo_move()
         # Quay lại 2 lần (nước đi của AI và người chơi)
-        if engine.undo_move(): 
+        undone = engine.undo_move()
+        store.save_game(game_data)
+        if undone: 
             return jsonify(engine.get_status())
         else:
             return jsonify({'status': 'Board is empty'})
+
+    elif action == 'redo':
+        # Đi lại nước của người chơi và nước trả lời của AI
+        redone = engine.redo_move()
+        engine.redo_move()
+        store.save_game(game_data)
+        if redone:
+            return jsonify(engine.get_status())
+        else:
+            return jsonify({'status': 'Nothing to redo'})
+
+    elif action == 'seek':
+        # Chỉ tới các ply mà người chơi đang có lượt, để AI không bị kẹt chờ nước của người chơi
+        ply = data.get('ply')
+        if not isinstance(ply, int) or (ply - len(engine.board.move_stack)) % 2 or not engine.seek(ply):
+            return jsonify({'error': 'Invalid ply'}), 400
+        store.save_game(game_data)
+        return jsonify(engine.get_status())
             
     elif action == 'hint':
-        hint = engine.get_hint_move()
-        return jsonify({'hint': hint})
+        # Gợi ý chạy trên worker của ván để dùng lại bảng chuyển vị của AI/pondering:
+        # thường trả lời ngay từ bảng, chỉ tìm multi-PV ngắn khi bảng chưa có thế cờ này
+        count = data.get('count', HINT_LINES)
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            return jsonify({'error': 'Invalid count'}), 400
+        count = min(count, MAX_HINT_LINES)
+        budget = {'hint': True, 'multipv': count, 'max_depth': HINT_MAX_DEPTH, 'movetime_ms': HINT_MOVETIME_MS}
+        try:
+            result = get_search_service().submit_board(game_id, engine.board, budget).result()
+        except SearchRateLimited as e:
+            return jsonify({'error': str(e)}), 429
+        except SearchTimeout as e:
+            return jsonify({'error': str(e)}), 504
+        except (SearchQueueFull, SearchUnavailable):
+            return jsonify({'error': 'AI is busy, please retry'}), 503, {'Retry-After': '1'}
+        return jsonify({'hint': result['move'], 'hints': result['lines']})
         
     elif action == 'restart':
         engine.reset_board()
+        store.save_game(game_data)
         return jsonify(engine.get_status())
 
     return jsonify({'error': 'Invalid action'}), 400
 
+@app.route('/api/history/<game_id>')
+def game_history(game_id):
+    """Nước đi của ván và ply hiện tại; ?ply=N kèm thế cờ ở ply đó để xem lại mà không đổi ván."""
+    game_data = store.get_game(game_id)
+    if not game_data:
+        return jsonify({'error': 'Game not found'}), 404
+    ply = request.args.get('ply', type=int)
+    try:
+        return jsonify(game_data['engine'].get_history(ply))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/metrics')
+def metrics():
+    """Số liệu tìm kiếm của AI theo định dạng Prometheus."""
+    text = search_metrics.render() + (ponderer.render() if ponderer else '')
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/matchmaking/stats')
+def matchmaking_stats():
+    """Độ sâu hàng chờ ghép và thời gian chờ."""
+    return jsonify(matchmaker.metrics())
+
+# --- API phân tích ván cờ ---
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_games():
+    """Phân tích mọi thế cờ của PGN ({"pgn": ...}) hoặc danh sách FEN ({"fens": [...]}).
+
+    Kết quả được stream dạng NDJSON, mỗi thế cờ một dòng, theo thứ tự hoàn thành.
+    """
+    data = request.json or {}
+    try:
+        if data.get('pgn'):
+            games = list(games_from_pgn(data['pgn']))
+        else:
+            games = games_from_fens(data.get('fens') or [])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not games:
+        return jsonify({'error': 'Nothing to analyze'}), 400
+
+    positions = sum(len(game.fens) if game.fens is not None else len(game.moves) + 1 for game in games)
+    if positions > MAX_ANALYZE_POSITIONS:
+        return jsonify({'error': f'Too many positions (max {MAX_ANALYZE_POSITIONS})'}), 413
+
+    try:
+        budget = {
+            'max_depth': max(1, min(int(data.get('depth', 3)), MAX_ANALYZE_DEPTH)),
+            'movetime_ms': max(1, min(int(data.get('movetime_ms', 500)), MAX_ANALYZE_MOVETIME_MS)),
+        }
+        if data.get('max_nodes'):
+            budget['max_nodes'] = max(1, min(int(data['max_nodes']), MAX_ANALYZE_NODES))
+    except (ValueError, TypeError, OverflowError):
+        return jsonify({'error': 'Invalid search budget'}), 400
+
+    def generate():
+        lines = analyze(get_search_service(), games, budget)
+        try:
+            for line in lines:
+                yield json.dumps(line) + '\n'
+        finally:
+            # Client ngắt stream: hủy các job phân tích còn chạy
+            lines.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # --- WebSocket cho Multiplayer (Ngẫu nhiên/Tạo phòng) ---
 
 @sock.route('/ws/multiplayer')
 def multiplayer_ws(ws):
-    global waiting_player_ws
-    
     session_id = str(uuid.uuid4())
     ws_sessions[session_id] = ws
     print(f"New connection: {session_id}")
@@ -119,11 +308,11 @@ def multiplayer_ws(ws):
             # --- 1. Tạo phòng ---
             if action == 'create_room':
                 room_code = generate_room_code()
+                while store.get_room(room_code):
+                    room_code = generate_room_code()
                 game_id = str(uuid.uuid4())
-                engine = ChessEngine()
-                
-                games[game_id] = {'engine': engine, 'players': {session_id: 'white'}, 'mode': 'Multiplayer'}
-                rooms[room_code] = game_id
+                engine = store.create_game(game_id, 'Multiplayer', players={session_id: 'white'})['engine']
+                store.set_room(room_code, game_id)
                 
                 ws.send(json.dumps({
                     'status': 'room_created', 
@@ -136,73 +325,122 @@ def multiplayer_ws(ws):
             # --- 2. Tham gia phòng ---
             elif action == 'join_room':
                 room_code = message.get('room_code')
-                game_id = rooms.get(room_code)
+                game_id = store.get_room(room_code)
+                game_data = store.get_game(game_id) if game_id else None
                 
-                if game_id and len(games[game_id]['players']) < 2:
-                    games[game_id]['players'][session_id] = 'black'
+                if game_data and len(game_data['players']) < 2:
+                    game_data['players'][session_id] = 'black'
+                    try:
+                        store.save_game(game_data)
+                    except GameConflict as e:
+                        ws.send(json.dumps({'status': 'error', 'message': str(e)}))
+                        continue
                     
                     # Thông báo cho người chơi 1 (Trắng)
-                    player1_session_id = list(games[game_id]['players'].keys())[0]
-                    ws_sessions[player1_session_id].send(json.dumps({'status': 'player_joined'}))
+                    player1_session_id = list(game_data['players'].keys())[0]
+                    if player1_session_id in ws_sessions:
+                        ws_sessions[player1_session_id].send(json.dumps({'status': 'player_joined'}))
                     
                     # Thông báo cho người chơi 2 (Đen)
                     ws.send(json.dumps({
                         'status': 'room_joined', 
                         'player_color': 'black',
                         'game_id': game_id,
-                        'game_status': games[game_id]['engine'].get_status()
+                        'game_status': game_data['engine'].get_status()
                     }))
                 else:
                     ws.send(json.dumps({'status': 'error', 'message': 'Room not found or full'}))
 
             # --- 3. Ghép ngẫu nhiên ---
             elif action == 'match_random':
-                if waiting_player_ws and waiting_player_ws != ws:
-                    # Ghép đôi
-                    player1_session_id = [sid for sid, w in ws_sessions.items() if w == waiting_player_ws][0]
-                    player2_session_id = session_id
-                    
+                # Nhóm ghép tùy chọn: {"level": ...} hoặc {"rating": ...}, kèm {"time_control": ...}
+                try:
+                    pool = {'level': message.get('level'), 'rating': message.get('rating'),
+                            'time_control': message.get('time_control')}
+                    matchmaker.pool_key(**pool)
+                except (TypeError, ValueError):
+                    ws.send(json.dumps({'status': 'error', 'message': 'Invalid rating'}))
+                    continue
+
+                while True:
+                    opponent = matchmaker.enqueue(session_id, ws, **pool)
+                    if opponent is None:
+                        ws.send(json.dumps({'status': 'waiting', 'message': 'Waiting for another player...'}))
+                        break
+
+                    # Ghép đôi: người chờ trước cầm Trắng
                     game_id = str(uuid.uuid4())
-                    engine = ChessEngine()
-                    games[game_id] = {'engine': engine, 'players': {player1_session_id: 'white', player2_session_id: 'black'}, 'mode': 'Multiplayer'}
+                    players = {opponent.player_id: 'white', session_id: 'black'}
+                    engine = store.create_game(game_id, 'Multiplayer', players=players)['engine']
+                    status = engine.get_status()
                     
-                    # Báo cho P1 (Trắng)
-                    waiting_player_ws.send(json.dumps({
-                        'status': 'matched', 
-                        'player_color': 'white',
-                        'game_id': game_id,
-                        'game_status': engine.get_status()
-                    }))
+                    # Báo cho P1 (Trắng); nếu socket của P1 vừa đóng thì bỏ ván và ghép lại
+                    try:
+                        opponent.connection.send(json.dumps({
+                            'status': 'matched', 
+                            'player_color': 'white',
+                            'game_id': game_id,
+                            'game_status': status
+                        }))
+                    except Exception:
+                        store.delete_game(game_id)
+                        continue
                     
                     # Báo cho P2 (Đen)
                     ws.send(json.dumps({
                         'status': 'matched', 
                         'player_color': 'black',
                         'game_id': game_id,
-                        'game_status': engine.get_status()
+                        'game_status': status
                     }))
-                    waiting_player_ws = None # Reset người chờ
-                else:
-                    waiting_player_ws = ws
-                    ws.send(json.dumps({'status': 'waiting', 'message': 'Waiting for another player...'}))
+                    break
+
+            elif action == 'cancel_match':
+                matchmaker.cancel(session_id)
+                ws.send(json.dumps({'status': 'match_cancelled'}))
 
             # --- 4. Thực hiện nước đi (Áp dụng chung) ---
             elif action == 'move':
                 uci_move = message.get('uci')
-                game_data = games.get(game_id)
+                game_data = store.get_game(game_id)
                 
-                if game_data and game_data['mode'] == 'Multiplayer':
+                if game_data and game_data['mode'] == 'Multiplayer' and session_id in game_data['players']:
                     engine = game_data['engine']
                     player_color = game_data['players'][session_id]
                     
-                    # Kiểm tra lượt đi
-                    if engine.board.turn == (chess.WHITE if player_color == 'white' else chess.BLACK): # type: ignore
+                    # Kiểm tra lượt đi; ván đã kết thúc (kể cả khi đang xem lại) không nhận nước mới
+                    if (engine.board.turn == (chess.WHITE if player_color == 'white' else chess.BLACK)
+                            and not engine.game_finished()):
                         if engine.make_move(uci_move):
-                            # Gửi trạng thái game mới đến tất cả người chơi trong phòng
-                            new_status = engine.get_status()
-                            for sid, color in game_data['players'].items():
+                            try:
+                                store.save_game(game_data)
+                            except GameConflict as e:
+                                ws.send(json.dumps({'status': 'error', 'message': str(e)}))
+                                continue
+                            # Gửi trạng thái mới (bản rút gọn) đến tất cả người chơi trong phòng, chỉ serialize một lần
+                            payload = json.dumps({'status': 'update', 'game_status': engine.get_status(delta=True)})
+                            for sid in game_data['players']:
                                 if sid in ws_sessions:
-                                    ws_sessions[sid].send(json.dumps({'status': 'update', 'game_status': new_status}))
+                                    ws_sessions[sid].send(payload)
+
+            # --- 5. Quay lại / đi lại / xem lại ván (đồng bộ cho cả phòng) ---
+            elif action in ('undo', 'redo', 'seek'):
+                game_data = store.get_game(game_id)
+
+                if game_data and game_data['mode'] == 'Multiplayer' and session_id in game_data['players']:
+                    engine = game_data['engine']
+                    player_color = game_data['players'][session_id]
+                    try:
+                        engine.navigate(action, chess.WHITE if player_color == 'white' else chess.BLACK,
+                                        message.get('ply'))
+                        store.save_game(game_data)
+                    except (ValueError, GameConflict) as e:
+                        ws.send(json.dumps({'status': 'error', 'message': str(e)}))
+                        continue
+                    payload = json.dumps({'status': 'history', 'game_status': engine.get_status()})
+                    for sid in game_data['players']:
+                        if sid in ws_sessions:
+                            ws_sessions[sid].send(payload)
                             
     except Exception as e:
         print(f"WebSocket Error for {session_id}: {e}")
@@ -210,7 +448,7 @@ def multiplayer_ws(ws):
         # Xử lý khi người chơi ngắt kết nối
         print(f"Connection closed: {session_id}")
         del ws_sessions[session_id]
-        # Xử lý dọn dẹp game, phòng chờ, v.v.
+        matchmaker.cancel(session_id)
 
 if __name__ == '__main__':
     # Chạy trên cổng 5000
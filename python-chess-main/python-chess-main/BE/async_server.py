@@ -0,0 +1,262 @@
+# backend/async_server.py
+
+"""Máy chủ WebSocket multiplayer chạy trên asyncio (thay cho /ws/multiplayer của flask_sock).
+
+Mỗi kết nối chỉ tốn một coroutine đọc và một coroutine ghi, nên một tiến trình giữ được
+hàng chục nghìn kết nối rảnh. Giao thức giống /ws/multiplayer:
+    {"action": "create_room"} | {"action": "join_room", "room_code": ...}
+    {"action": "match_random", "level"/"rating"/"time_control": ...} | {"action": "cancel_match"}
+    {"action": "move", "game_id": ..., "uci": ...}
+    {"action": "undo" | "redo", "game_id": ...} | {"action": "seek", "game_id": ..., "ply": ...}
+
+Chạy: python async_server.py --host 0.0.0.0 --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import string
+import uuid
+
+import chess # type: ignore
+from websockets.asyncio.server import serve # type: ignore
+from websockets.exceptions import ConnectionClosed # type: ignore
+
+from chess_engine import ChessEngine
+from matchmaking import Matchmaker
+
+# Số message tối đa chờ gửi cho một kết nối; client đọc quá chậm sẽ bị ngắt
+SEND_QUEUE_SIZE = 64
+
+
+def generate_room_code():
+    """Tạo mã phòng ngẫu nhiên 6 chữ số (1-9)."""
+    return ''.join(random.choices(string.digits.replace('0', ''), k=6))
+
+
+class Connection:
+    """Một kết nối WebSocket với hàng đợi gửi riêng (giới hạn kích thước để tạo back-pressure)."""
+
+    __slots__ = ('ws', 'session_id', 'room', 'color', 'queue', 'writer')
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.session_id = str(uuid.uuid4())
+        self.room = None
+        self.color = None
+        self.queue = asyncio.Queue(SEND_QUEUE_SIZE)
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def send(self, payload):
+        """Xếp message (đã serialize) vào hàng đợi, không chờ mạng."""
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Client không theo kịp: ngắt kết nối thay vì giữ bộ nhớ vô hạn
+            self.writer.cancel()
+            asyncio.ensure_future(self.ws.close(code=1008, reason='send queue overflow'))
+
+    def send_json(self, message):
+        self.send(json.dumps(message))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await self.ws.send(payload)
+        except ConnectionClosed:
+            pass
+
+    def close(self):
+        self.writer.cancel()
+
+
+class Room:
+    """Phòng chơi: giữ engine của ván và tập kết nối nhận broadcast."""
+
+    __slots__ = ('code', 'game_id', 'engine', 'players', 'connections')
+
+    def __init__(self, code=None):
+        self.code = code
+        self.game_id = str(uuid.uuid4())
+        # Ván giữa người với người không cần bảng chuyển vị
+        self.engine = ChessEngine(hash_mb=0)
+        self.players = {}  # {color: Connection}
+        self.connections = set()
+
+    def add(self, conn, color):
+        self.players[color] = conn
+        self.connections.add(conn)
+        conn.room = self
+        conn.color = color
+
+    def remove(self, conn):
+        self.connections.discard(conn)
+        if self.players.get(conn.color) is conn:
+            del self.players[conn.color]
+
+    def broadcast(self, message):
+        """Serialize một lần rồi xếp vào hàng đợi của từng kết nối; các writer gửi song song."""
+        payload = json.dumps(message)
+        for conn in self.connections:
+            conn.send(payload)
+
+
+class MultiplayerServer:
+    def __init__(self):
+        self.rooms = {}        # {room_code: Room}
+        self.games = {}        # {game_id: Room}
+        self.connections = {}  # {session_id: Connection}
+        self.matchmaker = Matchmaker()
+
+    async def handler(self, ws):
+        conn = Connection(ws)
+        self.connections[conn.session_id] = conn
+        try:
+            async for data in ws:
+                try:
+                    message = json.loads(data)
+                except ValueError:
+                    conn.send_json({'status': 'error', 'message': 'Invalid JSON'})
+                    continue
+                self.dispatch(conn, message)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.disconnect(conn)
+
+    def dispatch(self, conn, message):
+        action = message.get('action')
+        if action == 'create_room':
+            self.create_room(conn)
+        elif action == 'join_room':
+            self.join_room(conn, message.get('room_code'))
+        elif action == 'match_random':
+            self.match_random(conn, message.get('level'), message.get('rating'), message.get('time_control'))
+        elif action == 'cancel_match':
+            self.matchmaker.cancel(conn.session_id)
+            conn.send_json({'status': 'match_cancelled'})
+        elif action == 'move':
+            self.move(conn, message.get('game_id'), message.get('uci'))
+        elif action in ('undo', 'redo', 'seek'):
+            self.navigate(conn, message.get('game_id'), action, message.get('ply'))
+        else:
+            conn.send_json({'status': 'error', 'message': 'Invalid action'})
+
+    def create_room(self, conn):
+        code = generate_room_code()
+        while code in self.rooms:
+            code = generate_room_code()
+        room = Room(code)
+        room.add(conn, 'white')
+        self.rooms[code] = room
+        self.games[room.game_id] = room
+        conn.send_json({
+            'status': 'room_created',
+            'room_code': code,
+            'player_color': 'white',
+            'game_id': room.game_id,
+            'game_status': room.engine.get_status()
+        })
+
+    def join_room(self, conn, code):
+        room = self.rooms.get(code)
+        if room is None or len(room.players) >= 2:
+            conn.send_json({'status': 'error', 'message': 'Room not found or full'})
+            return
+        color = 'black' if 'white' in room.players else 'white'
+        room.add(conn, color)
+        room.players['white' if color == 'black' else 'black'].send_json({'status': 'player_joined'})
+        conn.send_json({
+            'status': 'room_joined',
+            'player_color': color,
+            'game_id': room.game_id,
+            'game_status': room.engine.get_status()
+        })
+
+    def match_random(self, conn, level=None, rating=None, time_control=None):
+        try:
+            opponent = self.matchmaker.enqueue(conn.session_id, conn, level, rating, time_control)
+        except (TypeError, ValueError):
+            conn.send_json({'status': 'error', 'message': 'Invalid rating'})
+            return
+        if opponent is None:
+            conn.send_json({'status': 'waiting', 'message': 'Waiting for another player...'})
+            return
+        waiting = opponent.connection
+        room = Room()
+        room.add(waiting, 'white')
+        room.add(conn, 'black')
+        self.games[room.game_id] = room
+        status = room.engine.get_status()
+        for player, color in ((waiting, 'white'), (conn, 'black')):
+            player.send_json({
+                'status': 'matched',
+                'player_color': color,
+                'game_id': room.game_id,
+                'game_status': status
+            })
+
+    def move(self, conn, game_id, uci):
+        room = self.games.get(game_id)
+        if room is None or conn.room is not room:
+            conn.send_json({'status': 'error', 'message': 'Game not found'})
+            return
+        engine = room.engine
+        if engine.board.turn != (chess.WHITE if conn.color == 'white' else chess.BLACK):
+            conn.send_json({'status': 'error', 'message': 'Not your turn'})
+            return
+        if engine.game_finished():
+            conn.send_json({'status': 'error', 'message': 'Game is over'})
+            return
+        try:
+            moved = engine.make_move(uci)
+        except (ValueError, TypeError):
+            moved = False
+        if not moved:
+            conn.send_json({'status': 'error', 'message': 'Illegal move'})
+            return
+        room.broadcast({'status': 'update', 'game_status': engine.get_status(delta=True)})
+
+    def navigate(self, conn, game_id, action, ply=None):
+        """Quay lại/đi lại/xem lại ván; cả phòng nhận trạng thái mới (xem ChessEngine.navigate)."""
+        room = self.games.get(game_id)
+        if room is None or conn.room is not room:
+            conn.send_json({'status': 'error', 'message': 'Game not found'})
+            return
+        try:
+            room.engine.navigate(action, chess.WHITE if conn.color == 'white' else chess.BLACK, ply)
+        except ValueError as e:
+            conn.send_json({'status': 'error', 'message': str(e)})
+            return
+        room.broadcast({'status': 'history', 'game_status': room.engine.get_status()})
+
+    def disconnect(self, conn):
+        self.connections.pop(conn.session_id, None)
+        self.matchmaker.cancel(conn.session_id)
+        room = conn.room
+        if room is not None:
+            room.remove(conn)
+            room.broadcast({'status': 'player_left', 'player_color': conn.color})
+            if not room.connections:
+                self.games.pop(room.game_id, None)
+                if room.code is not None:
+                    self.rooms.pop(room.code, None)
+        conn.close()
+
+
+async def main(host, port):
+    server = MultiplayerServer()
+    # Tắt ping mặc định để hàng chục nghìn kết nối rảnh không tạo tải định kỳ
+    async with serve(server.handler, host, port, ping_interval=None, max_queue=SEND_QUEUE_SIZE):
+        print(f"Multiplayer server listening on ws://{host}:{port}")
+        await asyncio.get_running_loop().create_future()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Asyncio multiplayer WebSocket server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
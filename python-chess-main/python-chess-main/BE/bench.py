@@ -0,0 +1,272 @@
+# backend/bench.py
+
+"""Đo tốc độ và chất lượng của ChessEngine để so sánh trước/sau mỗi thay đổi.
+
+    python bench.py search [--levels ...] [--output run.json] [--baseline base.json]
+        Tìm kiếm trên bộ thế cờ chọn sẵn ở độ sâu của từng cấp độ (depth_map), ghi node,
+        thời gian, NPS và nước đi; so với baseline theo ngưỡng cho phép (trả mã lỗi 1 nếu tụt).
+        --timed dùng get_ai_move (ngân sách thời gian của cấp độ) thay vì độ sâu cố định.
+    python bench.py perft [--depth 4] [--generators python-chess position]
+        Đếm perft để đo tốc độ sinh nước đi, kiểm tra số node với giá trị đã biết và so
+        Position (thế cờ bitboard của vòng tìm kiếm) với python-chess.
+    python bench.py epd wac.epd [--movetime 1000]
+        Giải bộ bài tập EPD (bm/am), báo cáo tỉ lệ giải được trong ngân sách thời gian.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import chess # type: ignore
+
+from chess_engine import ChessEngine, SEARCH_FEATURES
+from position import Position
+
+# Bộ thế cờ chuẩn: (tên, FEN)
+BENCH_POSITIONS = [
+    # Khai cuộc
+    ('startpos', chess.STARTING_FEN),
+    ('italian', 'r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3'),
+    ('sicilian', 'rnbqkbnr/pp2pppp/3p4/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 3'),
+    ('qgd', 'rnbqkb1r/ppp2ppp/4pn2/3p4/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4'),
+    # Trung cuộc nhiều chiến thuật
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+    ('dragon', 'r1bq1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/R3KB1R w KQ - 3 9'),
+    ('greek-gift', 'r1bq1rk1/pppn1ppp/4p3/3pP3/1b1P4/2NB1N2/PPP2PPP/R2QK2R w KQ - 3 8'),
+    ('back-rank', '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1'),
+    # Tàn cuộc
+    ('rook-endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+    ('pawn-race', '8/8/1p6/8/6P1/8/8/k6K w - - 0 1'),
+    ('lucena', '1K1k4/1P6/8/8/8/8/r7/2R5 w - - 0 1'),
+    ('queen-vs-pawn', '8/8/8/8/8/5K2/1pk5/7Q w - - 0 1'),
+]
+
+# Số node perft đã biết, dùng để kiểm tra tính đúng của sinh nước đi
+PERFT_POSITIONS = [
+    ('startpos', chess.STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+]
+# Bộ sinh nước đi được đếm perft: python-chess (chess.Board) và Position của vòng tìm kiếm
+PERFT_GENERATORS = ('python-chess', 'position')
+
+# Ngưỡng mặc định khi so với baseline
+DEFAULT_MAX_NPS_DROP = 0.10
+DEFAULT_MAX_NODES_INCREASE = 0.10
+
+
+def _bench_engine(disabled=()):
+    """Engine không dùng sách khai cuộc và bảng tàn cuộc để kết quả lặp lại được."""
+    engine = ChessEngine()
+    engine.use_book = False
+    engine.tablebase = None
+    for feature in disabled:
+        setattr(engine, 'use_' + feature, False)
+    return engine
+
+
+def run_search(levels=None, positions=BENCH_POSITIONS, timed=False, disabled=()):
+    """Chạy bộ thế cờ ở từng cấp độ. Trả về dict kết quả (ghi được ra JSON)."""
+    levels = levels or list(ChessEngine(hash_mb=0).depth_map)
+    results = {'mode': 'search', 'timed': timed, 'disabled': list(disabled), 'levels': {}}
+    for level in levels:
+        rows = []
+        total_nodes = 0
+        total_time = 0.0
+        for name, fen in positions:
+            engine = _bench_engine(disabled)
+            engine.board.set_fen(fen)
+            start = time.perf_counter()
+            if timed:
+                move = engine.get_ai_move(level)
+            else:
+                move = engine.search(max_depth=engine.depth_map[level])
+                move = move.uci() if move else None
+            elapsed = time.perf_counter() - start
+            stats = engine.stats.to_dict()
+            rows.append({
+                'name': name,
+                'move': move,
+                'depth': stats['depth'],
+                'seldepth': stats['seldepth'],
+                'nodes': engine.nodes,
+                'qnodes': engine.qnodes,
+                'time_ms': round(elapsed * 1000, 2),
+                'nps': int(engine.nodes / elapsed) if elapsed else 0,
+                'first_move_cutoff_rate': stats['first_move_cutoff_rate'],
+            })
+            total_nodes += engine.nodes
+            total_time += elapsed
+        results['levels'][level] = {
+            'positions': rows,
+            'nodes': total_nodes,
+            'time_ms': round(total_time * 1000, 2),
+            'nps': int(total_nodes / total_time) if total_time else 0,
+        }
+    return results
+
+
+def compare(results, baseline, max_nps_drop=DEFAULT_MAX_NPS_DROP, max_nodes_increase=DEFAULT_MAX_NODES_INCREASE):
+    """So kết quả với baseline. Trả về (danh sách lỗi vượt ngưỡng, danh sách ghi chú)."""
+    failures = []
+    notes = []
+    for level, current in results['levels'].items():
+        base = baseline.get('levels', {}).get(level)
+        if base is None:
+            notes.append(f"{level}: no baseline")
+            continue
+        if base['nps'] and current['nps'] < base['nps'] * (1 - max_nps_drop):
+            failures.append(f"{level}: NPS {current['nps']} < baseline {base['nps']} (-{max_nps_drop:.0%} allowed)")
+        if base['nodes'] and current['nodes'] > base['nodes'] * (1 + max_nodes_increase):
+            failures.append(f"{level}: nodes {current['nodes']} > baseline {base['nodes']} "
+                            f"(+{max_nodes_increase:.0%} allowed)")
+        base_moves = {row['name']: row['move'] for row in base['positions']}
+        for row in current['positions']:
+            if row['name'] in base_moves and base_moves[row['name']] != row['move']:
+                notes.append(f"{level}/{row['name']}: move {base_moves[row['name']]} -> {row['move']}")
+    return failures, notes
+
+
+def perft(board, depth):
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def run_perft(depth=4, positions=PERFT_POSITIONS, generators=PERFT_GENERATORS):
+    """Perft với từng bộ sinh nước đi. Position còn được so số node với python-chess."""
+    rows = []
+    for name, fen, expected in positions:
+        known = expected[depth - 1] if depth <= len(expected) else None
+        reference = None
+        for generator in generators:
+            board = chess.Board(fen)
+            start = time.perf_counter()
+            if generator == 'position':
+                nodes = Position.from_board(board).perft(depth)
+            else:
+                nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = nodes
+            rows.append({
+                'name': name,
+                'generator': generator,
+                'depth': depth,
+                'nodes': nodes,
+                'expected': known,
+                'ok': (known is None or nodes == known) and nodes == reference,
+                'time_ms': round(elapsed * 1000, 2),
+                'nps': int(nodes / elapsed) if elapsed else 0,
+            })
+    return {'mode': 'perft', 'positions': rows}
+
+
+def run_epd(path, movetime_ms=1000, max_depth=64):
+    """Giải bộ bài tập EPD: đúng khi nước đi thuộc bm (và không thuộc am)."""
+    rows = []
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            engine = _bench_engine()
+            board = engine.board
+            ops = board.set_epd(line)
+            move = engine.search(max_depth=max_depth, movetime_ms=movetime_ms)
+            solved = move is not None
+            if 'bm' in ops:
+                solved = solved and move in ops['bm']
+            if 'am' in ops:
+                solved = solved and move not in ops['am']
+            rows.append({
+                'id': ops.get('id', str(len(rows) + 1)),
+                'move': board.san(move) if move else None,
+                'best': [board.san(m) for m in ops.get('bm', [])],
+                'solved': solved,
+                'depth': engine.stats.depth,
+                'nodes': engine.nodes,
+            })
+    solved = sum(row['solved'] for row in rows)
+    return {
+        'mode': 'epd',
+        'movetime_ms': movetime_ms,
+        'positions': rows,
+        'solved': solved,
+        'total': len(rows),
+        'solve_rate': solved / len(rows) if rows else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ChessEngine benchmarks')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output', help='write JSON results to this file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = commands.add_parser('search', parents=[common],
+                                        help='fixed-depth search over the bench positions')
+    search_parser.add_argument('--levels', nargs='*', help='levels from depth_map (default: all)')
+    search_parser.add_argument('--timed', action='store_true', help='use get_ai_move with the level time budget')
+    search_parser.add_argument('--disable', nargs='*', default=[], choices=SEARCH_FEATURES,
+                               help='search techniques to switch off')
+    search_parser.add_argument('--baseline', help='JSON from a previous run to compare against')
+    search_parser.add_argument('--max-nps-drop', type=float, default=DEFAULT_MAX_NPS_DROP)
+    search_parser.add_argument('--max-nodes-increase', type=float, default=DEFAULT_MAX_NODES_INCREASE)
+
+    perft_parser = commands.add_parser('perft', parents=[common], help='move generation throughput')
+    perft_parser.add_argument('--depth', type=int, default=4)
+    perft_parser.add_argument('--generators', nargs='*', default=list(PERFT_GENERATORS), choices=PERFT_GENERATORS)
+
+    epd_parser = commands.add_parser('epd', parents=[common], help='solve rate on an EPD test suite (bm/am)')
+    epd_parser.add_argument('path')
+    epd_parser.add_argument('--movetime', type=int, default=1000, help='ms per position')
+
+    args = parser.parse_args(argv)
+    exit_code = 0
+
+    if args.command == 'search':
+        results = run_search(args.levels, timed=args.timed, disabled=args.disable)
+        for level, summary in results['levels'].items():
+            print(f"{level:12} nodes {summary['nodes']:>10}  time {summary['time_ms']:>10.1f} ms  "
+                  f"nps {summary['nps']:>8}")
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as handle:
+                failures, notes = compare(results, json.load(handle),
+                                          args.max_nps_drop, args.max_nodes_increase)
+            for note in notes:
+                print(f"note: {note}")
+            for failure in failures:
+                print(f"REGRESSION: {failure}")
+            results['regressions'] = failures
+            exit_code = 1 if failures else 0
+    elif args.command == 'perft':
+        results = run_perft(args.depth, generators=args.generators)
+        for row in results['positions']:
+            status = 'ok' if row['ok'] else f"MISMATCH (expected {row['expected']})"
+            print(f"{row['name']:12} {row['generator']:12} depth {row['depth']}  nodes {row['nodes']:>10}  "
+                  f"nps {row['nps']:>8}  {status}")
+        exit_code = 0 if all(row['ok'] for row in results['positions']) else 1
+    else:
+        results = run_epd(args.path, args.movetime)
+        for row in results['positions']:
+            print(f"{row['id']:12} {'ok ' if row['solved'] else 'FAIL'} played {row['move']}, best {row['best']}")
+        print(f"Solved {results['solved']}/{results['total']} ({results['solve_rate']:.0%})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2, ensure_ascii=False)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,137 +1,1063 @@
 # backend/chess_engine.py
 
 import chess # type: ignore
+import math
 import random
+import time
+from operator import itemgetter
+from transposition import TranspositionTable, position_key, EXACT, LOWER, UPPER
+from evaluation import MG_VALUES
+from position import Position, MAX_MOVES, WHITE, PAWN, KING, FLAG_EN_PASSANT, move_uci
+from opening_book import load_book
+from tablebase import load_tablebase
+from search_stats import SearchStats
+from history import GameHistory
+
+# Độ sâu tối đa cho tìm kiếm sâu dần khi chỉ giới hạn bằng thời gian
+MAX_DEPTH = 64
+# Số node giữa hai lần kiểm tra đồng hồ (kiểm tra mỗi node sẽ rất chậm)
+CHECK_EVERY_NODES = 1024
+
+# Giá trị quân dùng cho sắp xếp nước đi MVV-LVA (chỉ số theo chess.PAWN..chess.KING)
+ORDER_VALUES = [0, 1, 3, 3, 5, 9, 20]
+# Thứ tự ưu tiên: nước đi từ bảng chuyển vị > bắt quân/phong hậu (MVV-LVA) > killer > history.
+# Bắt quân được sinh và sắp xếp riêng nên chỉ cần bù để điểm MVV-LVA luôn dương.
+CAPTURE_ORDER = 32
+KILLER_SCORES = (800000, 700000)
+HISTORY_MAX = 500000
+# Điểm sắp xếp nén cùng nước đi: điểm << 18 | nước đi
+MOVE_MASK = (1 << 18) - 1
+
+# Giá trị quân (đơn vị tốt) cho cán cân vật chất hiển thị cho người chơi
+MATERIAL_VALUES = [0, 1, 3, 3, 5, 9, 0]
+
+# Điểm chiếu hết (trừ đi số ply để ưu tiên chiếu hết nhanh hơn)
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000
+# Điểm thắng theo bảng tàn cuộc: lớn hơn mọi điểm đánh giá nhưng nhỏ hơn điểm chiếu hết
+TB_WIN_SCORE = 50000
+# Biên an toàn cho delta pruning trong quiescence (centipawn)
+DELTA_MARGIN = 200
+# Số node quiescence tối đa cho mỗi node lá của cây chính
+QSEARCH_NODE_LIMIT = 2000
+# Cận của cửa sổ alpha-beta: số nguyên để cửa sổ rỗng (alpha, alpha + 1) luôn hợp lệ
+INFINITY = MATE_SCORE + 1
+
+# Null-move pruning: độ sâu tối thiểu và mức giảm độ sâu (thêm 1 khi depth >= 6)
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+# Late-move reductions: chỉ giảm ở độ sâu >= LMR_MIN_DEPTH, từ nước thứ LMR_MIN_INDEX trở đi
+LMR_MIN_DEPTH = 3
+LMR_MIN_INDEX = 3
+# Mức giảm theo độ sâu và thứ tự nước: ln(depth) * ln(index) / 1.75
+LMR_REDUCTIONS = [[0] * 64] + [
+    [0] + [int(0.5 + math.log(depth) * math.log(index) / 1.75) for index in range(1, 64)]
+    for depth in range(1, MAX_DEPTH + 1)
+]
+# Futility pruning (cả dạng reverse) ở các node cách lá tối đa FUTILITY_MAX_DEPTH ply, biên theo mỗi ply
+FUTILITY_MAX_DEPTH = 3
+FUTILITY_MARGIN = 120
+# Số nước tối đa được xét ở node cách lá 1..3 ply trước khi bỏ các nước yên tĩnh còn lại
+LATE_MOVE_COUNTS = (0, 5, 8, 13)
+# Aspiration windows: cửa sổ ban đầu quanh điểm vòng trước (centipawn), nới x4 mỗi lần trượt
+ASPIRATION_MIN_DEPTH = 3
+ASPIRATION_WINDOW = 50
+ASPIRATION_MAX_WINDOW = 1000
+# Gợi ý: số nước đưa ra, ngân sách khi phải tự tìm, độ sâu tối thiểu của mục bảng chuyển vị dùng được
+HINT_LINES = 3
+HINT_MOVETIME_MS = 300
+HINT_MAX_DEPTH = 4
+HINT_TT_MIN_DEPTH = 3
+
+
+# Các kỹ thuật tìm kiếm chọn lọc, bật/tắt bằng thuộc tính use_<tên> của ChessEngine
+SEARCH_FEATURES = ('pvs', 'null_move', 'lmr', 'futility', 'check_extensions', 'aspiration')
+
+_sort_key = itemgetter(0)
+
+
+class _SearchTimeout(Exception):
+    """Dùng nội bộ để thoát khỏi cây tìm kiếm khi hết thời gian."""
+
 
 class ChessEngine:
-    def __init__(self):
+    def __init__(self, hash_mb=16, threads=1, book_path=None, tablebase_path=None):
         self.board = chess.Board()
+        # Bảng chuyển vị dùng chung cho mọi lần tìm kiếm trong ván này
+        self.hash_mb = hash_mb
+        self.tt = TranspositionTable(hash_mb)
+        # Số tiến trình tìm kiếm song song ở gốc; 1 = tìm tuần tự, kết quả tất định
+        self.threads = max(1, threads)
+        self._parallel = None
+        # Sách khai cuộc Polyglot (mặc định lấy từ CHESS_BOOK_PATH); None nếu không có
+        self.book = load_book(book_path)
+        self.use_book = True
+        # Bảng tàn cuộc Syzygy (mặc định lấy từ CHESS_SYZYGY_PATH); None nếu không có
+        self.tablebase = load_tablebase(tablebase_path)
         self.depth_map = {
             "Nhập Môn": 1,
             "Thành Thạo": 2,
-            "Cao Thủ": 3,
-            "Kiện Tướng": 4 
+            "Cao Thủ": 4,
+            "Kiện Tướng": 6 
         }
+        # Ngân sách thời gian (ms) cho mỗi nước đi của AI theo cấp độ
+        self.time_map = {
+            "Nhập Môn": 200,
+            "Thành Thạo": 500,
+            "Cao Thủ": 1000,
+            "Kiện Tướng": 2000
+        }
+        self.nodes = 0
+        self.qnodes = 0
+        self._qsearch_budget = 0
+        # Killer moves theo ply (2 ô mỗi ply) và bảng history [màu][from * 64 + to].
+        # Chỉ cấp phát khi tìm kiếm lần đầu để các ván không dùng AI (multiplayer) nhẹ hơn.
+        self.killers = None
+        self.history = None
+        # Bộ đệm sinh nước đi theo ply (xem _move_buffer)
+        self._move_buffers = []
+        self._root_ply = 0
+        self._root_depth = 0
+        self._deadline = None
+        self._node_limit = None
+        # False trong vòng độ sâu 1 của search(): khi đó stop_callback không được dừng tìm kiếm
+        self._stoppable = True
+        # Hàm không tham số, trả về True khi cần dừng tìm kiếm (ví dụ job bị hủy trong worker)
+        self.stop_callback = None
+        # Hàm nhận dict last_search, gọi sau mỗi vòng lặp sâu dần hoàn thành (ví dụ dòng info của UCI)
+        self.info_callback = None
+        # Các kỹ thuật tìm kiếm chọn lọc, tắt riêng từng cái để đo số node tiết kiệm và sức cờ
+        self.use_pvs = True
+        self.use_null_move = True
+        self.use_lmr = True
+        self.use_futility = True
+        self.use_check_extensions = True
+        self.use_aspiration = True
+        # Thông tin của lần tìm kiếm gần nhất (độ sâu hoàn thành, điểm, biến chính)
+        self.last_search = None
+        # Số liệu chi tiết của lần tìm kiếm gần nhất (node, NPS, seldepth, tỉ lệ cắt, TT...)
+        self.stats = SearchStats()
+        # Bộ nhớ đệm của get_status, bị xóa ở mọi chỗ đổi bàn cờ (make/undo/redo, reset, dựng lại lịch sử)
+        self._status_cache = None
+        # Bộ nhớ đệm của get_hint_moves: (khóa thế cờ, số nước yêu cầu, danh sách gợi ý)
+        self._hint_cache = None
+        # Quân bị bắt của mỗi bên (ký hiệu FEN), cán cân vật chất (Trắng - Đen, đơn vị tốt)
+        # và lịch sử ván (undo/redo/seek, xem lại ván)
+        self.rebuild_captures()
 
     def reset_board(self):
         self.board.reset()
+        self.tt.clear()
+        self._status_cache = None
+        self.rebuild_captures()
 
     def make_move(self, uci_move):
-        """Thực hiện nước đi nếu hợp lệ."""
+        """Thực hiện nước đi nếu hợp lệ. Các nước đã lùi (redo) sau thế cờ hiện tại bị bỏ."""
         move = chess.Move.from_uci(uci_move)
         if move in self.board.legal_moves:
+            history = self._history()
+            self._record_capture(self.board, move)
             self.board.push(move)
+            history.push(move.uci(), self.board)
+            self._status_cache = None
             return True
         return False
 
+    def rebuild_captures(self):
+        """Dựng lại danh sách quân bị bắt và lịch sử ván bằng một lượt duyệt move_stack
+        (dùng khi nạp lại ván cờ)."""
+        self._status_cache = None
+        self.captured = {chess.WHITE: [], chess.BLACK: []}
+        self._capture_stack = []
+        replay = self.board.root()
+        self.game_history = GameHistory(replay)
+        self.material_balance = sum(
+            MATERIAL_VALUES[piece.piece_type] * (1 if piece.color == chess.WHITE else -1)
+            for piece in replay.piece_map().values())
+        for move in self.board.move_stack:
+            self._record_capture(replay, move)
+            replay.push(move)
+            self.game_history.push(move.uci(), replay)
+
+    def _history(self):
+        """Lịch sử ván; dựng lại nếu bàn cờ đã bị thay đổi ngoài make_move/undo_move/redo_move."""
+        history = self.game_history
+        stack = self.board.move_stack
+        if history.ply != len(stack) or (stack and history.moves[history.ply - 1] != stack[-1].uci()):
+            self.rebuild_captures()
+            history = self.game_history
+        return history
+
+    def _record_capture(self, board, move):
+        """Cập nhật O(1) quân bị bắt và cán cân vật chất cho nước đi sắp thực hiện trên board."""
+        if board.is_en_passant(move):
+            captured = chess.Piece(chess.PAWN, not board.turn)
+        else:
+            captured = board.piece_at(move.to_square)
+        sign = 1 if board.turn == chess.WHITE else -1
+        if captured is not None:
+            self.captured[captured.color].append(captured.symbol())
+            self.material_balance += sign * MATERIAL_VALUES[captured.piece_type]
+        if move.promotion:
+            self.material_balance += sign * (MATERIAL_VALUES[move.promotion] - MATERIAL_VALUES[chess.PAWN])
+        self._capture_stack.append((captured, move.promotion, sign))
+
+    def _undo_capture(self):
+        captured, promotion, sign = self._capture_stack.pop()
+        if captured is not None:
+            self.captured[captured.color].pop()
+            self.material_balance -= sign * MATERIAL_VALUES[captured.piece_type]
+        if promotion:
+            self.material_balance -= sign * (MATERIAL_VALUES[promotion] - MATERIAL_VALUES[chess.PAWN])
+
     def is_game_over(self):
         """Kiểm tra trạng thái kết thúc game."""
         return self.board.is_game_over()
 
-    def get_status(self):
-        """Trả về trạng thái hiện tại."""
+    def get_status(self, delta=False, include_legal_moves=True):
+        """Trả về trạng thái hiện tại.
+
+        Trạng thái được tính một lần cho mỗi thế cờ và lưu đệm tới nước đi kế tiếp.
+        delta=True trả về bản rút gọn (nước đi cuối, FEN mới, lượt, kết quả);
+        include_legal_moves=False bỏ danh sách nước đi hợp lệ khỏi bản rút gọn.
+        Không sửa dict trả về vì nó được dùng chung giữa các lần gọi.
+        """
+        status = self._cached_status()
+        if not delta:
+            return status
+        compact = {
+            'last_move': status['last_move'],
+            'fen': status['fen'],
+            'turn': status['turn'],
+            'game_over': status['game_over'],
+            'outcome': status['outcome']
+        }
+        if include_legal_moves:
+            compact['legal_moves'] = status['legal_moves']
+        return compact
+
+    def _cached_status(self):
+        # _history() phát hiện bàn cờ bị đổi ngoài make/undo/redo và dựng lại (xóa luôn bộ nhớ đệm)
+        history = self._history()
+        if self._status_cache is not None:
+            return self._status_cache
+        board = self.board
+
+        outcome = board.outcome()
         status = {
-            'fen': self.board.fen(),
-            'turn': 'white' if self.board.turn == chess.WHITE else 'black',
-            'game_over': self.board.is_game_over(),
-            'outcome': self.board.outcome().result() if self.board.is_game_over() else None,
+            'fen': board.fen(),
+            'turn': 'white' if board.turn == chess.WHITE else 'black',
+            'game_over': outcome is not None,
+            'outcome': outcome.result() if outcome is not None else None,
+            'last_move': board.peek().uci() if board.move_stack else None,
             'captured_white': self._get_captured_pieces(chess.WHITE),
             'captured_black': self._get_captured_pieces(chess.BLACK),
-            'legal_moves': [move.uci() for move in self.board.legal_moves]
+            'material_balance': self.material_balance,
+            'legal_moves': [move.uci() for move in board.legal_moves],
+            'ply': len(board.move_stack),
+            'history_length': len(history)
         }
+        self._status_cache = status
         return status
     
     def _get_captured_pieces(self, color):
-        # Lấy danh sách quân cờ đã bị bắt (Đây là một cách đơn giản, cần logic phức tạp hơn cho hiển thị chính xác)
-        # Trong python-chess, bạn cần theo dõi thủ công hoặc tính toán từ FEN
-        # Để đơn giản, ta chỉ trả về placeholder
-        return ['P', 'N'] if color == chess.WHITE else ['p', 'n'] 
+        # Danh sách quân của bên color đã bị bắt, được cập nhật tăng dần trong make_move/undo_move
+        return list(self.captured[color])
 
     def undo_move(self):
-        """Quay lại nước đi."""
+        """Quay lại nước đi; nước đó vẫn được giữ để đi lại bằng redo_move."""
         if self.board.move_stack:
+            self._history().undo()
             self.board.pop()
+            self._status_cache = None
+            if len(self._capture_stack) > len(self.board.move_stack):
+                self._undo_capture()
+            else:
+                # Bàn cờ đã bị thay đổi ngoài make_move: dựng lại từ move_stack
+                self.rebuild_captures()
             return True
         return False
 
+    def redo_move(self):
+        """Đi lại nước vừa bị quay lại. Trả về False nếu không còn nước để đi lại."""
+        uci = self._history().redo()
+        if uci is None:
+            return False
+        move = chess.Move.from_uci(uci)
+        self._record_capture(self.board, move)
+        self.board.push(move)
+        self._status_cache = None
+        return True
+
+    def seek(self, ply):
+        """Đưa ván về ply (0..độ dài lịch sử), giữ lại các nước phía sau để đi lại.
+
+        Bàn cờ giữ đủ move_stack (cần cho luật lặp lại và các worker tìm kiếm) nên đi bằng
+        undo/redo, mỗi bước O(1). Trả về False nếu ply ngoài phạm vi.
+        """
+        history = self._history()
+        if not isinstance(ply, int) or not 0 <= ply <= len(history):
+            return False
+        while history.ply > ply:
+            self.undo_move()
+        while history.ply < ply:
+            self.redo_move()
+        return True
+
+    def game_finished(self):
+        """Ván đã kết thúc (tính tới cuối lịch sử, kể cả khi đang lùi lại để xem lại ván)."""
+        history = self._history()
+        if history.ply == len(history):
+            return self._cached_status()['game_over']
+        return history.is_finished()
+
+    def get_history(self, ply=None):
+        """Lịch sử ván: thế cờ gốc, mọi nước đi (kể cả phần có thể đi lại) và ply hiện tại.
+
+        Nếu có ply thì kèm thế cờ ở ply đó để xem lại ván mà không đổi bàn cờ hiện tại
+        (dựng từ điểm mốc gần nhất). Ném ValueError nếu ply ngoài phạm vi.
+        """
+        history = self._history()
+        result = history.to_dict()
+        if ply is not None:
+            board = history.board_at(ply)
+            result['position'] = {
+                'ply': ply,
+                'fen': board.fen(),
+                'turn': 'white' if board.turn == chess.WHITE else 'black',
+                'last_move': history.moves[ply - 1] if ply else None,
+            }
+        return result
+
+    def navigate(self, action, color, ply=None):
+        """undo/redo/seek theo yêu cầu của người chơi color trong ván người với người.
+
+        Ván đã kết thúc thì mọi người chơi được xem lại tự do. Ván đang diễn ra chỉ được
+        quay lại nước của chính mình khi đối thủ chưa đi và đi lại nó; seek bị từ chối.
+        Ném ValueError nếu yêu cầu không hợp lệ.
+        """
+        history = self._history()
+        reviewing = self.game_finished()
+        if action == 'undo':
+            if history.ply == 0:
+                raise ValueError('Nothing to undo')
+            if not reviewing and self.board.turn == color:
+                raise ValueError('You can only take back your own last move')
+            self.undo_move()
+        elif action == 'redo':
+            if history.ply >= len(history):
+                raise ValueError('Nothing to redo')
+            if not reviewing and self.board.turn != color:
+                raise ValueError('You can only redo your own move')
+            self.redo_move()
+        elif action == 'seek':
+            if not reviewing:
+                raise ValueError('Seek is only available after the game is over')
+            if not self.seek(ply):
+                raise ValueError('Invalid ply')
+        else:
+            raise ValueError('Invalid action')
+
+    def set_hash(self, hash_mb):
+        """Đổi kích thước bảng chuyển vị (MB); nội dung bảng cũ bị bỏ."""
+        self.hash_mb = max(0, int(hash_mb))
+        self.tt = TranspositionTable(self.hash_mb)
+        self.close()
+
+    def set_threads(self, threads):
+        """Đổi số tiến trình tìm kiếm; các tiến trình phụ cũ bị dừng."""
+        threads = max(1, int(threads))
+        if threads != self.threads:
+            self.close()
+            self.threads = threads
+
+    def close(self):
+        """Dừng các tiến trình tìm kiếm song song (nếu có)."""
+        if self._parallel is not None:
+            self._parallel.shutdown()
+            self._parallel = None
+
     def get_ai_move(self, level):
-        """Tính toán nước đi của AI bằng Minimax."""
+        """Tính toán nước đi của AI bằng Minimax sâu dần trong ngân sách thời gian của cấp độ."""
         depth = self.depth_map.get(level, 3)
-        
-        # Đảm bảo độ sâu không quá lớn nếu không sẽ rất chậm
-        if depth > 4: depth = 4
-        
-        best_move = self._minimax_root(depth, self.board)
+        movetime_ms = self.time_map.get(level, 1000)
+
+        best_move = self.search(max_depth=depth, movetime_ms=movetime_ms)
         return best_move.uci() if best_move else None
 
-    # --- Thuật toán Minimax với Cắt tỉa Alpha-Beta ---
+    def search(self, max_depth=MAX_DEPTH, movetime_ms=None, max_nodes=None, multipv=1):
+        """Tìm kiếm sâu dần (iterative deepening) trên self.board.
 
-    def _evaluate_board(self, board):
-        # Đánh giá đơn giản: giá trị quân cờ
-        value_map = {
-            chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, 
-            chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 200 # King có giá trị cao nhất
-        }
-        score = 0
-        for piece_type, value in value_map.items():
-            score += len(board.pieces(piece_type, chess.WHITE)) * value
-            score -= len(board.pieces(piece_type, chess.BLACK)) * value
-        
-        return score
+        Mỗi vòng lặp tăng độ sâu thêm 1, nước đi của biến chính vòng trước được xét trước.
+        Khi hết movetime_ms (hoặc vượt max_nodes) vòng hiện tại bị hủy và trả về
+        nước đi tốt nhất của vòng đã hoàn thành gần nhất.
+        multipv > 1 tìm thêm các nước tốt nhất kế tiếp trong cùng lần tìm (last_search['lines']).
+        """
+        board = self.board
+        moves = list(board.legal_moves)
+        self.last_search = None
+        if not moves:
+            self.stats.reset()
+            return None
+        multipv = min(max(1, multipv), len(moves))
+
+        start = time.monotonic()
+        deadline = start + movetime_ms / 1000.0 if movetime_ms else None
+        self.nodes = 0
+        self.qnodes = 0
+        self.tt.new_search()
+        self._new_search_heuristics()
+        self.stats.start(self.tt)
+
+        # Còn trong sách khai cuộc thì đi theo sách, không cần tìm kiếm
+        if self.use_book and self.book is not None and multipv == 1:
+            book_move = self.book.choose(board)
+            if book_move is not None:
+                self.last_search = {'depth': 0, 'score': None, 'pv': [book_move], 'nodes': 0, 'time_ms': 0,
+                                    'lines': [{'move': book_move, 'score': None, 'pv': [book_move]}], 'book': True}
+                self.stats.finish(self.nodes, self.qnodes, self.tt)
+                return book_move
+
+        # Tàn cuộc có trong bảng Syzygy: trả lời ngay theo WDL/DTZ (bảng chỉ cho một nước tốt nhất,
+        # multi-PV vẫn tìm kiếm bình thường)
+        if self.tablebase is not None and multipv == 1 and self.tablebase.can_probe(board):
+            result = self.tablebase.best_move(board)
+            if result is not None:
+                tb_move, wdl = result
+                score = self._tablebase_score(wdl, 0)
+                score = score if board.turn == chess.WHITE else -score
+                self.last_search = {'depth': 0, 'score': score, 'pv': [tb_move], 'nodes': 0, 'time_ms': 0,
+                                    'lines': [{'move': tb_move, 'score': score, 'pv': [tb_move]}], 'tablebase': True}
+                self.stats.finish(self.nodes, self.qnodes, self.tt)
+                return tb_move
 
-    def _minimax(self, board, depth, alpha, beta, maximizing_player):
-        if depth == 0 or board.is_game_over():
-            return self._evaluate_board(board)
-
-        if maximizing_player:
-            max_eval = -float('inf')
-            for move in board.legal_moves:
-                board.push(move)
-                eval = self._minimax(board, depth - 1, alpha, beta, False)
-                board.pop()
-                max_eval = max(max_eval, eval)
-                alpha = max(alpha, max_eval)
-                if beta <= alpha:
+        if len(moves) == 1:
+            # Nước đi bắt buộc: không cần tìm kiếm
+            self.last_search = {'depth': 0, 'score': None, 'pv': [moves[0]], 'nodes': 0, 'time_ms': 0,
+                                'lines': [{'move': moves[0], 'score': None, 'pv': [moves[0]]}]}
+            self.stats.finish(self.nodes, self.qnodes, self.tt)
+            return moves[0]
+
+        # Cây tìm kiếm chạy trên Position (bitboard, nước đi nén); chỉ đổi lại chess.Move ở kết quả
+        pos = Position.from_board(board)
+        best_move = pos.from_chess_move(moves[0])
+        previous_score = None
+        # Nước đầu của các biến vòng trước, để multi-PV xét chúng trước
+        line_moves = []
+
+        for depth in range(1, max_depth + 1):
+            if depth > 1 and self.threads > 1 and multipv == 1:
+                # Chia các nước đi ở gốc cho các tiến trình phụ
+                remaining_ms = int((deadline - time.monotonic()) * 1000) if deadline is not None else None
+                if remaining_ms is not None and remaining_ms <= 0:
                     break
-            return max_eval
-        else:
-            min_eval = float('inf')
-            for move in board.legal_moves:
-                board.push(move)
-                eval = self._minimax(board, depth - 1, alpha, beta, True)
-                board.pop()
-                min_eval = min(min_eval, eval)
-                beta = min(beta, min_eval)
-                if beta <= alpha:
+                remaining_nodes = max_nodes - self.nodes if max_nodes is not None else None
+                if remaining_nodes is not None and remaining_nodes <= 0:
                     break
-            return min_eval
+                if self.stop_callback is not None and self.stop_callback():
+                    break
+                ordered = [pos.to_chess_move(move) for move in self._ordered_moves(pos, best_move, 0)
+                           if pos.is_legal(move)]
+                move, score, pv, nodes = self._parallel_search().search_depth(
+                    board, depth, ordered, remaining_ms, remaining_nodes, self.stop_callback)
+                self.nodes += nodes
+                if move is None:
+                    break
+                move = pos.from_chess_move(move)
+                lines = [(score, [pos.from_chess_move(pv_move) for pv_move in pv] or [move])]
+            else:
+                # Vòng độ sâu 1 luôn chạy hết (kể cả khi bị yêu cầu dừng) để nước trả về đã được tìm,
+                # không phải nước đầu tiên theo thứ tự sinh nước đi
+                self._deadline = deadline if depth > 1 else None
+                self._node_limit = max_nodes if depth > 1 else None
+                self._stoppable = depth > 1
+                root_ply = pos.ply
+                try:
+                    move, score = self._aspiration_root(depth, pos, best_move, previous_score)
+                    if move is not None:
+                        lines = [(score, self._extract_pv(pos, depth) or [move])]
+                        if multipv > 1:
+                            lines += self._secondary_lines(depth, pos, move, multipv - 1, line_moves)
+                            # Các biến được tìm với cửa sổ khác nhau nên có thể lệch thứ tự: xếp lại theo điểm
+                            sign = 1 if pos.turn == WHITE else -1
+                            lines.sort(key=lambda line: sign * line[0], reverse=True)
+                            score, move = lines[0][0], lines[0][1][0]
+                except _SearchTimeout:
+                    while pos.ply > root_ply:
+                        pos.unmake()
+                    break
+                finally:
+                    self._deadline = None
+                    self._node_limit = None
+                    self._stoppable = True
+                if move is None:
+                    break
+                pv = [pos.to_chess_move(pv_move) for pv_move in lines[0][1]]
+
+            best_move = move
+            previous_score = score
+            line_moves = [line_pv[0] for _, line_pv in lines]
+            self.stats.end_iteration(depth, self.nodes)
+            elapsed = time.monotonic() - start
+            self.last_search = {
+                'depth': depth,
+                'score': score,
+                'pv': pv,
+                'nodes': self.nodes,
+                'qnodes': self.qnodes,
+                'time_ms': int(elapsed * 1000),
+                'lines': [{'move': pos.to_chess_move(line_pv[0]), 'score': line_score,
+                           'pv': [pos.to_chess_move(pv_move) for pv_move in line_pv]}
+                          for line_score, line_pv in lines],
+            }
+            if self.info_callback is not None:
+                self.info_callback(self.last_search)
+            # Đã thấy chiếu hết trong tầm tìm kiếm: tìm sâu hơn không đổi kết quả
+            if score is not None and abs(score) > MATE_BOUND and depth >= MATE_SCORE - abs(score):
+                break
+            # Vòng sau thường tốn nhiều lần thời gian vòng trước: dừng sớm nếu đã dùng quá nửa ngân sách
+            if deadline is not None and elapsed * 2 > deadline - start:
+                break
+
+        self.stats.finish(self.nodes, self.qnodes, self.tt)
+        return pos.to_chess_move(best_move)
+
+    def _parallel_search(self):
+        if self._parallel is None:
+            from parallel_search import ParallelRootSearch
+            self._parallel = ParallelRootSearch(self.threads, self.hash_mb)
+        return self._parallel
+
+    def _check_limits(self):
+        """Đếm node và ném _SearchTimeout khi vượt thời gian hoặc số node cho phép."""
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY_NODES == 0:
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                raise _SearchTimeout()
+            if self._node_limit is not None and self.nodes >= self._node_limit:
+                raise _SearchTimeout()
+            if self._stoppable and self.stop_callback is not None and self.stop_callback():
+                raise _SearchTimeout()
+
+    def _extract_pv(self, pos, max_length):
+        """Dựng biến chính (nước đi nén) bằng cách đi theo nước tốt nhất lưu trong bảng chuyển vị."""
+        pv = []
+        seen = set()
+        for _ in range(max_length):
+            key = pos.key
+            entry = self.tt.probe(key)
+            if (entry is None or not entry.move or key in seen or not pos.is_pseudo_legal(entry.move)
+                    or not pos.is_legal(entry.move)):
+                break
+            pos.make(entry.move)
+            seen.add(key)
+            pv.append(entry.move)
+        for _ in pv:
+            pos.unmake()
+        return pv
+
+    # --- Sắp xếp nước đi ---
+
+    def _new_search_heuristics(self):
+        """Xóa killer moves và giảm một nửa history trước mỗi lần tìm kiếm mới."""
+        if self.history is None:
+            self.killers = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+            self.history = [[0] * 4096, [0] * 4096]
+            return
+        for slot in self.killers:
+            slot[0] = slot[1] = 0
+        for table in self.history:
+            for i in range(4096):
+                table[i] >>= 1
+
+    def _move_buffer(self, ply):
+        """Bộ đệm sinh nước đi của ply, cấp phát một lần và dùng lại cho mọi node cùng ply."""
+        buffers = self._move_buffers
+        while len(buffers) <= ply:
+            buffers.append([0] * MAX_MOVES)
+        return buffers[ply]
+
+    def _ordered_moves(self, pos, hash_move=0, ply=0):
+        """Danh sách nước giả hợp lệ đã sắp xếp: nước đi từ bảng chuyển vị (biến chính vòng trước),
+        bắt quân theo MVV-LVA, killer moves của ply rồi tới điểm history."""
+        return list(self._staged_moves(pos, hash_move, ply))
 
-    def _minimax_root(self, depth, board):
-        is_white_turn = board.turn == chess.WHITE
+    def _staged_moves(self, pos, hash_move, ply):
+        """Sinh nước đi theo từng giai đoạn: nước từ bảng chuyển vị, bắt quân, rồi các nước yên tĩnh.
+
+        Mỗi giai đoạn chỉ sinh khi giai đoạn trước không gây cắt tỉa. Điểm sắp xếp và nước đi nén
+        chung vào một số nguyên (điểm << 18 | nước đi) để sắp xếp không cần tuple.
+        """
+        if hash_move and pos.is_pseudo_legal(hash_move):
+            yield hash_move
+        else:
+            hash_move = 0
+
+        buffer = self._move_buffer(ply)
+        squares = pos.squares
+        count = pos.generate_captures(buffer)
+        keys = [(CAPTURE_ORDER + 10 * ORDER_VALUES[squares[(move >> 6) & 63] or PAWN]
+                 - ORDER_VALUES[squares[move & 63]] + ORDER_VALUES[(move >> 12) & 7]) << 18 | move
+                for move in buffer[:count]]
+        keys.sort(reverse=True)
+        for key in keys:
+            move = key & MOVE_MASK
+            if move != hash_move:
+                yield move
+
+        killer_1, killer_2 = self.killers[ply] if ply < len(self.killers) else (0, 0)
+        history = self.history[pos.turn]
+        count = pos.generate_quiets(buffer)
+        keys = [(KILLER_SCORES[0] if move == killer_1 else KILLER_SCORES[1] if move == killer_2
+                 else history[move & 4095]) << 18 | move
+                for move in buffer[:count]]
+        keys.sort(reverse=True)
+        for key in keys:
+            move = key & MOVE_MASK
+            if move != hash_move:
+                yield move
+
+    def _record_cutoff(self, pos, move, depth, ply, index=0):
+        """Cập nhật killer moves và history khi một nước đi yên tĩnh gây cắt tỉa beta.
+
+        index là thứ tự của nước đi trong danh sách đã sắp xếp (đếm tỉ lệ cắt ở nước đầu tiên).
+        """
+        stats = self.stats
+        stats.cutoffs += 1
+        if index == 0:
+            stats.first_move_cutoffs += 1
+        if not _is_quiet(pos, move):
+            return
+        if ply >= len(self.killers):
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self.history[pos.turn]
+        index = move & 4095
+        history[index] += depth * depth
+        if history[index] > HISTORY_MAX:
+            # Giữ điểm history luôn thấp hơn killer moves
+            for i in range(4096):
+                history[i] >>= 1
+
+    # --- Tìm kiếm PVS (negamax) với cắt tỉa Alpha-Beta ---
+
+    def _terminal_score(self, pos, ply):
+        """Điểm khi bên đang đi không còn nước hợp lệ: bị chiếu hết hoặc hòa pat (góc nhìn bên đang đi)."""
+        return -(MATE_SCORE - ply) if pos.in_check() else 0
+
+    def _is_draw(self, pos):
+        """Hòa theo luật trong cây tìm kiếm: không đủ quân chiếu hết, luật 50 nước, lặp lại 3 lần."""
+        return (pos.halfmove_clock >= 100
+                or pos.is_repetition(3)
+                or pos.is_insufficient_material())
+
+    def _probe_tablebase(self, pos):
+        """WDL từ bảng tàn cuộc (góc nhìn bên đang đi), None nếu không tra được.
+
+        Chỉ đổi sang chess.Board khi số quân đủ ít để có bảng."""
+        tablebase = self.tablebase
+        if tablebase is None or pos.castling or chess.popcount(pos.occupied) > tablebase.max_pieces:
+            return None
+        return tablebase.probe_wdl(pos.to_board())
+
+    def _tablebase_score(self, wdl, ply):
+        """Đổi kết quả WDL sang điểm theo góc nhìn bên đang đi."""
+        if wdl == 2:
+            return TB_WIN_SCORE - ply
+        if wdl == -2:
+            return -(TB_WIN_SCORE - ply)
+        # Thắng/thua bị luật 50 nước chặn coi như gần hòa
+        return wdl
+
+    def _score_to_tt(self, score, ply):
+        # Điểm chiếu hết lưu trong bảng tính từ node hiện tại, không phụ thuộc khoảng cách tới gốc
+        if score > MATE_BOUND:
+            return score + ply
+        if score < -MATE_BOUND:
+            return score - ply
+        return score
+
+    def _score_from_tt(self, score, ply):
+        if score > MATE_BOUND:
+            return score - ply
+        if score < -MATE_BOUND:
+            return score + ply
+        return score
+
+    def _negamax(self, pos, depth, alpha, beta, allow_null=True):
+        """Tìm kiếm PVS dạng negamax: điểm luôn theo góc nhìn bên đang đi.
+
+        Nước đầu tiên được tìm với cửa sổ đầy đủ, các nước sau với cửa sổ rỗng rồi tìm lại khi
+        vượt alpha (PVS). Kèm null-move pruning, futility pruning, late-move reductions và mở rộng
+        khi bị chiếu; mỗi kỹ thuật bật/tắt bằng các cờ use_* của engine.
+        """
+        self._check_limits()
+        ply = pos.ply - self._root_ply
+        if ply > 0 and self._is_draw(pos):
+            return 0
+
+        in_check = pos.in_check()
+        # Mở rộng khi bị chiếu: không để chân trời cắt ngang một chuỗi chiếu.
+        # Giới hạn theo ply để các chuỗi chiếu liên tục (tàn cuộc Hậu) không làm cây phình vô hạn.
+        if in_check and self.use_check_extensions and ply < 2 * self._root_depth:
+            depth += 1
+        if depth <= 0:
+            # Tại chân trời: chỉ xét tiếp các nước bắt quân/phong cấp để tránh hiệu ứng chân trời
+            self._qsearch_budget = QSEARCH_NODE_LIMIT
+            return self._quiescence(pos, alpha, beta, ply)
+
+        # Tra bảng tàn cuộc khi số quân đủ ít: kết quả chính xác, không cần tìm tiếp
+        if ply > 0 and self.tablebase is not None:
+            wdl = self._probe_tablebase(pos)
+            if wdl is not None:
+                return self._tablebase_score(wdl, ply)
+
+        # Tra bảng chuyển vị: dùng lại kết quả nếu đã tìm với độ sâu đủ lớn
+        key = pos.key
+        entry = self.tt.probe(key)
+        hash_move = entry.move if entry is not None else 0
+        if entry is not None and entry.depth >= depth:
+            tt_score = self._score_from_tt(entry.score, ply)
+            if entry.flag == EXACT:
+                return tt_score
+            if entry.flag == LOWER:
+                alpha = max(alpha, tt_score)
+            elif entry.flag == UPPER:
+                beta = min(beta, tt_score)
+            if beta <= alpha:
+                return tt_score
+
+        pv_node = beta - alpha > 1
+        static_eval = None
+        if not in_check and not pv_node:
+            static_eval = pos.score() if pos.turn == WHITE else -pos.score()
+
+            # Reverse futility: ở gần lá, điểm tĩnh trừ biên an toàn vẫn >= beta thì cắt luôn
+            if (self.use_futility and depth <= FUTILITY_MAX_DEPTH and abs(beta) < MATE_BOUND
+                    and static_eval - FUTILITY_MARGIN * depth >= beta):
+                return static_eval
+
+            # Null-move pruning: nhường lượt mà vẫn >= beta thì gần như chắc chắn cắt được.
+            # Chống zugzwang: không áp dụng khi bị chiếu, khi bên đi chỉ còn vua + tốt, hoặc hai lần liên tiếp.
+            if (self.use_null_move and allow_null and depth >= NULL_MOVE_MIN_DEPTH and static_eval >= beta
+                    and pos.occupied_co[pos.turn] & ~(pos.pieces[PAWN] | pos.pieces[KING])):
+                reduction = NULL_MOVE_REDUCTION + (1 if depth >= 6 else 0)
+                pos.make_null()
+                score = -self._negamax(pos, depth - 1 - reduction, -beta, -beta + 1, False)
+                pos.unmake()
+                if score >= beta:
+                    # Không trả về điểm chiếu hết chưa được chứng minh
+                    return beta if score > MATE_BOUND else score
+
+        # Futility pruning: nước yên tĩnh ở gần lá không thể kéo điểm tĩnh lên tới alpha.
+        # Late-move pruning: ở gần lá chỉ xét một số nước yên tĩnh đầu tiên theo thứ tự.
+        prune_quiet = self.use_futility and static_eval is not None and depth <= FUTILITY_MAX_DEPTH
+        futile = prune_quiet and abs(alpha) < MATE_BOUND and static_eval + FUTILITY_MARGIN * depth <= alpha
+        late_move_count = LATE_MOVE_COUNTS[depth] if prune_quiet else MAX_MOVES
+
+        killers = self.killers[ply] if ply < len(self.killers) else (0, 0)
+        alpha_orig = alpha
+        best_score = -INFINITY
+        best_move = None
+        index = 0
+        for move in self._staged_moves(pos, hash_move, ply):
+            quiet = _is_quiet(pos, move)
+            if index > 0 and quiet and (futile or index >= late_move_count) and not pos.gives_check(move):
+                index += 1
+                continue
+            if not pos.is_legal(move, in_check):
+                continue
+            pos.make(move)
+            gives_check = pos.in_check()
+            if index == 0:
+                score = -self._negamax(pos, depth - 1, -beta, -alpha)
+            else:
+                # Late-move reductions: nước yên tĩnh xếp sau ít khi tốt, tìm nông hơn trước
+                reduction = 0
+                if (self.use_lmr and quiet and depth >= LMR_MIN_DEPTH and index >= LMR_MIN_INDEX
+                        and not in_check and not gives_check and move not in killers):
+                    reduction = LMR_REDUCTIONS[min(depth, MAX_DEPTH)][min(index, 63)]
+                    if pv_node:
+                        reduction -= 1
+                    reduction = max(0, min(reduction, depth - 2))
+                window_alpha = -alpha - 1 if self.use_pvs else -beta
+                score = -self._negamax(pos, depth - 1 - reduction, window_alpha, -alpha)
+                if reduction and score > alpha:
+                    score = -self._negamax(pos, depth - 1, window_alpha, -alpha)
+                if self.use_pvs and alpha < score < beta:
+                    score = -self._negamax(pos, depth - 1, -beta, -alpha)
+            pos.unmake()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self._record_cutoff(pos, move, depth, ply, index)
+                        break
+            index += 1
+
+        if best_move is None:
+            # Không còn nước hợp lệ (nước đầu tiên không bao giờ bị cắt tỉa): chiếu hết hoặc hòa pat
+            return self._terminal_score(pos, ply)
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, self._score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiescence(self, pos, alpha, beta, ply):
+        """Tìm kiếm tĩnh (negamax): chỉ xét bắt quân và phong cấp cho tới khi thế cờ yên tĩnh.
+
+        Dùng stand-pat (bên đi có thể không bắt), delta pruning (nước bắt không thể kéo điểm
+        lên tới alpha) và SEE để bỏ các nước bắt lỗ. Khi đang bị chiếu thì xét mọi nước thoát.
+        Số node bị giới hạn bởi _qsearch_budget.
+        """
+        self._check_limits()
+        self.qnodes += 1
+        self._qsearch_budget -= 1
+        if ply > self.stats.seldepth:
+            self.stats.seldepth = ply
+
+        in_check = pos.in_check()
+        if in_check:
+            moves = self._staged_moves(pos, 0, ply)
+            stand_pat = None
+            best_score = -INFINITY
+        else:
+            stand_pat = pos.score() if pos.turn == WHITE else -pos.score()
+            if self._qsearch_budget <= 0 or stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            best_score = stand_pat
+            moves = self._tactical_moves(pos, ply)
+
+        squares = pos.squares
+        for move in moves:
+            if not in_check:
+                # Delta pruning: kể cả ăn quân không mất gì cũng không đủ kéo điểm về cửa sổ
+                promotion = (move >> 12) & 7
+                gain = DELTA_MARGIN + MG_VALUES[squares[(move >> 6) & 63] or PAWN]
+                if promotion:
+                    gain += MG_VALUES[promotion] - MG_VALUES[PAWN]
+                if stand_pat + gain <= alpha:
+                    continue
+                # Bỏ qua nước bắt quân lỗ theo SEE
+                if pos.see(move) < 0:
+                    continue
+
+            if not pos.is_legal(move, in_check):
+                continue
+            pos.make(move)
+            score = -self._quiescence(pos, -beta, -alpha, ply + 1)
+            pos.unmake()
+
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_score == -INFINITY:
+            # Bị chiếu và không có nước thoát: chiếu hết
+            return self._terminal_score(pos, ply)
+        return best_score
+
+    def _tactical_moves(self, pos, ply):
+        """Các nước bắt quân và phong hậu (MVV-LVA), dùng trong quiescence."""
+        buffer = self._move_buffer(ply)
+        squares = pos.squares
+        count = pos.generate_captures(buffer)
+        keys = [(CAPTURE_ORDER + 10 * ORDER_VALUES[squares[(move >> 6) & 63] or PAWN]
+                 - ORDER_VALUES[squares[move & 63]] + ORDER_VALUES[(move >> 12) & 7]) << 18 | move
+                for move in buffer[:count]]
+        keys.sort(reverse=True)
+        return [key & MOVE_MASK for key in keys]
+
+    def _search_root(self, depth, pos, pv_move=0, root_moves=None, alpha=-INFINITY, beta=INFINITY):
+        """Tìm nước đi tốt nhất ở độ sâu cố định. Trả về (nước đi nén, điểm số theo góc nhìn Trắng).
+
+        alpha/beta (góc nhìn bên đang đi) là cửa sổ aspiration; nếu điểm rơi ra ngoài cửa sổ
+        thì đó chỉ là cận và vòng lặp sâu dần sẽ tìm lại với cửa sổ rộng hơn.
+        root_moves giới hạn tập nước đi ở gốc (dùng khi chia gốc cho nhiều tiến trình).
+        """
+        self._root_ply = pos.ply
+        self._root_depth = depth
+        if self.history is None:
+            self._new_search_heuristics()
+        sign = 1 if pos.turn == WHITE else -1
+
+        alpha_orig = alpha
         best_move = None
-        
-        # Nếu là lượt Trắng, tìm kiếm điểm số cao nhất (Max); nếu là Đen, tìm kiếm điểm số thấp nhất (Min)
-        best_score = -float('inf') if is_white_turn else float('inf')
-        
-        for move in board.legal_moves:
-            board.push(move)
-            
-            # Đánh giá nước đi. Cấp độ tìm kiếm ngược lại với người chơi hiện tại
-            score = self._minimax(board, depth - 1, -float('inf'), float('inf'), not is_white_turn)
-            board.pop()
-            
-            if is_white_turn:
-                if score > best_score:
-                    best_score = score
-                    best_move = move
-            else: # Lượt Đen
-                if score < best_score:
-                    best_score = score
-                    best_move = move
-                    
-        return best_move
+        best_score = -INFINITY
+        moves = self._ordered_moves(pos, pv_move, 0)
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+        in_check = pos.in_check()
+        index = 0
+        for move in moves:
+            if not pos.is_legal(move, in_check):
+                continue
+            pos.make(move)
+            if index == 0 or not self.use_pvs:
+                score = -self._negamax(pos, depth - 1, -beta, -alpha)
+            else:
+                score = -self._negamax(pos, depth - 1, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self._negamax(pos, depth - 1, -beta, -alpha)
+            pos.unmake()
+            index += 1
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        # Chỉ lưu kết quả gốc khi đã xét toàn bộ nước đi
+        if best_move is not None and root_moves is None:
+            if best_score <= alpha_orig:
+                flag = UPPER
+            elif best_score >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+            self.tt.store(pos.key, depth, best_score, flag, best_move)
+        return best_move, sign * best_score
+
+    def _aspiration_root(self, depth, pos, pv_move, previous_score):
+        """Tìm ở gốc với cửa sổ hẹp quanh điểm của vòng trước; nới rộng và tìm lại khi trượt."""
+        if (not self.use_aspiration or previous_score is None or depth < ASPIRATION_MIN_DEPTH
+                or abs(previous_score) >= TB_WIN_SCORE - MAX_DEPTH):
+            return self._search_root(depth, pos, pv_move)
+        sign = 1 if pos.turn == WHITE else -1
+        center = sign * previous_score
+        delta = ASPIRATION_WINDOW
+        alpha, beta = center - delta, center + delta
+        while True:
+            move, score = self._search_root(depth, pos, pv_move, alpha=alpha, beta=beta)
+            score_stm = sign * score
+            delta *= 4
+            if score_stm <= alpha:
+                alpha = center - delta if delta < ASPIRATION_MAX_WINDOW else -INFINITY
+            elif score_stm >= beta:
+                beta = center + delta if delta < ASPIRATION_MAX_WINDOW else INFINITY
+                pv_move = move
+            else:
+                return move, score
+
+    def _secondary_lines(self, depth, pos, best_move, count, previous):
+        """Multi-PV: tìm lại gốc bỏ các nước đã chọn, mỗi lần lấy thêm nước tốt nhất kế tiếp.
+
+        Trả về tối đa count cặp (điểm góc nhìn Trắng, biến chính nén). previous là nước đầu các biến
+        của vòng trước, được xét trước để cắt tỉa sớm.
+        """
+        in_check = pos.in_check()
+        remaining = [move for move in self._ordered_moves(pos) if move != best_move and pos.is_legal(move, in_check)]
+        lines = []
+        while len(lines) < count and remaining:
+            pv_move = next((move for move in previous if move in remaining), 0)
+            move, score = self._search_root(depth, pos, pv_move, root_moves=remaining)
+            if move is None:
+                break
+            remaining.remove(move)
+            pos.make(move)
+            lines.append((score, [move] + self._extract_pv(pos, depth - 1)))
+            pos.unmake()
+        return lines
 
 # --- Gợi ý nước đi (cho tính năng Gợi ý) ---
-    def get_hint_move(self, depth=2):
-        """Cung cấp nước đi tốt nhất với độ sâu nông."""
-        return self._minimax_root(depth, self.board).uci()
\ No newline at end of file
+    def get_hint_moves(self, count=HINT_LINES, movetime_ms=HINT_MOVETIME_MS, max_depth=HINT_MAX_DEPTH):
+        """Tối đa count nước gợi ý cho bên đang đi, tốt nhất trước; [] nếu không còn nước đi.
+
+        Mỗi gợi ý: {'move', 'score' (góc nhìn Trắng), 'pv' (UCI), 'depth', 'bound', 'source'}.
+        Lấy theo thứ tự rẻ nhất: bộ đệm gợi ý của thế cờ, bảng chuyển vị (đã được làm nóng bởi
+        lần tìm của AI hoặc pondering), cuối cùng mới tìm multi-PV trong ngân sách movetime_ms/max_depth.
+        """
+        board = self.board
+        legal_count = board.legal_moves.count()
+        if not legal_count:
+            return []
+        count = min(max(1, count), legal_count)
+        key = position_key(board)
+        if self._hint_cache is not None and self._hint_cache[0] == key and self._hint_cache[1] >= count:
+            return [dict(line, source='cache') for line in self._hint_cache[2][:count]]
+
+        pos = Position.from_board(board)
+        lines = self._hints_from_tt(pos, count)
+        if lines is None:
+            self.search(max_depth=max_depth, movetime_ms=movetime_ms, multipv=count)
+            info = self.last_search or {}
+            lines = [{'move': line['move'].uci(), 'score': line['score'],
+                      'pv': [move.uci() for move in line['pv']], 'depth': info.get('depth', 0),
+                      'bound': 'exact', 'source': 'search'}
+                     for line in info.get('lines', [])]
+        self._hint_cache = (key, count, lines)
+        return lines
+
+    def get_hint_move(self, **limits):
+        """Nước gợi ý tốt nhất (UCI), None nếu không còn nước đi."""
+        lines = self.get_hint_moves(1, **limits)
+        return lines[0]['move'] if lines else None
+
+    def _hints_from_tt(self, pos, count):
+        """Gợi ý lấy thẳng từ bảng chuyển vị, không tìm kiếm; None nếu bảng chưa đủ thông tin.
+
+        Gợi ý chỉ lấy từ mục EXACT đủ độ sâu (gốc và các thế cờ con). Mục của thế cờ con phần lớn là
+        cận từ các lần tìm cửa sổ hẹp, không dùng để xếp hạng được: mọi nước còn lại phải có mục đủ sâu
+        và là EXACT hoặc cận chứng minh được nước đó không tốt hơn gợi ý cuối; nếu không phải tìm multi-PV thật.
+        """
+        entry = self.tt.probe(pos.key)
+        if (entry is None or not entry.move or entry.flag != EXACT or entry.depth < HINT_TT_MIN_DEPTH
+                or not pos.is_pseudo_legal(entry.move) or not pos.is_legal(entry.move)):
+            return None
+        candidates = [(entry.score, entry.move, entry.depth)]
+        if count > 1:
+            in_check = pos.in_check()
+            children = []
+            # Điểm tối đa (góc nhìn bên đang đi) của các nước chỉ có cận
+            bound = None
+            for move in self._ordered_moves(pos):
+                if move == entry.move or not pos.is_legal(move, in_check):
+                    continue
+                pos.make(move)
+                child = self.tt.probe(pos.key)
+                pos.unmake()
+                if child is None or child.depth < HINT_TT_MIN_DEPTH - 1:
+                    return None
+                score = -self._score_from_tt(child.score, 1)
+                if child.flag == EXACT:
+                    children.append((score, move, child.depth + 1))
+                elif child.flag == LOWER:
+                    # Thế cờ con vượt beta: điểm thật của nước này không quá score
+                    bound = score if bound is None else max(bound, score)
+                else:
+                    return None
+            children.sort(key=_sort_key, reverse=True)
+            candidates += children[:count - 1]
+            if len(candidates) < count or (bound is not None and bound > candidates[-1][0]):
+                return None
+
+        sign = 1 if pos.turn == WHITE else -1
+        lines = []
+        for score, move, depth in candidates:
+            pos.make(move)
+            pv = [move] + self._extract_pv(pos, depth - 1)
+            pos.unmake()
+            lines.append({'move': move_uci(move), 'score': sign * score, 'pv': [move_uci(m) for m in pv],
+                          'depth': depth, 'bound': 'exact', 'source': 'tt'})
+        return lines
+
+
+def _is_quiet(pos, move):
+    """Nước đi không bắt quân (kể cả qua đường) và không phong cấp."""
+    return not (pos.squares[(move >> 6) & 63] or (move >> 12) & 7 or move >> 15 == FLAG_EN_PASSANT)
@@ -0,0 +1,363 @@
+# backend/game_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import chess # type: ignore
+
+from chess_engine import ChessEngine
+
+# Ván không có hoạt động sau IDLE_TTL giây, hoặc đã kết thúc sau FINISHED_TTL giây, sẽ bị xóa
+IDLE_TTL = 6 * 3600
+FINISHED_TTL = 10 * 60
+# Khoảng thời gian tối thiểu giữa hai lần dọn dẹp tự động
+SWEEP_INTERVAL = 60
+# Số ván giữ sẵn engine trong bộ nhớ của mỗi tiến trình (backend SQLite)
+ENGINE_CACHE_SIZE = 1000
+
+
+class GameConflict(Exception):
+    """Ván đã được tiến trình khác lưu trước (HTTP 409); thay đổi chưa được lưu, cần đọc lại ván."""
+
+
+def build_engine(start_fen, moves, ply=None):
+    """Dựng lại engine từ thế cờ gốc, danh sách nước đi UCI của lịch sử và ply hiện tại.
+
+    Các nước sau ply (đã lùi) vẫn được giữ để đi lại. Engine trong tiến trình web không tự
+    tìm kiếm (việc đó do search_service làm) nên không cần bảng chuyển vị.
+    """
+    engine = ChessEngine(hash_mb=0)
+    if start_fen != chess.STARTING_FEN:
+        engine.board.set_fen(start_fen)
+    for uci in moves:
+        engine.board.push_uci(uci)
+    engine.rebuild_captures()
+    if ply is not None and ply < len(moves):
+        engine.seek(ply)
+    return engine
+
+
+def _history_of(engine):
+    """(mọi nước đi của lịch sử kể cả phần đã lùi, ply hiện tại)."""
+    history = engine.get_history()
+    return history['moves'], history['ply']
+
+
+def _new_record(game_id, mode, level, players, start_fen, moves=(), finished=False, updated_at=None, ply=None):
+    """Bản ghi ván cờ: dict giống như trước đây app.py lưu trong `games`, thêm vài khóa nội bộ."""
+    return {
+        'game_id': game_id,
+        'mode': mode,
+        'level': level,
+        'players': dict(players or {}),
+        'start_fen': start_fen,
+        'engine': build_engine(start_fen, moves, ply),
+        'finished': finished,
+        'updated_at': updated_at or time.time(),
+        '_saved_moves': list(moves),
+        '_version': 0,
+    }
+
+
+class GameStore(ABC):
+    """Giao diện lưu trữ trạng thái ván cờ và mã phòng.
+
+    Lưu ván theo thế cờ gốc + danh sách nước đi UCI; engine được dựng lại khi ván được truy cập
+    lần đầu trong tiến trình. Sau mỗi lần thay đổi engine/players phải gọi save_game(record).
+    """
+
+    @abstractmethod
+    def create_game(self, game_id, mode, level=None, players=None, start_fen=chess.STARTING_FEN):
+        """Tạo và lưu ván mới, trả về record (dict có 'engine', 'mode', 'level', 'players')."""
+
+    @abstractmethod
+    def get_game(self, game_id):
+        """Record của ván, None nếu không có hoặc đã hết hạn."""
+
+    @abstractmethod
+    def save_game(self, record):
+        """Lưu thay đổi của record. Backend dùng chung giữa các tiến trình ném GameConflict nếu ván
+        đã được lưu ở nơi khác kể từ lần đọc record."""
+
+    @abstractmethod
+    def delete_game(self, game_id):
+        """Xóa ván cùng các mã phòng của nó (không báo lỗi nếu không có)."""
+
+    @abstractmethod
+    def set_room(self, room_code, game_id):
+        """Gắn mã phòng với ván."""
+
+    @abstractmethod
+    def get_room(self, room_code):
+        """game_id của phòng, None nếu không có."""
+
+    @abstractmethod
+    def delete_room(self, room_code):
+        """Xóa mã phòng (không báo lỗi nếu không có)."""
+
+    @abstractmethod
+    def sweep(self, now=None):
+        """Xóa các ván rảnh quá lâu hoặc đã kết thúc. Trả về số ván bị xóa."""
+
+    def close(self):
+        pass
+
+    def _is_expired(self, finished, updated_at, now):
+        ttl = self.finished_ttl if finished else self.idle_ttl
+        return now - updated_at > ttl
+
+
+class MemoryGameStore(GameStore):
+    """Lưu trong bộ nhớ của tiến trình, tự xóa ván rảnh/đã kết thúc theo TTL."""
+
+    def __init__(self, idle_ttl=IDLE_TTL, finished_ttl=FINISHED_TTL):
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self._games = {}  # {game_id: record}
+        self._rooms = {}  # {room_code: game_id}
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+
+    def create_game(self, game_id, mode, level=None, players=None, start_fen=chess.STARTING_FEN):
+        record = _new_record(game_id, mode, level, players, start_fen)
+        with self._lock:
+            self._games[game_id] = record
+        self._maybe_sweep()
+        return record
+
+    def get_game(self, game_id):
+        self._maybe_sweep()
+        with self._lock:
+            record = self._games.get(game_id)
+        if record is not None:
+            record['updated_at'] = time.time()
+        return record
+
+    def save_game(self, record):
+        record['finished'] = record['engine'].get_status()['game_over']
+        record['updated_at'] = time.time()
+        record['_saved_moves'] = _history_of(record['engine'])[0]
+
+    def delete_game(self, game_id):
+        with self._lock:
+            self._games.pop(game_id, None)
+            for code in [code for code, gid in self._rooms.items() if gid == game_id]:
+                del self._rooms[code]
+
+    def set_room(self, room_code, game_id):
+        with self._lock:
+            self._rooms[room_code] = game_id
+
+    def get_room(self, room_code):
+        with self._lock:
+            return self._rooms.get(room_code)
+
+    def delete_room(self, room_code):
+        with self._lock:
+            self._rooms.pop(room_code, None)
+
+    def _maybe_sweep(self):
+        if time.time() - self._last_sweep >= SWEEP_INTERVAL:
+            self.sweep()
+
+    def sweep(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._last_sweep = now
+            expired = [game_id for game_id, record in self._games.items()
+                       if self._is_expired(record['finished'], record['updated_at'], now)]
+            for game_id in expired:
+                del self._games[game_id]
+            if expired:
+                expired_set = set(expired)
+                for code in [code for code, gid in self._rooms.items() if gid in expired_set]:
+                    del self._rooms[code]
+        return len(expired)
+
+
+class SQLiteGameStore(GameStore):
+    """Lưu bền trong SQLite: bảng games (thông tin ván, ply hiện tại) và moves (lịch sử nước đi,
+    kể cả phần đã lùi để đi lại).
+
+    Nhiều worker có thể dùng chung một file: mỗi lần lưu tăng cột version, worker khác thấy
+    version đổi sẽ dựng lại engine từ nhật ký nước đi. Lưu chỉ thành công nếu version chưa đổi
+    kể từ lần đọc (khóa lạc quan); nếu không ném GameConflict.
+    """
+
+    def __init__(self, path, idle_ttl=IDLE_TTL, finished_ttl=FINISHED_TTL, cache_size=ENGINE_CACHE_SIZE):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # {game_id: record}, LRU
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS games (
+                game_id TEXT PRIMARY KEY,
+                mode TEXT NOT NULL,
+                level TEXT,
+                players TEXT NOT NULL,
+                start_fen TEXT NOT NULL,
+                finished INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                ply INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS moves (
+                game_id TEXT NOT NULL,
+                ply INTEGER NOT NULL,
+                uci TEXT NOT NULL,
+                PRIMARY KEY (game_id, ply)
+            );
+            CREATE TABLE IF NOT EXISTS rooms (
+                room_code TEXT PRIMARY KEY,
+                game_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS games_updated_at ON games (updated_at);
+        ''')
+        # File tạo trước khi có cột ply: ply NULL nghĩa là đang ở cuối lịch sử
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(games)')}
+        if 'ply' not in columns:
+            self._db.execute('ALTER TABLE games ADD COLUMN ply INTEGER')
+
+    def _remember(self, record):
+        self._cache[record['game_id']] = record
+        self._cache.move_to_end(record['game_id'])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def create_game(self, game_id, mode, level=None, players=None, start_fen=chess.STARTING_FEN):
+        record = _new_record(game_id, mode, level, players, start_fen)
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO games (game_id, mode, level, players, start_fen, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (game_id, mode, level, json.dumps(record['players']), start_fen, record['updated_at']))
+            self._remember(record)
+        self._maybe_sweep()
+        return record
+
+    def get_game(self, game_id):
+        self._maybe_sweep()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT mode, level, players, start_fen, finished, updated_at, version, ply FROM games '
+                'WHERE game_id = ?', (game_id,)).fetchone()
+            if row is None:
+                self._cache.pop(game_id, None)
+                return None
+            mode, level, players, start_fen, finished, updated_at, version, ply = row
+            record = self._cache.get(game_id)
+            if record is not None and record['_version'] == version:
+                self._cache.move_to_end(game_id)
+                return record
+
+            # Lần đầu truy cập trong tiến trình này, hoặc worker khác đã cập nhật: dựng lại từ nhật ký
+            moves = [uci for (uci,) in self._db.execute(
+                'SELECT uci FROM moves WHERE game_id = ? ORDER BY ply', (game_id,))]
+            record = _new_record(game_id, mode, level, json.loads(players), start_fen, moves,
+                                 bool(finished), updated_at, ply)
+            record['_version'] = version
+            self._remember(record)
+            return record
+
+    def save_game(self, record):
+        moves, ply = _history_of(record['engine'])
+        saved = record['_saved_moves']
+        common = 0
+        while common < len(saved) and common < len(moves) and saved[common] == moves[common]:
+            common += 1
+        record['finished'] = record['engine'].get_status()['game_over']
+        record['updated_at'] = time.time()
+
+        with self._lock:
+            # IMMEDIATE: giữ khóa ghi từ đầu để kiểm tra version và ghi nước đi trong cùng giao dịch
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                updated = self._db.execute(
+                    'UPDATE games SET players = ?, finished = ?, updated_at = ?, ply = ?, version = version + 1 '
+                    'WHERE game_id = ? AND version = ?',
+                    (json.dumps(record['players']), int(record['finished']), record['updated_at'], ply,
+                     record['game_id'], record['_version'])).rowcount
+                if not updated:
+                    raise GameConflict(f"Game {record['game_id']} was modified by another worker")
+                if common < len(saved):
+                    self._db.execute('DELETE FROM moves WHERE game_id = ? AND ply >= ?', (record['game_id'], common))
+                self._db.executemany('INSERT INTO moves (game_id, ply, uci) VALUES (?, ?, ?)',
+                                     [(record['game_id'], index, moves[index]) for index in range(common, len(moves))])
+                self._db.execute('COMMIT')
+            except Exception as e:
+                self._db.execute('ROLLBACK')
+                if isinstance(e, GameConflict):
+                    # Bản trong bộ nhớ đã lệch với kho: lần get_game sau dựng lại từ nhật ký
+                    self._cache.pop(record['game_id'], None)
+                raise
+            record['_saved_moves'] = moves
+            record['_version'] += 1
+
+    def delete_game(self, game_id):
+        with self._lock:
+            self._delete_games([game_id])
+
+    def _delete_games(self, game_ids):
+        rows = [(game_id,) for game_id in game_ids]
+        self._db.executemany('DELETE FROM moves WHERE game_id = ?', rows)
+        self._db.executemany('DELETE FROM rooms WHERE game_id = ?', rows)
+        self._db.executemany('DELETE FROM games WHERE game_id = ?', rows)
+        for game_id in game_ids:
+            self._cache.pop(game_id, None)
+
+    def set_room(self, room_code, game_id):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO rooms (room_code, game_id) VALUES (?, ?)', (room_code, game_id))
+
+    def get_room(self, room_code):
+        with self._lock:
+            row = self._db.execute('SELECT game_id FROM rooms WHERE room_code = ?', (room_code,)).fetchone()
+        return row[0] if row else None
+
+    def delete_room(self, room_code):
+        with self._lock:
+            self._db.execute('DELETE FROM rooms WHERE room_code = ?', (room_code,))
+
+    def _maybe_sweep(self):
+        if time.time() - self._last_sweep >= SWEEP_INTERVAL:
+            self.sweep()
+
+    def sweep(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._last_sweep = now
+            expired = [game_id for (game_id,) in self._db.execute(
+                'SELECT game_id FROM games WHERE (finished = 1 AND updated_at < ?) OR updated_at < ?',
+                (now - self.finished_ttl, now - self.idle_ttl))]
+            if expired:
+                self._db.execute('BEGIN')
+                self._delete_games(expired)
+                self._db.execute('COMMIT')
+        return len(expired)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_store(url=None):
+    """Tạo kho lưu trữ theo URL (mặc định lấy từ CHESS_GAME_STORE).
+
+    "memory" (mặc định) hoặc "sqlite:///đường/dẫn/games.db".
+    """
+    url = url or os.environ.get('CHESS_GAME_STORE', 'memory')
+    if url == 'memory':
+        return MemoryGameStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteGameStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unknown game store: {url}")
@@ -0,0 +1,142 @@
+# backend/history.py
+
+"""Lịch sử ván cờ: danh sách nước đi UCI (kể cả phần đã lùi, để đi lại) và các điểm mốc thế cờ nén.
+
+Điểm mốc cho phép dựng thế cờ ở ply bất kỳ (xem lại ván) bằng tối đa `interval` nước đi lại
+thay vì đi lại từ đầu ván, và bộ nhớ của mỗi ván bị giới hạn bởi MAX_CHECKPOINTS.
+"""
+
+import chess # type: ignore
+
+# Khoảng cách (ply) ban đầu giữa hai điểm mốc; nhân đôi mỗi khi số điểm mốc vượt MAX_CHECKPOINTS
+CHECKPOINT_INTERVAL = 16
+MAX_CHECKPOINTS = 32
+# Kích thước một thế cờ nén (byte)
+PACKED_SIZE = 38
+
+# Quyền nhập thành theo thứ tự bit trong byte cờ hiệu (bit 0 là lượt đi)
+_CASTLING_SQUARES = (chess.H1, chess.A1, chess.H8, chess.A8)
+
+
+def pack_board(board):
+    """Nén thế cờ thành PACKED_SIZE byte.
+
+    32 byte quân cờ (4 bit mỗi ô: 0 trống, 1-6 quân Trắng, 7-12 quân Đen), 1 byte lượt đi và
+    quyền nhập thành, 1 byte cột bắt tốt qua đường (0 = không có), 2 byte đếm nửa nước, 2 byte số nước.
+    """
+    data = bytearray(PACKED_SIZE)
+    for square, piece in board.piece_map().items():
+        code = piece.piece_type if piece.color == chess.WHITE else piece.piece_type + 6
+        data[square >> 1] |= code << ((square & 1) << 2)
+    flags = 1 if board.turn == chess.WHITE else 0
+    for bit, square in enumerate(_CASTLING_SQUARES, 1):
+        if board.castling_rights & chess.BB_SQUARES[square]:
+            flags |= 1 << bit
+    data[32] = flags
+    data[33] = chess.square_file(board.ep_square) + 1 if board.ep_square is not None else 0
+    data[34:36] = min(board.halfmove_clock, 0xFFFF).to_bytes(2, 'little')
+    data[36:38] = min(board.fullmove_number, 0xFFFF).to_bytes(2, 'little')
+    return bytes(data)
+
+
+def unpack_board(data):
+    """Dựng lại chess.Board (không có move_stack) từ kết quả của pack_board."""
+    board = chess.Board(None)
+    for square in range(64):
+        code = (data[square >> 1] >> ((square & 1) << 2)) & 15
+        if code:
+            board.set_piece_at(square, chess.Piece((code - 1) % 6 + 1, code <= 6))
+    flags = data[32]
+    board.turn = bool(flags & 1)
+    for bit, square in enumerate(_CASTLING_SQUARES, 1):
+        if flags & (1 << bit):
+            board.castling_rights |= chess.BB_SQUARES[square]
+    if data[33]:
+        board.ep_square = chess.square(data[33] - 1, 5 if board.turn == chess.WHITE else 2)
+    board.halfmove_clock = int.from_bytes(data[34:36], 'little')
+    board.fullmove_number = int.from_bytes(data[36:38], 'little')
+    return board
+
+
+class GameHistory:
+    """Nước đi UCI của ván, con trỏ ply hiện tại và các điểm mốc nén.
+
+    Các nước sau con trỏ là phần đã lùi, đi lại được bằng redo; đi một nước mới sẽ bỏ phần này.
+    Điểm mốc thứ i là thế cờ ở ply i * interval. Khi số điểm mốc vượt MAX_CHECKPOINTS,
+    interval được nhân đôi và một nửa số điểm mốc bị bỏ.
+    """
+
+    __slots__ = ('start_fen', 'moves', 'ply', 'interval', '_checkpoints', '_finished')
+
+    def __init__(self, root):
+        """root: thế cờ gốc của ván (chưa có nước đi nào)."""
+        self.start_fen = root.fen()
+        self.moves = []
+        self.ply = 0
+        self.interval = CHECKPOINT_INTERVAL
+        self._checkpoints = [pack_board(root)]
+        # Cuối lịch sử có phải ván đã kết thúc không (None = chưa tính)
+        self._finished = None
+
+    def __len__(self):
+        return len(self.moves)
+
+    def push(self, uci, board):
+        """Ghi nước đi vừa thực hiện ở con trỏ; board là thế cờ sau nước đi."""
+        if self.ply < len(self.moves):
+            del self.moves[self.ply:]
+            del self._checkpoints[self.ply // self.interval + 1:]
+        self.moves.append(uci)
+        self.ply += 1
+        self._finished = None
+        if self.ply % self.interval == 0 and len(self._checkpoints) == self.ply // self.interval:
+            self._checkpoints.append(pack_board(board))
+            if len(self._checkpoints) > MAX_CHECKPOINTS:
+                self.interval *= 2
+                self._checkpoints = self._checkpoints[::2]
+
+    def undo(self):
+        """Lùi con trỏ một ply. Trả về nước đi bị lùi, None nếu đang ở đầu ván."""
+        if self.ply == 0:
+            return None
+        self.ply -= 1
+        return self.moves[self.ply]
+
+    def redo(self):
+        """Tiến con trỏ một ply. Trả về nước đi được đi lại, None nếu đang ở cuối lịch sử."""
+        if self.ply >= len(self.moves):
+            return None
+        self.ply += 1
+        return self.moves[self.ply - 1]
+
+    def board_at(self, ply):
+        """Thế cờ ở ply (0..len) dựng từ điểm mốc gần nhất.
+
+        move_stack luôn phủ mọi nước từ lần bắt quân/đi tốt cuối cùng (halfmove_clock), nên luật
+        lặp lại thế cờ (is_repetition, is_fivefold_repetition, can_claim_threefold_repetition) vẫn
+        đúng dù không đi lại từ đầu ván. Ném ValueError nếu ply ngoài phạm vi.
+        """
+        if not 0 <= ply <= len(self.moves):
+            raise ValueError(f"Ply out of range: {ply}")
+        index = min(ply // self.interval, len(self._checkpoints) - 1)
+        board = self._replay(index, ply)
+        # Các thế cờ có thể lặp lại bắt đầu từ nước không thể đảo ngược cuối cùng
+        start = max(0, ply - board.halfmove_clock)
+        if start < index * self.interval:
+            board = self._replay(start // self.interval, ply)
+        return board
+
+    def _replay(self, index, ply):
+        board = unpack_board(self._checkpoints[index])
+        for uci in self.moves[index * self.interval:ply]:
+            board.push(chess.Move.from_uci(uci))
+        return board
+
+    def is_finished(self):
+        """Thế cờ ở cuối lịch sử (kể cả phần đã lùi) có phải ván đã kết thúc."""
+        if self._finished is None:
+            self._finished = self.board_at(len(self.moves)).is_game_over()
+        return self._finished
+
+    def to_dict(self):
+        return {'start_fen': self.start_fen, 'moves': list(self.moves), 'ply': self.ply}
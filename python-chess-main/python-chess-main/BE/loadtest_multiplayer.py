@@ -0,0 +1,109 @@
+# backend/loadtest_multiplayer.py
+
+"""Đo tải cục bộ cho máy chủ multiplayer asyncio (async_server.py).
+
+Mở --pairs cặp người chơi, mỗi cặp tạo/vào phòng rồi đi --moves nước ngẫu nhiên hợp lệ;
+có thể mở thêm --idle kết nối rảnh. Báo cáo số nước/giây và độ trễ broadcast
+(từ lúc gửi nước đi tới lúc đối thủ nhận được update).
+
+Chạy: python loadtest_multiplayer.py --uri ws://localhost:8765 --pairs 200 --moves 40 --idle 5000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from websockets.asyncio.client import connect # type: ignore
+
+
+async def _receive(ws, expected):
+    """Đọc tới khi nhận được message có status mong muốn."""
+    while True:
+        message = json.loads(await ws.recv())
+        if message.get('status') == expected:
+            return message
+
+
+async def play_pair(uri, moves, latencies, rng):
+    async with connect(uri) as white, connect(uri) as black:
+        await white.send(json.dumps({'action': 'create_room'}))
+        created = await _receive(white, 'room_created')
+        await black.send(json.dumps({'action': 'join_room', 'room_code': created['room_code']}))
+        await _receive(black, 'room_joined')
+        await _receive(white, 'player_joined')
+
+        game_id = created['game_id']
+        status = created['game_status']
+        played = 0
+        for _ in range(moves):
+            if status['game_over'] or not status['legal_moves']:
+                break
+            mover, other = (white, black) if status['turn'] == 'white' else (black, white)
+            uci = rng.choice(status['legal_moves'])
+            start = time.perf_counter()
+            await mover.send(json.dumps({'action': 'move', 'game_id': game_id, 'uci': uci}))
+            update = await _receive(other, 'update')
+            latencies.append(time.perf_counter() - start)
+            await _receive(mover, 'update')
+            status = update['game_status']
+            played += 1
+        return played
+
+
+async def hold_idle(uri, count, ready, stop):
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(await connect(uri))
+        ready.set()
+        await stop.wait()
+    finally:
+        await asyncio.gather(*(ws.close() for ws in connections), return_exceptions=True)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(uri, pairs, moves, idle, seed):
+    rng = random.Random(seed)
+    ready = asyncio.Event()
+    stop = asyncio.Event()
+    idle_task = None
+    if idle:
+        idle_task = asyncio.create_task(hold_idle(uri, idle, ready, stop))
+        await ready.wait()
+        print(f"Opened {idle} idle connections")
+
+    latencies = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(play_pair(uri, moves, latencies, random.Random(rng.random()))
+                                     for _ in range(pairs)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    if idle_task is not None:
+        await idle_task
+
+    total = sum(results)
+    print(f"Pairs: {pairs}, moves: {total}, elapsed: {elapsed:.2f}s")
+    print(f"Throughput: {total / elapsed:.1f} moves/s")
+    print("Broadcast latency (ms): p50 {:.2f}, p95 {:.2f}, p99 {:.2f}, max {:.2f}".format(
+        _percentile(latencies, 0.50) * 1000, _percentile(latencies, 0.95) * 1000,
+        _percentile(latencies, 0.99) * 1000, max(latencies, default=0.0) * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test for the asyncio multiplayer server')
+    parser.add_argument('--uri', default='ws://localhost:8765')
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--moves', type=int, default=40)
+    parser.add_argument('--idle', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.uri, args.pairs, args.moves, args.idle, args.seed))
@@ -0,0 +1,279 @@
+# backend/match.py
+
+"""Đấu tự động giữa hai cấu hình ChessEngine để đo chênh lệch Elo trước/sau một thay đổi.
+
+Mỗi khai cuộc được đấu hai ván đổi màu cho công bằng; các ván chạy song song trên nhiều tiến trình.
+Cấu hình là danh sách key=value cách nhau bởi dấu phẩy:
+    name      tên hiển thị
+    level     lấy độ sâu và thời gian từ depth_map/time_map của cấp độ (ví dụ level=Cao Thủ)
+    depth     độ sâu tối đa, movetime  ms mỗi nước, nodes  giới hạn node mỗi nước
+    hash      MB bảng chuyển vị, book  1 để dùng sách khai cuộc (mặc định tắt)
+    disable   các kỹ thuật tìm kiếm cần tắt, nối bằng '+' (ví dụ disable=lmr+null_move)
+
+Chạy: python match.py --games 40 --concurrency 2 \\
+          --engine1 "name=new,depth=5,movetime=300" --engine2 "name=nolmr,depth=5,movetime=300,disable=lmr"
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess # type: ignore
+
+from chess_engine import ChessEngine, MAX_DEPTH, SEARCH_FEATURES
+
+# Khai cuộc mặc định (nước đi SAN); mỗi khai cuộc đấu hai ván đổi màu
+OPENINGS = [
+    'e4 e5 Nf3 Nc6 Bb5 a6',
+    'e4 e5 Nf3 Nc6 Bc4 Bc5',
+    'e4 c5 Nf3 d6 d4 cxd4',
+    'e4 e6 d4 d5 Nc3 Nf6',
+    'e4 c6 d4 d5 e5 Bf5',
+    'd4 d5 c4 e6 Nc3 Nf6',
+    'd4 Nf6 c4 g6 Nc3 Bg7',
+    'd4 Nf6 c4 e6 Nf3 b6',
+    'c4 e5 Nc3 Nf6 g3 d5',
+    'Nf3 d5 g3 Nf6 Bg2 c6',
+]
+# Ván quá số ply này được xử hòa
+MAX_PLIES = 300
+CONFIG_KEYS = ('name', 'level', 'depth', 'movetime', 'nodes', 'hash', 'book', 'disable')
+
+
+def parse_config(text, default_name):
+    """Đọc cấu hình 'key=value,key=value' thành dict; ném ValueError nếu sai."""
+    config = {'name': default_name}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        key, sep, value = item.partition('=')
+        key = key.strip()
+        if not sep or key not in CONFIG_KEYS:
+            raise ValueError(f"Invalid engine option: {item}")
+        value = value.strip()
+        if key in ('depth', 'movetime', 'nodes', 'hash'):
+            config[key] = int(value)
+        elif key == 'book':
+            config[key] = value.lower() in ('1', 'true', 'yes')
+        elif key == 'disable':
+            features = [feature for feature in value.split('+') if feature]
+            unknown = set(features) - set(SEARCH_FEATURES)
+            if unknown:
+                raise ValueError(f"Unknown search features: {', '.join(sorted(unknown))}")
+            config[key] = features
+        else:
+            config[key] = value
+    return config
+
+
+def _build_engine(config):
+    engine = ChessEngine(hash_mb=config.get('hash', 16))
+    engine.use_book = config.get('book', False)
+    for feature in config.get('disable', ()):
+        setattr(engine, 'use_' + feature, False)
+    return engine
+
+
+def _search_limits(engine, config):
+    """(độ sâu, ms mỗi nước, node) của một cấu hình."""
+    level = config.get('level')
+    depth = config.get('depth', engine.depth_map.get(level, MAX_DEPTH) if level else MAX_DEPTH)
+    movetime = config.get('movetime', engine.time_map.get(level) if level else None)
+    if depth == MAX_DEPTH and movetime is None and config.get('nodes') is None:
+        movetime = 1000
+    return depth, movetime, config.get('nodes')
+
+
+def play_game(index, opening, white, black, max_plies=MAX_PLIES):
+    """Chạy trong tiến trình phụ: một ván giữa hai cấu hình, trả về kết quả và thời gian mỗi nước."""
+    board = chess.Board()
+    for san in opening.split():
+        board.push_san(san)
+    configs = {chess.WHITE: white, chess.BLACK: black}
+    engines = {}
+    for color, config in configs.items():
+        engine = _build_engine(config)
+        engine.board = board.copy()
+        # Quân bị bắt và lịch sử ván của engine phải khớp với khai cuộc vừa đặt
+        engine.rebuild_captures()
+        engines[color] = engine
+    stats = {color: {'moves': 0, 'time_ms': 0.0, 'depth': 0, 'nodes': 0} for color in configs}
+
+    reason = None
+    while True:
+        outcome = board.outcome(claim_draw=True)
+        if outcome is not None:
+            result = outcome.result()
+            reason = outcome.termination.name.lower()
+            break
+        if board.ply() >= max_plies:
+            result, reason = '1/2-1/2', 'max_plies'
+            break
+        color = board.turn
+        engine = engines[color]
+        depth, movetime, nodes = _search_limits(engine, configs[color])
+        start = time.perf_counter()
+        move = engine.search(max_depth=depth, movetime_ms=movetime, max_nodes=nodes)
+        elapsed = time.perf_counter() - start
+        if move is None:
+            result, reason = ('0-1' if color == chess.WHITE else '1-0'), 'no_move'
+            break
+        side = stats[color]
+        side['moves'] += 1
+        side['time_ms'] += elapsed * 1000
+        side['depth'] += (engine.last_search or {}).get('depth', 0)
+        side['nodes'] += engine.nodes
+        board.push(move)
+        for other in engines.values():
+            other.make_move(move.uci())
+
+    for engine in engines.values():
+        engine.close()
+    return {
+        'index': index,
+        'opening': opening,
+        'white': white['name'],
+        'black': black['name'],
+        'result': result,
+        'reason': reason,
+        'plies': board.ply(),
+        'stats': {white['name'] if color == chess.WHITE else black['name']: side for color, side in stats.items()},
+    }
+
+
+def elo_difference(score):
+    """Chênh lệch Elo ứng với tỉ lệ điểm score (0..1); ±math.inf khi thắng/thua tuyệt đối."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def summarize(games, name1, name2):
+    """Tổng hợp theo góc nhìn engine1: thắng/hòa/thua, Elo và biên sai số 95%."""
+    scores = []
+    for game in games:
+        if game['result'] == '1/2-1/2':
+            scores.append(0.5)
+        else:
+            white_won = game['result'] == '1-0'
+            scores.append(1.0 if white_won == (game['white'] == name1) else 0.0)
+    count = len(scores)
+    wins = scores.count(1.0)
+    draws = scores.count(0.5)
+    losses = scores.count(0.0)
+    score = sum(scores) / count if count else 0.5
+    variance = sum((s - score) ** 2 for s in scores) / count if count else 0.0
+    margin = 1.96 * math.sqrt(variance / count) if count else 0.0
+
+    per_engine = {}
+    for name in (name1, name2):
+        moves = sum(game['stats'][name]['moves'] for game in games)
+        per_engine[name] = {
+            'moves': moves,
+            'avg_ms_per_move': round(sum(game['stats'][name]['time_ms'] for game in games) / moves, 1) if moves else 0,
+            'avg_depth': round(sum(game['stats'][name]['depth'] for game in games) / moves, 2) if moves else 0,
+            'avg_nodes': int(sum(game['stats'][name]['nodes'] for game in games) / moves) if moves else 0,
+        }
+
+    elo = elo_difference(score)
+    low = elo_difference(max(0.0, score - margin))
+    high = elo_difference(min(1.0, score + margin))
+    return {
+        'games': count,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'score': round(score, 4),
+        # None (null trong JSON) khi không bị chặn: thắng/thua mọi ván
+        'elo': _round_elo(elo),
+        'elo_low': _round_elo(low),
+        'elo_high': _round_elo(high),
+        'engines': per_engine,
+    }
+
+
+def _round_elo(value):
+    return round(value, 1) if math.isfinite(value) else None
+
+
+def format_elo(summary, key):
+    """Giá trị Elo để in; giá trị không bị chặn hiển thị là +inf/-inf."""
+    value = summary[key]
+    if value is not None:
+        return f"{value:+.1f}"
+    # Cận trên chỉ là -inf khi thua mọi ván; các giá trị khác chỉ là +inf khi thắng mọi ván
+    if key == 'elo_high':
+        return '-inf' if summary['score'] <= 0 else '+inf'
+    return '+inf' if summary['score'] >= 1 else '-inf'
+
+
+def run_match(engine1, engine2, games=20, concurrency=None, openings=OPENINGS, max_plies=MAX_PLIES, progress=None):
+    """Đấu `games` ván (đổi màu theo cặp) trên `concurrency` tiến trình. Trả về (danh sách ván, tổng hợp)."""
+    if engine1['name'] == engine2['name']:
+        engine2 = dict(engine2, name=engine2['name'] + '-2')
+    jobs = []
+    for index in range(games):
+        opening = openings[(index // 2) % len(openings)]
+        white, black = (engine1, engine2) if index % 2 == 0 else (engine2, engine1)
+        jobs.append((index, opening, white, black, max_plies))
+
+    concurrency = concurrency or max(1, (multiprocessing.cpu_count() or 2) - 1)
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=context) as executor:
+        futures = [executor.submit(play_game, *job) for job in jobs]
+        for future in as_completed(futures):
+            game = future.result()
+            results.append(game)
+            if progress is not None:
+                progress(game, summarize(results, engine1['name'], engine2['name']))
+    results.sort(key=lambda game: game['index'])
+    return results, summarize(results, engine1['name'], engine2['name'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Self-play match between two ChessEngine configurations')
+    parser.add_argument('--engine1', default='', help='e.g. "name=new,depth=5,movetime=300"')
+    parser.add_argument('--engine2', default='', help='e.g. "name=base,depth=5,movetime=300,disable=lmr"')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=None, help='parallel games (default: CPUs - 1)')
+    parser.add_argument('--openings', help='file with one line of SAN moves per opening')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--output', help='write games and summary as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        engine1 = parse_config(args.engine1, 'engine1')
+        engine2 = parse_config(args.engine2, 'engine2')
+    except ValueError as exc:
+        parser.error(str(exc))
+    openings = OPENINGS
+    if args.openings:
+        with open(args.openings, encoding='utf-8') as handle:
+            openings = [line.strip() for line in handle if line.strip() and not line.startswith('#')]
+
+    def progress(game, summary):
+        print(f"game {game['index'] + 1:>3}: {game['white']} vs {game['black']} {game['result']:7} "
+              f"({game['reason']}, {game['plies']} plies)  score {summary['wins']}-{summary['draws']}-"
+              f"{summary['losses']}  elo {format_elo(summary, 'elo')}", flush=True)
+
+    games, summary = run_match(engine1, engine2, args.games, args.concurrency, openings, args.max_plies, progress)
+    print(f"\n{engine1['name']} vs {engine2['name']}: +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"({summary['score']:.1%})  Elo {format_elo(summary, 'elo')} "
+          f"[{format_elo(summary, 'elo_low')}, {format_elo(summary, 'elo_high')}]")
+    for name, stats in summary['engines'].items():
+        print(f"  {name:12} {stats['avg_ms_per_move']:>8} ms/move  depth {stats['avg_depth']:>5}  "
+              f"nodes {stats['avg_nodes']:>8}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump({'engine1': engine1, 'engine2': engine2, 'summary': summary, 'games': games},
+                      handle, indent=2, ensure_ascii=False, allow_nan=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
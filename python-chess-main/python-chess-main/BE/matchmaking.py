@@ -0,0 +1,120 @@
+# backend/matchmaking.py
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Độ rộng một nhóm rating: người chơi chỉ được ghép trong cùng nhóm
+RATING_BAND = 200
+# Số thời gian chờ gần nhất giữ lại để tính phân vị
+WAIT_SAMPLES = 1000
+
+
+class MatchTicket:
+    """Một người chơi đang chờ ghép: `connection` là đối tượng do nơi gọi tự quản lý (ws, Connection...)."""
+
+    __slots__ = ('player_id', 'connection', 'pool', 'enqueued_at')
+
+    def __init__(self, player_id, connection, pool):
+        self.player_id = player_id
+        self.connection = connection
+        self.pool = pool
+        self.enqueued_at = time.monotonic()
+
+
+class Matchmaker:
+    """Hàng đợi ghép trận chia theo nhóm (trình độ/nhóm rating, thời gian suy nghĩ).
+
+    Mỗi nhóm là một OrderedDict theo thứ tự vào hàng nên vào hàng, lấy người chờ lâu nhất
+    và hủy đều là O(1). Mọi thao tác giữ một khóa ngắn nên dùng được từ nhiều luồng
+    (flask_sock) lẫn một event loop (async_server).
+    """
+
+    def __init__(self, rating_band=RATING_BAND):
+        self.rating_band = rating_band
+        self._pools = {}    # {pool: OrderedDict{player_id: MatchTicket}}
+        self._tickets = {}  # {player_id: MatchTicket}
+        self._lock = threading.Lock()
+        self.matches = 0
+        self.cancelled = 0
+        self._wait_times = deque(maxlen=WAIT_SAMPLES)
+        self._max_wait = 0.0
+
+    def pool_key(self, level=None, rating=None, time_control=None):
+        """Nhóm ghép: ưu tiên cấp độ nếu có, nếu không thì theo nhóm rating."""
+        if level is not None:
+            bucket = str(level)
+        elif rating is not None:
+            bucket = f"rating:{int(rating) // self.rating_band * self.rating_band}"
+        else:
+            bucket = 'any'
+        return (bucket, str(time_control) if time_control is not None else 'any')
+
+    def enqueue(self, player_id, connection, level=None, rating=None, time_control=None):
+        """Vào hàng chờ. Nếu trong nhóm có người chờ trước thì ghép ngay và trả về ticket của
+        người đó (người đó luôn cầm quân trắng); ngược lại trả về None.
+        """
+        pool = self.pool_key(level, rating, time_control)
+        with self._lock:
+            self._remove(player_id)
+            queue = self._pools.get(pool)
+            if queue:
+                _, opponent = queue.popitem(last=False)
+                del self._tickets[opponent.player_id]
+                if not queue:
+                    del self._pools[pool]
+                wait = time.monotonic() - opponent.enqueued_at
+                self._wait_times.append(wait)
+                self._max_wait = max(self._max_wait, wait)
+                self.matches += 1
+                return opponent
+            ticket = MatchTicket(player_id, connection, pool)
+            self._pools.setdefault(pool, OrderedDict())[player_id] = ticket
+            self._tickets[player_id] = ticket
+            return None
+
+    def cancel(self, player_id):
+        """Rời hàng chờ (chủ động hoặc khi socket đóng). Trả về True nếu người chơi đang chờ."""
+        with self._lock:
+            if self._remove(player_id):
+                self.cancelled += 1
+                return True
+            return False
+
+    def _remove(self, player_id):
+        ticket = self._tickets.pop(player_id, None)
+        if ticket is None:
+            return False
+        queue = self._pools[ticket.pool]
+        del queue[player_id]
+        if not queue:
+            del self._pools[ticket.pool]
+        return True
+
+    def is_waiting(self, player_id):
+        return player_id in self._tickets
+
+    def metrics(self):
+        """Độ sâu hàng đợi theo nhóm và thời gian chờ (ms) của các trận đã ghép gần đây."""
+        with self._lock:
+            now = time.monotonic()
+            pools = {f"{bucket}/{time_control}": {
+                'depth': len(queue),
+                'oldest_wait_ms': round((now - next(iter(queue.values())).enqueued_at) * 1000, 1),
+            } for (bucket, time_control), queue in self._pools.items()}
+            waits = sorted(self._wait_times)
+
+        def percentile(fraction):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1)
+
+        return {
+            'waiting': sum(pool['depth'] for pool in pools.values()),
+            'pools': pools,
+            'matches': self.matches,
+            'cancelled': self.cancelled,
+            'wait_ms_p50': percentile(0.50),
+            'wait_ms_p95': percentile(0.95),
+            'wait_ms_max': round(self._max_wait * 1000, 1),
+        }
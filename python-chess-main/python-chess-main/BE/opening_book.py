@@ -0,0 +1,75 @@
+# backend/opening_book.py
+
+import os
+import random
+import threading
+
+import chess.polyglot # type: ignore
+
+# Đường dẫn mặc định tới sách khai cuộc Polyglot (.bin), có thể đặt qua biến môi trường
+DEFAULT_BOOK_PATH = os.environ.get('CHESS_BOOK_PATH')
+
+# Mỗi tiến trình chỉ mở (mmap) một lần cho mỗi file; các tiến trình dùng chung page cache của hệ điều hành
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def _open_reader(path):
+    path = os.path.abspath(path)
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is None:
+            reader = chess.polyglot.open_reader(path)
+            _readers[path] = reader
+        return reader
+
+
+class OpeningBook:
+    """Tra sách khai cuộc Polyglot trước khi tìm kiếm.
+
+    File được ánh xạ bộ nhớ (mmap, không sao chép) và tìm theo khóa Zobrist bằng tìm kiếm nhị phân.
+    Nước đi được chọn ngẫu nhiên theo trọng số của sách; ra khỏi sách thì trả về None.
+    """
+
+    def __init__(self, path, max_ply=40, minimum_weight=1, seed=None):
+        self.path = path
+        self.max_ply = max_ply
+        self.minimum_weight = minimum_weight
+        self.random = random.Random(seed)
+        self.reader = _open_reader(path)
+        self.hits = 0
+        self.misses = 0
+
+    def choose(self, board):
+        """Nước đi từ sách cho thế cờ hiện tại, hoặc None nếu không có."""
+        if board.ply() >= self.max_ply:
+            return None
+        entries = list(self.reader.find_all(board, minimum_weight=self.minimum_weight))
+        if not entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        total = sum(entry.weight for entry in entries)
+        choice = self.random.uniform(0, total)
+        for entry in entries:
+            choice -= entry.weight
+            if choice <= 0:
+                return entry.move
+        return entries[-1].move
+
+    def moves(self, board):
+        """Tất cả nước đi của sách cho thế cờ: [(nước đi, trọng số)]."""
+        return [(entry.move, entry.weight)
+                for entry in self.reader.find_all(board, minimum_weight=self.minimum_weight)]
+
+
+def load_book(path=None, **kwargs):
+    """Mở sách khai cuộc nếu có đường dẫn hợp lệ, ngược lại trả về None (chạy không có sách)."""
+    path = path or DEFAULT_BOOK_PATH
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        return OpeningBook(path, **kwargs)
+    except (IOError, OSError) as e:
+        print(f"Không mở được sách khai cuộc {path}: {e}")
+        return None
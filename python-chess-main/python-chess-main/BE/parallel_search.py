@@ -0,0 +1,140 @@
+# backend/parallel_search.py
+
+import multiprocessing
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+import chess # type: ignore
+
+# --- Phần chạy trong tiến trình phụ ---
+
+_helper_engine = None
+_helper_hash_mb = 16
+# Cờ dừng dùng chung với tiến trình chính (stop của UCI, hủy job của search service)
+_helper_stop = None
+
+# Chu kỳ (giây) tiến trình chính kiểm tra stop_callback trong khi chờ các tiến trình phụ
+STOP_POLL_INTERVAL = 0.01
+
+
+def _init_helper(hash_mb, stop):
+    global _helper_hash_mb, _helper_stop
+    _helper_hash_mb = hash_mb
+    _helper_stop = stop
+
+
+def _engine_at(fen, moves):
+    """Engine riêng của tiến trình phụ, giữ bảng chuyển vị giữa các vòng lặp và các nước đi."""
+    global _helper_engine
+    from chess_engine import ChessEngine
+
+    if _helper_engine is None:
+        _helper_engine = ChessEngine(hash_mb=_helper_hash_mb)
+        _helper_engine.stop_callback = _helper_stop.is_set
+    board = _helper_engine.board
+    played = [move.uci() for move in board.move_stack]
+    if board.root().fen() != fen or played != moves[:len(played)]:
+        board.set_fen(fen)
+        played = []
+    for uci in moves[len(played):]:
+        board.push_uci(uci)
+    return _helper_engine
+
+
+def _search_root_moves(fen, moves, root_moves, depth, movetime_ms, max_nodes=None):
+    """Tìm ở độ sâu cố định nhưng chỉ trên tập nước đi gốc được chia cho tiến trình này.
+
+    Dừng (coi như chưa hoàn thành) khi hết movetime_ms, vượt max_nodes hoặc cờ dừng chung được bật.
+
+    Trả về (nước đi tốt nhất, điểm, hoàn thành?, biến chính, số node).
+    """
+    from chess_engine import _SearchTimeout
+    from position import Position, move_uci
+
+    engine = _engine_at(fen, moves)
+    pos = Position.from_board(engine.board)
+    root_ply = pos.ply
+    engine.nodes = 0
+    engine.qnodes = 0
+    engine.tt.new_search()
+    engine._deadline = time.monotonic() + movetime_ms / 1000.0 if movetime_ms else None
+    engine._node_limit = max_nodes
+    try:
+        root = {pos.from_chess_move(chess.Move.from_uci(m)) for m in root_moves}
+        move, score = engine._search_root(depth, pos, root_moves=root)
+    except _SearchTimeout:
+        while pos.ply > root_ply:
+            pos.unmake()
+        return None, None, False, [], engine.nodes
+    finally:
+        engine._deadline = None
+        engine._node_limit = None
+
+    pos.make(move)
+    pv = [move_uci(move)] + [move_uci(m) for m in engine._extract_pv(pos, depth - 1)]
+    pos.unmake()
+    return move_uci(move), score, True, pv, engine.nodes
+
+
+# --- Phần chạy trong tiến trình chính ---
+
+class ParallelRootSearch:
+    """Chia các nước đi ở gốc cho nhiều tiến trình (root splitting).
+
+    Nước đi đã sắp xếp được chia xoay vòng để mỗi tiến trình đều nhận một phần các nước tốt;
+    mỗi tiến trình có bảng chuyển vị riêng và kết quả được gộp theo điểm số.
+    Kết quả có thể khác nhau giữa các lần chạy do thứ tự phân công tiến trình; cần tất định
+    thì dùng threads=1 (tìm tuần tự).
+    """
+
+    def __init__(self, threads, hash_mb=16):
+        self.threads = threads
+        context = multiprocessing.get_context('spawn')
+        # Event chỉ truyền được cho tiến trình phụ lúc khởi tạo, nên tạo một lần và bật/tắt theo từng vòng
+        self._stop = context.Event()
+        self._executor = ProcessPoolExecutor(max_workers=threads, mp_context=context,
+                                             initializer=_init_helper, initargs=(hash_mb, self._stop))
+
+    def search_depth(self, board, depth, ordered_moves, movetime_ms=None, max_nodes=None, stop_callback=None):
+        """Tìm một vòng ở độ sâu depth. Trả về (nước đi, điểm, biến chính, số node),
+        hoặc nước đi None nếu có tiến trình không hoàn thành (hết movetime_ms, vượt max_nodes
+        hay stop_callback() trả về True)."""
+        fen = board.root().fen()
+        moves = [move.uci() for move in board.move_stack]
+        chunks = [chunk for chunk in (ordered_moves[i::self.threads] for i in range(self.threads)) if chunk]
+        # Ngân sách node chia đều cho các tiến trình phụ
+        helper_nodes = max(1, max_nodes // len(chunks)) if max_nodes is not None else None
+        self._stop.clear()
+        futures = [
+            self._executor.submit(_search_root_moves, fen, moves, [m.uci() for m in chunk], depth, movetime_ms,
+                                  helper_nodes)
+            for chunk in chunks
+        ]
+        # Chờ các tiến trình phụ nhưng vẫn chuyển tiếp yêu cầu dừng cho chúng
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=STOP_POLL_INTERVAL if stop_callback else None,
+                              return_when=FIRST_EXCEPTION)
+            if pending and stop_callback is not None and stop_callback():
+                self._stop.set()
+                stop_callback = None
+
+        maximizing = board.turn == chess.WHITE
+        best = None
+        nodes = 0
+        completed = True
+        # Gộp theo thứ tự phần chia (không phải thứ tự hoàn thành) để hòa điểm được xử lý ổn định
+        for future in futures:
+            move, score, done, pv, job_nodes = future.result()
+            nodes += job_nodes
+            if not done:
+                completed = False
+                continue
+            if best is None or (score > best[1] if maximizing else score < best[1]):
+                best = (move, score, pv)
+        if not completed or best is None:
+            return None, None, [], nodes
+        return chess.Move.from_uci(best[0]), best[1], [chess.Move.from_uci(m) for m in best[2]], nodes
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
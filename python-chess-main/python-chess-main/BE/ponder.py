@@ -0,0 +1,102 @@
+# backend/ponder.py
+
+import threading
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from search_service import TIMEOUT_GRACE
+
+# Thời gian pondering tối đa: PONDER_TIME_FACTOR lần ngân sách của cấp độ, không quá PONDER_MAX_MS
+PONDER_TIME_FACTOR = 2
+PONDER_MAX_MS = 5000
+
+
+class Ponderer:
+    """Pondering: trong lúc người chơi suy nghĩ, tìm trước nước trả lời cho nước đi được dự đoán.
+
+    Nước dự đoán là nước thứ hai trong biến chính của AI. Job pondering chạy trên cùng worker
+    với ván (cùng game_key) nên dù đoán sai, bảng chuyển vị đã được làm nóng vẫn dùng lại được.
+    Mỗi ván có tối đa một job pondering, ngân sách bị giới hạn và SearchService hủy nó ngay khi
+    worker cần cho một tìm kiếm thật.
+    """
+
+    def __init__(self, time_factor=PONDER_TIME_FACTOR, max_ms=PONDER_MAX_MS):
+        self.time_factor = time_factor
+        self.max_ms = max_ms
+        self._ponders = {}  # {game_key: (các nước UCI dự kiến, SearchJob, ngân sách)}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, service, game_key, board, pv, budget):
+        """Bắt đầu pondering sau nước đi của AI. pv là biến chính của AI (pv[0] là nước vừa đi)."""
+        self.cancel(game_key)
+        if len(pv) < 2 or board.is_game_over():
+            return False
+        moves = [move.uci() for move in board.move_stack]
+        if moves[-1:] != [pv[0]] or pv[1] not in [move.uci() for move in board.legal_moves]:
+            return False
+        moves.append(pv[1])
+        movetime_ms = budget.get('movetime_ms') or self.max_ms
+        ponder_budget = dict(budget, movetime_ms=min(movetime_ms * self.time_factor, self.max_ms))
+        job = service.submit(game_key, board.root().fen(), moves, ponder_budget, ponder=True)
+        if job is None:
+            return False
+        with self._lock:
+            self._ponders[game_key] = (moves, job, ponder_budget)
+            self.started += 1
+        return True
+
+    def take(self, game_key, board, wait_ms):
+        """Lấy kết quả pondering nếu người chơi đã đi đúng nước dự đoán, ngược lại hủy và trả về None.
+
+        Nếu pondering chưa xong thì chờ thêm tối đa wait_ms rồi dừng nó và dùng kết quả đã có.
+        """
+        with self._lock:
+            entry = self._ponders.pop(game_key, None)
+        if entry is None:
+            return None
+        moves, job, ponder_budget = entry
+        if [move.uci() for move in board.move_stack] != moves:
+            job.cancel()
+            self.misses += 1
+            return None
+
+        waited_out = False
+        try:
+            try:
+                result = job.future.result(timeout=wait_ms / 1000.0)
+            except FutureTimeoutError:
+                job.cancel()
+                waited_out = True
+                result = job.future.result(timeout=TIMEOUT_GRACE)
+        except (CancelledError, FutureTimeoutError, BrokenProcessPool):
+            result = None
+
+        # Pondering bị hủy sớm để nhường worker thì kết quả quá nông, coi như không trúng
+        if (result is None or result['move'] is None
+                or (result['cancelled'] and not waited_out
+                    and (result['depth'] or 0) < ponder_budget.get('max_depth', 0))):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def cancel(self, game_key):
+        with self._lock:
+            entry = self._ponders.pop(game_key, None)
+        if entry is not None:
+            entry[1].cancel()
+
+    def render(self):
+        """Bộ đếm pondering theo định dạng Prometheus."""
+        lines = []
+        for name, value, help_text in (
+                ('chess_ponder_started_total', self.started, 'Ponder searches started'),
+                ('chess_ponder_hits_total', self.hits, 'Player moves that matched the ponder move'),
+                ('chess_ponder_misses_total', self.misses, 'Ponder searches discarded')):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
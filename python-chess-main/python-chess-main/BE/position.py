@@ -0,0 +1,835 @@
+# backend/position.py
+
+"""Thế cờ nội bộ của vòng tìm kiếm: bitboard số nguyên, bảng tấn công tính sẵn, nước đi nén thành int.
+
+chess.Board tạo một đối tượng chess.Move cho mỗi nước sinh ra và push()/pop() lưu cả trạng thái
+bàn cờ, nên phần lớn thời gian tìm kiếm bị tốn vào cấp phát đối tượng. Position chỉ giữ vài
+số nguyên, sinh nước giả hợp lệ (pseudo-legal) vào bộ đệm cấp phát sẵn và kiểm tra vua bị chiếu
+ngay trong make(). Khóa Zobrist (chuẩn Polyglot, trùng với position_key) và điểm vật chất + PST
+được cập nhật tăng dần. Chỉ đổi qua lại với chess.Board ở ranh giới API (from_board/to_board).
+
+Nước đi nén: from | to << 6 | phong cấp << 12 | loại << 15. Số 0 (a1a1) là nước đi rỗng (null move).
+"""
+
+import chess # type: ignore
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY # type: ignore
+
+from evaluation import MG_TABLE, EG_TABLE, PHASE_WEIGHTS, SEE_VALUES, taper
+
+WHITE = 1
+BLACK = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+
+# Loại nước đi trong 3 bit cao
+FLAG_NORMAL = 0
+FLAG_DOUBLE_PUSH = 1
+FLAG_EN_PASSANT = 2
+FLAG_CASTLING = 3
+
+# Kích thước bộ đệm nước đi: nhiều hơn số nước giả hợp lệ tối đa của một thế cờ
+MAX_MOVES = 256
+
+# Quyền nhập thành: 4 bit
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# Bảng tấn công tính sẵn của python-chess: quân nhảy tra trực tiếp theo ô, quân trượt tra dict
+# theo các ô bị chặn trên đường (occupied & mask) nên không cần phép nhân magic trên số lớn
+BB_SQUARES = chess.BB_SQUARES
+BB_ALL = chess.BB_ALL
+KNIGHT_ATTACKS = chess.BB_KNIGHT_ATTACKS
+KING_ATTACKS = chess.BB_KING_ATTACKS
+PAWN_ATTACKS = chess.BB_PAWN_ATTACKS
+DIAG_MASKS = chess.BB_DIAG_MASKS
+DIAG_ATTACKS = chess.BB_DIAG_ATTACKS
+FILE_MASKS = chess.BB_FILE_MASKS
+FILE_ATTACKS = chess.BB_FILE_ATTACKS
+RANK_MASKS = chess.BB_RANK_MASKS
+RANK_ATTACKS = chess.BB_RANK_ATTACKS
+RAYS = chess.BB_RAYS
+
+NOT_FILE_A = BB_ALL & ~chess.BB_FILE_A
+NOT_FILE_H = BB_ALL & ~chess.BB_FILE_H
+RANK_1 = chess.BB_RANK_1
+RANK_2 = chess.BB_RANK_2
+RANK_3 = chess.BB_RANK_3
+RANK_6 = chess.BB_RANK_6
+RANK_7 = chess.BB_RANK_7
+RANK_8 = chess.BB_RANK_8
+
+
+def _piece_index(piece_type, color, square):
+    """Chỉ số chung cho bảng Zobrist và bảng điểm: loại quân << 7 | màu << 6 | ô."""
+    return piece_type << 7 | color << 6 | square
+
+
+ZOBRIST_PIECES = [0] * (7 << 7)
+PSQ_MG = [0] * (7 << 7)
+PSQ_EG = [0] * (7 << 7)
+for _piece_type in range(PAWN, KING + 1):
+    for _color in (BLACK, WHITE):
+        for _square in range(64):
+            _index = _piece_index(_piece_type, _color, _square)
+            ZOBRIST_PIECES[_index] = POLYGLOT_RANDOM_ARRAY[64 * ((_piece_type - 1) * 2 + _color) + _square]
+            _table_index = (_piece_type + (0 if _color == WHITE else 6)) * 64 + _square
+            PSQ_MG[_index] = MG_TABLE[_table_index]
+            PSQ_EG[_index] = EG_TABLE[_table_index]
+ZOBRIST_CASTLING = [0] * 16
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights & (1 << _bit):
+            ZOBRIST_CASTLING[_rights] ^= POLYGLOT_RANDOM_ARRAY[768 + _bit]
+ZOBRIST_EP = POLYGLOT_RANDOM_ARRAY[772:780]
+ZOBRIST_TURN = POLYGLOT_RANDOM_ARRAY[780]
+
+# Quyền nhập thành còn lại khi một nước đi rời khỏi hoặc đi tới ô tương ứng
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[chess.E1] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[chess.H1] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[chess.A1] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[chess.E8] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[chess.H8] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[chess.A8] = 15 & ~BLACK_QUEENSIDE
+# Ô đích của vua khi nhập thành -> (ô xe đi, ô xe tới)
+CASTLING_ROOKS = {chess.G1: (chess.H1, chess.F1), chess.C1: (chess.A1, chess.D1),
+                  chess.G8: (chess.H8, chess.F8), chess.C8: (chess.A8, chess.D8)}
+
+
+def encode_move(from_square, to_square, promotion=0, flag=FLAG_NORMAL):
+    return from_square | to_square << 6 | promotion << 12 | flag << 15
+
+
+def move_uci(move):
+    return chess.Move(move & 63, (move >> 6) & 63, ((move >> 12) & 7) or None).uci()
+
+
+def bishop_attacks(square, occupied):
+    return DIAG_ATTACKS[square][DIAG_MASKS[square] & occupied]
+
+
+def rook_attacks(square, occupied):
+    return RANK_ATTACKS[square][RANK_MASKS[square] & occupied] | FILE_ATTACKS[square][FILE_MASKS[square] & occupied]
+
+
+class Position:
+    """Thế cờ cho vòng tìm kiếm. Mọi nước đi phải qua make()/unmake() (hoặc make_null()).
+
+    Nước sinh ra là giả hợp lệ: kiểm tra is_legal() trước khi make().
+    """
+
+    __slots__ = ('pieces', 'occupied_co', 'occupied', 'squares', 'turn', 'castling', 'ep_square',
+                 'halfmove_clock', 'fullmove_number', 'key', 'mg', 'eg', 'phase', '_stack', '_keys')
+
+    def __init__(self):
+        self.pieces = [0] * 7          # bitboard theo loại quân (cả hai màu), chỉ số PAWN..KING
+        self.occupied_co = [0, 0]      # [Đen, Trắng]
+        self.occupied = 0
+        self.squares = [0] * 64        # loại quân trên từng ô (0 = trống)
+        self.turn = WHITE
+        self.castling = 0
+        self.ep_square = None          # chỉ đặt khi có tốt đối phương bắt qua đường được
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.key = 0
+        self.mg = self.eg = self.phase = 0
+        self._stack = []               # trạng thái để unmake: (nước đi, quân bị bắt, nhập thành, ep, ...)
+        self._keys = []                # khóa của các thế cờ trước, để phát hiện lặp lại
+
+    # --- Ranh giới với chess.Board ---
+
+    @classmethod
+    def from_board(cls, board):
+        """Dựng từ chess.Board: nạp thế cờ gốc rồi đi lại move_stack để có lịch sử lặp lại."""
+        if board.chess960:
+            raise ValueError("Chess960 is not supported by the search position")
+        if not board.is_valid():
+            raise ValueError(f"Invalid position: {board.fen()}")
+        position = cls()
+        position._load(board.root())
+        for move in board.move_stack:
+            packed = position.from_chess_move(move)
+            if not position.is_pseudo_legal(packed) or not position.is_legal(packed):
+                raise ValueError(f"Illegal move in move stack: {move.uci()}")
+            position.make(packed)
+        return position
+
+    def _load(self, board):
+        for square, piece in board.piece_map().items():
+            self._put(piece.piece_type, int(piece.color), square)
+        self.turn = int(board.turn)
+        castling = board.clean_castling_rights()
+        self.castling = ((WHITE_KINGSIDE if castling & chess.BB_H1 else 0)
+                         | (WHITE_QUEENSIDE if castling & chess.BB_A1 else 0)
+                         | (BLACK_KINGSIDE if castling & chess.BB_H8 else 0)
+                         | (BLACK_QUEENSIDE if castling & chess.BB_A8 else 0))
+        self.key ^= ZOBRIST_CASTLING[self.castling]
+        if self.turn == WHITE:
+            self.key ^= ZOBRIST_TURN
+        ep_square = board.ep_square
+        if ep_square is not None and PAWN_ATTACKS[self.turn ^ 1][ep_square] & self.pieces[PAWN] & self.occupied_co[self.turn]:
+            self.ep_square = ep_square
+            self.key ^= ZOBRIST_EP[ep_square & 7]
+        self.halfmove_clock = board.halfmove_clock
+        self.fullmove_number = board.fullmove_number
+
+    def _put(self, piece_type, color, square):
+        mask = BB_SQUARES[square]
+        self.pieces[piece_type] |= mask
+        self.occupied_co[color] |= mask
+        self.occupied |= mask
+        self.squares[square] = piece_type
+        index = _piece_index(piece_type, color, square)
+        self.key ^= ZOBRIST_PIECES[index]
+        self.mg += PSQ_MG[index]
+        self.eg += PSQ_EG[index]
+        self.phase += PHASE_WEIGHTS[piece_type]
+
+    def to_board(self):
+        """chess.Board của thế cờ hiện tại (không kèm lịch sử nước đi)."""
+        board = chess.Board.empty()
+        board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings = self.pieces[1:]
+        board.occupied_co[chess.WHITE] = self.occupied_co[WHITE]
+        board.occupied_co[chess.BLACK] = self.occupied_co[BLACK]
+        board.occupied = self.occupied
+        board.promoted = 0
+        board.turn = bool(self.turn)
+        castling = self.castling
+        board.castling_rights = ((chess.BB_H1 if castling & WHITE_KINGSIDE else 0)
+                                 | (chess.BB_A1 if castling & WHITE_QUEENSIDE else 0)
+                                 | (chess.BB_H8 if castling & BLACK_KINGSIDE else 0)
+                                 | (chess.BB_A8 if castling & BLACK_QUEENSIDE else 0))
+        board.ep_square = self.ep_square
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        return board
+
+    def from_chess_move(self, move):
+        """Nén chess.Move (hợp lệ ở thế cờ hiện tại) thành int."""
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = self.squares[from_square]
+        flag = FLAG_NORMAL
+        if piece_type == PAWN:
+            if abs(to_square - from_square) == 16:
+                flag = FLAG_DOUBLE_PUSH
+            elif to_square == self.ep_square and not self.squares[to_square] and (to_square - from_square) % 8:
+                flag = FLAG_EN_PASSANT
+        elif piece_type == KING and abs(to_square - from_square) == 2:
+            flag = FLAG_CASTLING
+        return encode_move(from_square, to_square, move.promotion or 0, flag)
+
+    @staticmethod
+    def to_chess_move(move):
+        return chess.Move(move & 63, (move >> 6) & 63, ((move >> 12) & 7) or None)
+
+    # --- Thực hiện / hoàn tác nước đi ---
+
+    @property
+    def ply(self):
+        """Số nước đã đi kể từ thế cờ gốc (gồm cả nước rỗng trong tìm kiếm)."""
+        return len(self._stack)
+
+    def make(self, move):
+        """Đi một nước hợp lệ (nước giả hợp lệ phải qua is_legal() trước)."""
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        flag = move >> 15
+        us = self.turn
+        them = us ^ 1
+        squares = self.squares
+        pieces = self.pieces
+        occupied_co = self.occupied_co
+        piece_type = squares[from_square]
+        captured = squares[to_square]
+        key = self.key
+        mg = self.mg
+        eg = self.eg
+        self._stack.append((move, captured, self.castling, self.ep_square, self.halfmove_clock, key, mg, eg,
+                            self.phase))
+        self._keys.append(key)
+
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[self.ep_square & 7]
+            self.ep_square = None
+
+        to_mask = BB_SQUARES[to_square]
+        if captured:
+            pieces[captured] ^= to_mask
+            occupied_co[them] ^= to_mask
+            index = captured << 7 | them << 6 | to_square
+            key ^= ZOBRIST_PIECES[index]
+            mg -= PSQ_MG[index]
+            eg -= PSQ_EG[index]
+            self.phase -= PHASE_WEIGHTS[captured]
+
+        move_mask = BB_SQUARES[from_square] | to_mask
+        pieces[piece_type] ^= move_mask
+        occupied_co[us] ^= move_mask
+        squares[from_square] = 0
+        squares[to_square] = piece_type
+        index = piece_type << 7 | us << 6
+        key ^= ZOBRIST_PIECES[index | from_square] ^ ZOBRIST_PIECES[index | to_square]
+        mg += PSQ_MG[index | to_square] - PSQ_MG[index | from_square]
+        eg += PSQ_EG[index | to_square] - PSQ_EG[index | from_square]
+
+        if piece_type == PAWN or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if us == BLACK:
+            self.fullmove_number += 1
+
+        if flag:
+            if flag == FLAG_DOUBLE_PUSH:
+                ep_square = (from_square + to_square) >> 1
+                # Chỉ ghi nhận ô bắt qua đường khi đối phương có tốt bắt được (giống khóa Polyglot)
+                if PAWN_ATTACKS[us][ep_square] & pieces[PAWN] & occupied_co[them]:
+                    self.ep_square = ep_square
+                    key ^= ZOBRIST_EP[ep_square & 7]
+            elif flag == FLAG_EN_PASSANT:
+                captured_square = to_square ^ 8
+                captured_mask = BB_SQUARES[captured_square]
+                pieces[PAWN] ^= captured_mask
+                occupied_co[them] ^= captured_mask
+                squares[captured_square] = 0
+                index = PAWN << 7 | them << 6 | captured_square
+                key ^= ZOBRIST_PIECES[index]
+                mg -= PSQ_MG[index]
+                eg -= PSQ_EG[index]
+            else:
+                rook_from, rook_to = CASTLING_ROOKS[to_square]
+                rook_mask = BB_SQUARES[rook_from] | BB_SQUARES[rook_to]
+                pieces[ROOK] ^= rook_mask
+                occupied_co[us] ^= rook_mask
+                squares[rook_from] = 0
+                squares[rook_to] = ROOK
+                index = ROOK << 7 | us << 6
+                key ^= ZOBRIST_PIECES[index | rook_from] ^ ZOBRIST_PIECES[index | rook_to]
+                mg += PSQ_MG[index | rook_to] - PSQ_MG[index | rook_from]
+                eg += PSQ_EG[index | rook_to] - PSQ_EG[index | rook_from]
+
+        promotion = (move >> 12) & 7
+        if promotion:
+            pieces[PAWN] ^= to_mask
+            pieces[promotion] |= to_mask
+            squares[to_square] = promotion
+            index = us << 6 | to_square
+            key ^= ZOBRIST_PIECES[PAWN << 7 | index] ^ ZOBRIST_PIECES[promotion << 7 | index]
+            mg += PSQ_MG[promotion << 7 | index] - PSQ_MG[PAWN << 7 | index]
+            eg += PSQ_EG[promotion << 7 | index] - PSQ_EG[PAWN << 7 | index]
+            self.phase += PHASE_WEIGHTS[promotion]
+
+        castling = self.castling
+        if castling:
+            new_castling = castling & CASTLING_MASKS[from_square] & CASTLING_MASKS[to_square]
+            if new_castling != castling:
+                key ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[new_castling]
+                self.castling = new_castling
+
+        self.key = key ^ ZOBRIST_TURN
+        self.mg = mg
+        self.eg = eg
+        self.turn = them
+        self.occupied = occupied_co[0] | occupied_co[1]
+
+    def is_legal(self, move, in_check=None):
+        """Nước giả hợp lệ không để vua bên đi bị chiếu.
+
+        Thường không cần đi thử: nước của vua chỉ cần ô đích không bị khống chế, các quân khác
+        chỉ có thể lộ vua khi ô đi nằm trên đường thẳng/chéo với vua. in_check là trạng thái
+        bị chiếu của thế cờ nếu nơi gọi đã biết (None = chưa biết); khi bị chiếu thì đi thử.
+        """
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        us = self.turn
+        pieces = self.pieces
+        king_square = (pieces[KING] & self.occupied_co[us]).bit_length() - 1
+        if in_check is None:
+            in_check = self.is_attacked(king_square, us ^ 1)
+        if in_check or move >> 15 == FLAG_EN_PASSANT:
+            self.make(move)
+            legal = not self.is_attacked(king_square if from_square != king_square else to_square, us ^ 1)
+            self.unmake()
+            return legal
+
+        to_mask = BB_SQUARES[to_square]
+        enemy = self.occupied_co[us ^ 1] & ~to_mask
+        if from_square == king_square:
+            # Bỏ vua khỏi bàn để quân trượt chiếu xuyên qua ô cũ của vua
+            return not self.attackers(us ^ 1, to_square, self.occupied ^ BB_SQUARES[from_square]) & enemy
+        if not RAYS[king_square][from_square]:
+            return True
+        occupied = (self.occupied ^ BB_SQUARES[from_square]) | to_mask
+        queens = pieces[QUEEN]
+        return not ((bishop_attacks(king_square, occupied) & (pieces[BISHOP] | queens) & enemy)
+                    or (rook_attacks(king_square, occupied) & (pieces[ROOK] | queens) & enemy))
+
+    def make_null(self):
+        """Nhường lượt (null move) cho null-move pruning."""
+        self._stack.append((0, 0, self.castling, self.ep_square, self.halfmove_clock, self.key, self.mg, self.eg,
+                            self.phase))
+        self._keys.append(self.key)
+        key = self.key ^ ZOBRIST_TURN
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[self.ep_square & 7]
+            self.ep_square = None
+        self.key = key
+        self.halfmove_clock += 1
+        self.turn ^= 1
+
+    def unmake(self):
+        """Hoàn tác nước đi (hoặc nước rỗng) cuối cùng."""
+        move, captured, self.castling, self.ep_square, self.halfmove_clock, self.key, self.mg, self.eg, \
+            self.phase = self._stack.pop()
+        self._keys.pop()
+        them = self.turn
+        us = self.turn = them ^ 1
+        if not move:
+            return
+        if us == BLACK:
+            self.fullmove_number -= 1
+
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        flag = move >> 15
+        squares = self.squares
+        pieces = self.pieces
+        occupied_co = self.occupied_co
+        to_mask = BB_SQUARES[to_square]
+
+        promotion = (move >> 12) & 7
+        if promotion:
+            pieces[promotion] ^= to_mask
+            pieces[PAWN] |= to_mask
+            squares[to_square] = PAWN
+
+        piece_type = squares[to_square]
+        move_mask = BB_SQUARES[from_square] | to_mask
+        pieces[piece_type] ^= move_mask
+        occupied_co[us] ^= move_mask
+        squares[from_square] = piece_type
+        squares[to_square] = captured
+        if captured:
+            pieces[captured] |= to_mask
+            occupied_co[them] |= to_mask
+
+        if flag == FLAG_EN_PASSANT:
+            captured_square = to_square ^ 8
+            captured_mask = BB_SQUARES[captured_square]
+            pieces[PAWN] |= captured_mask
+            occupied_co[them] |= captured_mask
+            squares[captured_square] = PAWN
+        elif flag == FLAG_CASTLING:
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            rook_mask = BB_SQUARES[rook_from] | BB_SQUARES[rook_to]
+            pieces[ROOK] ^= rook_mask
+            occupied_co[us] ^= rook_mask
+            squares[rook_to] = 0
+            squares[rook_from] = ROOK
+
+        self.occupied = occupied_co[0] | occupied_co[1]
+
+    # --- Tấn công và chiếu ---
+
+    def attackers(self, color, square, occupied):
+        """Các quân của color tấn công ô square với bàn cờ có các ô chiếm occupied."""
+        pieces = self.pieces
+        queens = pieces[QUEEN]
+        return ((KNIGHT_ATTACKS[square] & pieces[KNIGHT])
+                | (KING_ATTACKS[square] & pieces[KING])
+                | (PAWN_ATTACKS[color ^ 1][square] & pieces[PAWN])
+                | (DIAG_ATTACKS[square][DIAG_MASKS[square] & occupied] & (pieces[BISHOP] | queens))
+                | ((RANK_ATTACKS[square][RANK_MASKS[square] & occupied]
+                    | FILE_ATTACKS[square][FILE_MASKS[square] & occupied]) & (pieces[ROOK] | queens))
+                ) & self.occupied_co[color]
+
+    def is_attacked(self, square, color):
+        """Ô square có bị quân của color tấn công không (kiểm tra quân rẻ trước, dừng sớm)."""
+        pieces = self.pieces
+        own = self.occupied_co[color]
+        if KNIGHT_ATTACKS[square] & pieces[KNIGHT] & own:
+            return True
+        if PAWN_ATTACKS[color ^ 1][square] & pieces[PAWN] & own:
+            return True
+        if KING_ATTACKS[square] & pieces[KING] & own:
+            return True
+        occupied = self.occupied
+        queens = pieces[QUEEN] & own
+        bishops = (pieces[BISHOP] & own) | queens
+        if bishops and DIAG_ATTACKS[square][DIAG_MASKS[square] & occupied] & bishops:
+            return True
+        rooks = (pieces[ROOK] & own) | queens
+        return bool(rooks and (RANK_ATTACKS[square][RANK_MASKS[square] & occupied]
+                               | FILE_ATTACKS[square][FILE_MASKS[square] & occupied]) & rooks)
+
+    def in_check(self):
+        us = self.turn
+        return self.is_attacked((self.pieces[KING] & self.occupied_co[us]).bit_length() - 1, us ^ 1)
+
+    def gives_check(self, move):
+        """Nước đi (giả hợp lệ) có chiếu vua đối phương không, không cần thực hiện nước đi."""
+        flag = move >> 15
+        if flag >= FLAG_EN_PASSANT:
+            # Bắt tốt qua đường và nhập thành hiếm gặp: đi thử cho đơn giản
+            self.make(move)
+            check = self.in_check()
+            self.unmake()
+            return check
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        us = self.turn
+        pieces = self.pieces
+        king_square = (pieces[KING] & self.occupied_co[us ^ 1]).bit_length() - 1
+        king_mask = BB_SQUARES[king_square]
+        occupied = (self.occupied ^ BB_SQUARES[from_square]) | BB_SQUARES[to_square]
+
+        piece_type = (move >> 12) & 7 or self.squares[from_square]
+        if piece_type == PAWN:
+            if PAWN_ATTACKS[us][to_square] & king_mask:
+                return True
+        elif piece_type == KNIGHT:
+            if KNIGHT_ATTACKS[to_square] & king_mask:
+                return True
+        elif piece_type != KING:
+            attacks = 0
+            if piece_type != ROOK:
+                attacks = bishop_attacks(to_square, occupied)
+            if piece_type != BISHOP:
+                attacks |= rook_attacks(to_square, occupied)
+            if attacks & king_mask:
+                return True
+
+        # Chiếu mở: chỉ có thể khi ô đi nằm trên một đường thẳng/chéo với vua đối phương
+        if not RAYS[king_square][from_square]:
+            return False
+        own = self.occupied_co[us] & ~BB_SQUARES[from_square]
+        queens = pieces[QUEEN]
+        return bool((bishop_attacks(king_square, occupied) & (pieces[BISHOP] | queens) & own)
+                    or (rook_attacks(king_square, occupied) & (pieces[ROOK] | queens) & own))
+
+    # --- Sinh nước đi ---
+
+    def generate_captures(self, buffer, count=0):
+        """Ghi các nước bắt quân (phong hậu khi bắt ở hàng cuối), bắt tốt qua đường và phong hậu
+        không bắt quân vào buffer từ vị trí count. Trả về vị trí kết thúc."""
+        us = self.turn
+        occupied_co = self.occupied_co
+        own = occupied_co[us]
+        enemy = occupied_co[us ^ 1]
+        empty = ~self.occupied & BB_ALL
+        pawns = self.pieces[PAWN] & own
+        queen = QUEEN << 12
+
+        if us == WHITE:
+            captures = (((pawns & NOT_FILE_A) << 7, 7), ((pawns & NOT_FILE_H) << 9, 9))
+            promotions = ((pawns & RANK_7) << 8) & empty
+            push = 8
+            last_rank = RANK_8
+        else:
+            captures = (((pawns & NOT_FILE_H) >> 7, -7), ((pawns & NOT_FILE_A) >> 9, -9))
+            promotions = ((pawns & RANK_2) >> 8) & empty
+            push = -8
+            last_rank = RANK_1
+        for targets, delta in captures:
+            targets &= enemy
+            while targets:
+                to_square = targets.bit_length() - 1
+                to_mask = BB_SQUARES[to_square]
+                targets ^= to_mask
+                buffer[count] = (to_square - delta) | to_square << 6 | (queen if to_mask & last_rank else 0)
+                count += 1
+        while promotions:
+            to_square = promotions.bit_length() - 1
+            promotions ^= BB_SQUARES[to_square]
+            buffer[count] = (to_square - push) | to_square << 6 | queen
+            count += 1
+        if self.ep_square is not None:
+            attackers = PAWN_ATTACKS[us ^ 1][self.ep_square] & pawns
+            while attackers:
+                from_square = attackers.bit_length() - 1
+                attackers ^= BB_SQUARES[from_square]
+                buffer[count] = from_square | self.ep_square << 6 | FLAG_EN_PASSANT << 15
+                count += 1
+        return self._piece_moves(buffer, count, enemy)
+
+    def generate_quiets(self, buffer, count=0):
+        """Ghi các nước không bắt quân, nhập thành và phong cấp thành Mã/Tượng/Xe (cả khi bắt quân).
+        Cùng với generate_captures là đủ mọi nước giả hợp lệ."""
+        us = self.turn
+        occupied_co = self.occupied_co
+        own = occupied_co[us]
+        enemy = occupied_co[us ^ 1]
+        empty = ~self.occupied & BB_ALL
+        pawns = self.pieces[PAWN] & own
+
+        if us == WHITE:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            push = 8
+            last_rank = RANK_8
+            capture_targets = ((((pawns & NOT_FILE_A) << 7) & enemy & last_rank, 7),
+                               (((pawns & NOT_FILE_H) << 9) & enemy & last_rank, 9))
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            push = -8
+            last_rank = RANK_1
+            capture_targets = ((((pawns & NOT_FILE_H) >> 7) & enemy & last_rank, -7),
+                               (((pawns & NOT_FILE_A) >> 9) & enemy & last_rank, -9))
+
+        promotions = single & last_rank
+        single &= ~last_rank
+        while single:
+            to_square = single.bit_length() - 1
+            single ^= BB_SQUARES[to_square]
+            buffer[count] = (to_square - push) | to_square << 6
+            count += 1
+        while double:
+            to_square = double.bit_length() - 1
+            double ^= BB_SQUARES[to_square]
+            buffer[count] = (to_square - 2 * push) | to_square << 6 | FLAG_DOUBLE_PUSH << 15
+            count += 1
+        for targets, delta in ((promotions, push),) + capture_targets:
+            while targets:
+                to_square = targets.bit_length() - 1
+                targets ^= BB_SQUARES[to_square]
+                base = (to_square - delta) | to_square << 6
+                buffer[count] = base | KNIGHT << 12
+                buffer[count + 1] = base | BISHOP << 12
+                buffer[count + 2] = base | ROOK << 12
+                count += 3
+
+        if self.castling:
+            count = self._castling_moves(buffer, count)
+        return self._piece_moves(buffer, count, empty)
+
+    def _castling_moves(self, buffer, count):
+        """Nhập thành: đường đi trống, vua không bị chiếu và không đi qua ô bị khống chế
+        (ô đích được make() kiểm tra như mọi nước đi khác)."""
+        castling = self.castling
+        occupied = self.occupied
+        us = self.turn
+        them = us ^ 1
+        if us == WHITE:
+            if (castling & WHITE_KINGSIDE and not occupied & (chess.BB_F1 | chess.BB_G1)
+                    and not self.is_attacked(chess.E1, them) and not self.is_attacked(chess.F1, them)):
+                buffer[count] = encode_move(chess.E1, chess.G1, 0, FLAG_CASTLING)
+                count += 1
+            if (castling & WHITE_QUEENSIDE and not occupied & (chess.BB_B1 | chess.BB_C1 | chess.BB_D1)
+                    and not self.is_attacked(chess.E1, them) and not self.is_attacked(chess.D1, them)):
+                buffer[count] = encode_move(chess.E1, chess.C1, 0, FLAG_CASTLING)
+                count += 1
+        else:
+            if (castling & BLACK_KINGSIDE and not occupied & (chess.BB_F8 | chess.BB_G8)
+                    and not self.is_attacked(chess.E8, them) and not self.is_attacked(chess.F8, them)):
+                buffer[count] = encode_move(chess.E8, chess.G8, 0, FLAG_CASTLING)
+                count += 1
+            if (castling & BLACK_QUEENSIDE and not occupied & (chess.BB_B8 | chess.BB_C8 | chess.BB_D8)
+                    and not self.is_attacked(chess.E8, them) and not self.is_attacked(chess.D8, them)):
+                buffer[count] = encode_move(chess.E8, chess.C8, 0, FLAG_CASTLING)
+                count += 1
+        return count
+
+    def generate_moves(self, buffer, count=0):
+        """Mọi nước giả hợp lệ."""
+        return self.generate_quiets(buffer, self.generate_captures(buffer, count))
+
+    def _piece_moves(self, buffer, count, targets):
+        """Nước đi của Mã, Tượng, Xe, Hậu, Vua tới các ô trong targets."""
+        pieces = self.pieces
+        own = self.occupied_co[self.turn]
+        occupied = self.occupied
+
+        knights = pieces[KNIGHT] & own
+        while knights:
+            from_square = knights.bit_length() - 1
+            knights ^= BB_SQUARES[from_square]
+            attacks = KNIGHT_ATTACKS[from_square] & targets
+            while attacks:
+                to_square = attacks.bit_length() - 1
+                attacks ^= BB_SQUARES[to_square]
+                buffer[count] = from_square | to_square << 6
+                count += 1
+
+        queens = pieces[QUEEN]
+        diagonal = (pieces[BISHOP] | queens) & own
+        while diagonal:
+            from_square = diagonal.bit_length() - 1
+            diagonal ^= BB_SQUARES[from_square]
+            attacks = DIAG_ATTACKS[from_square][DIAG_MASKS[from_square] & occupied] & targets
+            while attacks:
+                to_square = attacks.bit_length() - 1
+                attacks ^= BB_SQUARES[to_square]
+                buffer[count] = from_square | to_square << 6
+                count += 1
+
+        straight = (pieces[ROOK] | queens) & own
+        while straight:
+            from_square = straight.bit_length() - 1
+            straight ^= BB_SQUARES[from_square]
+            attacks = (RANK_ATTACKS[from_square][RANK_MASKS[from_square] & occupied]
+                       | FILE_ATTACKS[from_square][FILE_MASKS[from_square] & occupied]) & targets
+            while attacks:
+                to_square = attacks.bit_length() - 1
+                attacks ^= BB_SQUARES[to_square]
+                buffer[count] = from_square | to_square << 6
+                count += 1
+
+        from_square = (pieces[KING] & own).bit_length() - 1
+        attacks = KING_ATTACKS[from_square] & targets
+        while attacks:
+            to_square = attacks.bit_length() - 1
+            attacks ^= BB_SQUARES[to_square]
+            buffer[count] = from_square | to_square << 6
+            count += 1
+        return count
+
+    def is_pseudo_legal(self, move):
+        """Kiểm tra một nước đi lấy từ bảng chuyển vị/killer (có thể thuộc thế cờ khác)."""
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = (move >> 12) & 7
+        flag = move >> 15
+        us = self.turn
+        own = self.occupied_co[us]
+        to_mask = BB_SQUARES[to_square]
+        if not move or not own & BB_SQUARES[from_square] or own & to_mask:
+            return False
+        piece_type = self.squares[from_square]
+        enemy = self.occupied_co[us ^ 1]
+        occupied = self.occupied
+
+        if piece_type == PAWN:
+            last_rank = RANK_8 if us == WHITE else RANK_1
+            push = 8 if us == WHITE else -8
+            if bool(promotion) != bool(to_mask & last_rank) or flag == FLAG_CASTLING:
+                return False
+            if flag == FLAG_EN_PASSANT:
+                return to_square == self.ep_square and bool(PAWN_ATTACKS[us][from_square] & to_mask)
+            if flag == FLAG_DOUBLE_PUSH:
+                start_rank = RANK_2 if us == WHITE else RANK_7
+                return (to_square == from_square + 2 * push and bool(BB_SQUARES[from_square] & start_rank)
+                        and not occupied & (BB_SQUARES[from_square + push] | to_mask))
+            if PAWN_ATTACKS[us][from_square] & to_mask:
+                return bool(enemy & to_mask)
+            return to_square == from_square + push and not occupied & to_mask
+
+        if promotion or flag == FLAG_DOUBLE_PUSH or flag == FLAG_EN_PASSANT:
+            return False
+        if flag == FLAG_CASTLING:
+            buffer = [0] * 2
+            return move in buffer[:self._castling_moves(buffer, 0)]
+        if piece_type == KNIGHT:
+            attacks = KNIGHT_ATTACKS[from_square]
+        elif piece_type == BISHOP:
+            attacks = bishop_attacks(from_square, occupied)
+        elif piece_type == ROOK:
+            attacks = rook_attacks(from_square, occupied)
+        elif piece_type == QUEEN:
+            attacks = bishop_attacks(from_square, occupied) | rook_attacks(from_square, occupied)
+        else:
+            attacks = KING_ATTACKS[from_square]
+        return bool(attacks & to_mask)
+
+    # --- Luật hòa ---
+
+    def is_insufficient_material(self):
+        """Không bên nào còn đủ quân để chiếu hết (K, K+N, K+B, hoặc chỉ còn Tượng cùng màu ô)."""
+        pieces = self.pieces
+        if pieces[PAWN] | pieces[ROOK] | pieces[QUEEN]:
+            return False
+        minors = pieces[KNIGHT] | pieces[BISHOP]
+        if chess.popcount(minors) <= 1:
+            return True
+        if pieces[KNIGHT]:
+            return False
+        bishops = pieces[BISHOP]
+        return not bishops & chess.BB_DARK_SQUARES or not bishops & chess.BB_LIGHT_SQUARES
+
+    def is_repetition(self, count=3):
+        """Thế cờ hiện tại đã xuất hiện count lần (chỉ xét từ nước không thể đảo ngược gần nhất)."""
+        keys = self._keys
+        key = self.key
+        seen = 1
+        stop = max(0, len(keys) - self.halfmove_clock)
+        for index in range(len(keys) - 2, stop - 1, -2):
+            if keys[index] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    # --- Đánh giá ---
+
+    def score(self):
+        """Điểm tĩnh vật chất + PST (centipawn, góc nhìn Trắng), cập nhật tăng dần nên O(1)."""
+        return taper(self.mg, self.eg, self.phase)
+
+    def see(self, move):
+        """Static Exchange Evaluation trên ô đích của nước đi (centipawn, âm là bắt quân lỗ)."""
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = (move >> 12) & 7
+        pieces = self.pieces
+        squares = self.squares
+        occupied = self.occupied ^ BB_SQUARES[from_square]
+
+        if move >> 15 == FLAG_EN_PASSANT:
+            occupied ^= BB_SQUARES[to_square ^ 8]
+            gain = [SEE_VALUES[PAWN]]
+        else:
+            gain = [SEE_VALUES[squares[to_square]]]
+        on_square = promotion or squares[from_square]
+        if promotion:
+            gain[0] += SEE_VALUES[promotion] - SEE_VALUES[PAWN]
+
+        color = self.turn ^ 1
+        while True:
+            attackers = self.attackers(color, to_square, occupied) & occupied
+            if not attackers:
+                break
+            # Chọn quân tấn công rẻ nhất
+            for piece_type in range(PAWN, KING + 1):
+                candidates = attackers & pieces[piece_type]
+                if candidates:
+                    break
+            attacker_mask = candidates & -candidates
+            gain.append(SEE_VALUES[on_square] - gain[-1])
+            if piece_type == KING and self.attackers(color ^ 1, to_square, occupied ^ attacker_mask) & occupied:
+                # Vua không được bắt vào ô đang bị khống chế
+                gain.pop()
+                break
+            on_square = piece_type
+            occupied ^= attacker_mask
+            color ^= 1
+
+        # Mỗi bên chỉ tiếp tục trao đổi nếu có lợi
+        while len(gain) > 1:
+            last = gain.pop()
+            gain[-1] = -max(-gain[-1], last)
+        return gain[0]
+
+    # --- Perft ---
+
+    def perft(self, depth):
+        """Đếm số node ở độ sâu depth (kiểm tra tính đúng và đo tốc độ sinh nước đi)."""
+        buffers = [[0] * MAX_MOVES for _ in range(depth + 1)]
+        return self._perft(depth, buffers)
+
+    def _perft(self, depth, buffers):
+        buffer = buffers[depth]
+        count = self.generate_moves(buffer)
+        in_check = self.in_check()
+        is_legal = self.is_legal
+        if depth == 1:
+            return sum(1 for index in range(count) if is_legal(buffer[index], in_check))
+        nodes = 0
+        for index in range(count):
+            move = buffer[index]
+            if is_legal(move, in_check):
+                self.make(move)
+                nodes += self._perft(depth - 1, buffers)
+                self.unmake()
+        return nodes
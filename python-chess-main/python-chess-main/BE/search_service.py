@@ -0,0 +1,318 @@
+# backend/search_service.py
+
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# Thời gian chờ thêm (giây) ngoài ngân sách của job trước khi coi là quá hạn
+TIMEOUT_GRACE = 2.0
+# Ngân sách bộ nhớ (MB) cho bảng chuyển vị của mỗi tiến trình worker; số engine giữ lại
+# trong worker = memory_mb // hash_mb (ít nhất 1)
+WORKER_MEMORY_MB = 256
+
+
+class SearchQueueFull(Exception):
+    """Hàng đợi tìm kiếm đã đầy (HTTP 503)."""
+
+
+class SearchRateLimited(Exception):
+    """Ván cờ này đã có đủ job đang chờ (HTTP 429)."""
+
+
+class SearchTimeout(Exception):
+    """Job không hoàn thành trong thời gian cho phép."""
+
+
+class SearchUnavailable(Exception):
+    """Tiến trình worker đã chết và không khởi động lại được (HTTP 503)."""
+
+
+# --- Phần chạy trong tiến trình worker ---
+
+_worker_engines = OrderedDict()  # {game_key: ChessEngine}, LRU
+_worker_slot = None
+_cancel_slots = None
+_current_job = 0
+_hash_mb = 16
+_max_engines = WORKER_MEMORY_MB // _hash_mb
+
+
+def _init_worker(slot, cancel_slots, hash_mb, max_engines):
+    global _worker_slot, _cancel_slots, _hash_mb, _max_engines
+    _worker_slot = slot
+    _cancel_slots = cancel_slots
+    _hash_mb = hash_mb
+    _max_engines = max_engines
+
+
+def _is_cancelled():
+    return _cancel_slots[_worker_slot] == _current_job
+
+
+def _engine_for(game_key, fen, moves):
+    """Lấy (hoặc tạo) engine của ván cờ và đưa bàn cờ về đúng thế cờ của job.
+
+    Chỉ lùi/đi tiếp phần khác nhau giữa lịch sử hiện có và job; bảng chuyển vị của các
+    lần tìm trước trong cùng ván luôn được giữ lại.
+    """
+    from chess_engine import ChessEngine
+
+    engine = _worker_engines.pop(game_key, None)
+    if engine is None:
+        engine = ChessEngine(hash_mb=_hash_mb)
+        engine.stop_callback = _is_cancelled
+    _worker_engines[game_key] = engine
+    while len(_worker_engines) > _max_engines:
+        _worker_engines.popitem(last=False)
+
+    board = engine.board
+    played = [move.uci() for move in board.move_stack]
+    if board.root().fen() != fen:
+        board.set_fen(fen)
+        played = []
+    else:
+        # Lùi về phần chung (ví dụ sau khi pondering đoán sai nước của người chơi)
+        common = 0
+        while common < len(played) and common < len(moves) and played[common] == moves[common]:
+            common += 1
+        for _ in range(len(played) - common):
+            board.pop()
+        played = played[:common]
+    for uci in moves[len(played):]:
+        board.push_uci(uci)
+    return engine
+
+
+def _run_job(job_id, game_key, fen, moves, budget):
+    global _current_job
+    _current_job = job_id
+    try:
+        engine = _engine_for(game_key, fen, moves)
+        engine.use_book = budget.get('use_book', True)
+        if budget.get('hint'):
+            # Gợi ý cho người chơi: thường lấy ngay từ bảng chuyển vị mà các lần tìm trước đã làm nóng
+            limits = {name: budget[name] for name in ('movetime_ms', 'max_depth') if budget.get(name)}
+            lines = engine.get_hint_moves(budget.get('multipv', 1), **limits)
+            return {
+                'move': lines[0]['move'] if lines else None,
+                'lines': lines,
+                'cancelled': _is_cancelled(),
+            }
+        move = engine.search(max_depth=budget.get('max_depth', 64),
+                             movetime_ms=budget.get('movetime_ms'),
+                             max_nodes=budget.get('max_nodes'),
+                             multipv=budget.get('multipv', 1))
+        info = engine.last_search or {}
+        return {
+            'move': move.uci() if move else None,
+            'depth': info.get('depth'),
+            'score': info.get('score'),
+            'pv': [m.uci() for m in info.get('pv', [])],
+            'lines': [{'move': line['move'].uci(), 'score': line['score'], 'pv': [m.uci() for m in line['pv']]}
+                      for line in info.get('lines', [])],
+            'nodes': engine.nodes,
+            'time_ms': info.get('time_ms'),
+            'stats': engine.stats.to_dict(),
+            'cancelled': _is_cancelled(),
+        }
+    finally:
+        _current_job = 0
+
+
+# --- Phần chạy trong tiến trình web ---
+
+class SearchJob:
+    """Kết quả tương lai của một job tìm kiếm."""
+
+    def __init__(self, service, job_id, shard, game_key, future, timeout, background=None):
+        self.service = service
+        self.job_id = job_id
+        self.shard = shard
+        self.game_key = game_key
+        self.future = future
+        self.timeout = timeout
+        # None cho job thường; 'ponder' | 'analysis' cho job ưu tiên thấp, bị hủy khi worker cần cho job thường
+        self.background = background
+
+    def result(self, timeout=None):
+        """Chờ kết quả. Quá hạn thì hủy job và ném SearchTimeout."""
+        try:
+            return self.future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            self.cancel()
+            raise SearchTimeout(f"Search job {self.job_id} timed out")
+        except BrokenProcessPool:
+            # Worker chết giữa chừng; job kế tiếp của worker này sẽ chạy trên tiến trình mới
+            raise SearchUnavailable(f"Search worker died while running job {self.job_id}")
+
+    def cancel(self):
+        """Hủy job: job chưa chạy bị bỏ khỏi hàng đợi, job đang chạy dừng ở lần kiểm tra kế tiếp."""
+        if not self.future.cancel() and not self.future.done():
+            self.service._cancel_slots[self.shard] = self.job_id
+
+    def done(self):
+        return self.future.done()
+
+
+class SearchService:
+    """Nhóm tiến trình worker thực hiện tìm kiếm của AI ngoài luồng xử lý request.
+
+    Mỗi worker là một tiến trình riêng; job của cùng một ván luôn được gửi tới cùng
+    worker để tận dụng bảng chuyển vị của ván đó. Số job đang chờ bị giới hạn:
+    vượt giới hạn chung thì ném SearchQueueFull, một ván gửi quá nhiều job thì ném SearchRateLimited.
+
+    Job pondering (ponder=True) và phân tích (background=True) có độ ưu tiên thấp: chỉ được nhận
+    khi worker của ván đang rảnh (pondering còn phải chưa vượt max_ponder), không tính vào các giới hạn
+    trên, và bị hủy ngay khi một job thường được gửi tới cùng worker; pondering cũng chiếm chỗ của
+    job phân tích. Job bị hủy giữa chừng trả về kết quả với 'cancelled': True.
+
+    Mỗi worker giữ engine (và bảng chuyển vị hash_mb MB) của các ván gần nhất, tổng cộng không quá
+    memory_mb MB; ván cũ hơn bị bỏ và tìm lại từ bảng trống ở lần sau.
+    """
+
+    def __init__(self, workers=None, max_pending=None, max_jobs_per_game=1, hash_mb=16, max_ponder=None,
+                 memory_mb=WORKER_MEMORY_MB):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.max_jobs_per_game = max_jobs_per_game
+        self.max_ponder = max_ponder if max_ponder is not None else max(1, self.workers // 2)
+
+        self.engines_per_worker = max(1, memory_mb // hash_mb)
+        self.hash_mb = hash_mb
+
+        self._context = multiprocessing.get_context('spawn')
+        self._cancel_slots = self._context.Array('q', self.workers, lock=False)
+        self._shards = [self._new_shard(slot) for slot in range(self.workers)]
+        self._shards_lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pending_by_game = {}
+        self._pending_by_shard = [0] * self.workers
+        self._background_jobs = {}  # {job_id: SearchJob} pondering và phân tích
+
+    def _shard_for(self, game_key):
+        return hash(game_key) % self.workers
+
+    def _new_shard(self, slot):
+        return ProcessPoolExecutor(max_workers=1, mp_context=self._context, initializer=_init_worker,
+                                   initargs=(slot, self._cancel_slots, self.hash_mb, self.engines_per_worker))
+
+    def _submit_to_shard(self, shard, *args):
+        """Gửi _run_job tới worker của shard; worker đã chết thì thay bằng tiến trình mới và gửi lại một lần.
+
+        Ném SearchUnavailable nếu tiến trình mới cũng không nhận job.
+        """
+        executor = self._shards[shard]
+        try:
+            return executor.submit(_run_job, *args)
+        except BrokenProcessPool:
+            pass
+        with self._shards_lock:
+            # Request khác có thể đã thay worker này trong lúc chờ khóa
+            if self._shards[shard] is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._shards[shard] = self._new_shard(shard)
+            executor = self._shards[shard]
+        try:
+            return executor.submit(_run_job, *args)
+        except BrokenProcessPool:
+            raise SearchUnavailable(f"Search worker {shard} is unavailable")
+
+    def submit(self, game_key, fen, moves, budget, timeout=None, ponder=False, background=False):
+        """Gửi job (FEN gốc, danh sách nước UCI, ngân sách) và trả về SearchJob.
+
+        budget: {'max_depth': ..., 'movetime_ms': ..., 'max_nodes': ..., 'multipv': 1, 'use_book': True};
+        thêm 'hint': True để lấy gợi ý (ChessEngine.get_hint_moves) thay cho tìm nước đi.
+        Với ponder=True hoặc background=True (phân tích) trả về None nếu worker của ván đang bận.
+        Ném SearchUnavailable nếu worker của ván đã chết và không khởi động lại được.
+        """
+        if ponder or background:
+            return self._submit_background(game_key, fen, moves, budget, 'ponder' if ponder else 'analysis')
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise SearchQueueFull("Search queue is full")
+            if self._pending_by_game.get(game_key, 0) >= self.max_jobs_per_game:
+                raise SearchRateLimited("Too many pending searches for this game")
+            shard = self._shard_for(game_key)
+            self._pending += 1
+            self._pending_by_game[game_key] = self._pending_by_game.get(game_key, 0) + 1
+            self._pending_by_shard[shard] += 1
+
+        job_id = next(self._job_ids)
+        if timeout is None:
+            movetime_ms = budget.get('movetime_ms')
+            timeout = movetime_ms / 1000.0 + TIMEOUT_GRACE if movetime_ms else None
+        try:
+            future = self._submit_to_shard(shard, job_id, game_key, fen, list(moves), budget)
+        except Exception:
+            self._job_finished(game_key)
+            raise
+        future.add_done_callback(lambda _: self._job_finished(game_key))
+        # Nhường worker cho job thật: hủy pondering/phân tích đang chạy hoặc chờ trên cùng worker
+        with self._lock:
+            preempted = [job for job in self._background_jobs.values() if job.shard == shard]
+        for job in preempted:
+            job.cancel()
+        return SearchJob(self, job_id, shard, game_key, future, timeout)
+
+    def _submit_background(self, game_key, fen, moves, budget, kind):
+        shard = self._shard_for(game_key)
+        with self._lock:
+            # Worker phải rảnh (không tính job của chính ván này vừa xong nhưng chưa kịp trừ)
+            busy = self._pending_by_shard[shard] - self._pending_by_game.get(game_key, 0)
+            if busy > 0:
+                return None
+            if kind == 'ponder':
+                if sum(job.background == 'ponder' for job in self._background_jobs.values()) >= self.max_ponder:
+                    return None
+                # Pondering của ván đang chơi được ưu tiên hơn phân tích
+                occupied = [job for job in self._background_jobs.values() if job.shard == shard]
+                if any(job.background == 'ponder' for job in occupied):
+                    return None
+            elif any(job.shard == shard for job in self._background_jobs.values()):
+                return None
+            else:
+                occupied = []
+            job_id = next(self._job_ids)
+            try:
+                future = self._submit_to_shard(shard, job_id, game_key, fen, list(moves), budget)
+            except SearchUnavailable:
+                return None
+            job = SearchJob(self, job_id, shard, game_key, future, None, kind)
+            self._background_jobs[job_id] = job
+        for other in occupied:
+            other.cancel()
+        future.add_done_callback(lambda _: self._background_finished(job_id))
+        return job
+
+    def _background_finished(self, job_id):
+        with self._lock:
+            self._background_jobs.pop(job_id, None)
+
+    def submit_board(self, game_key, board, budget, timeout=None):
+        """Tiện ích: gửi job từ một chess.Board (dùng thế cờ gốc và move_stack)."""
+        return self.submit(game_key, board.root().fen(), [move.uci() for move in board.move_stack],
+                           budget, timeout)
+
+    def _job_finished(self, game_key):
+        with self._lock:
+            self._pending -= 1
+            self._pending_by_shard[self._shard_for(game_key)] -= 1
+            remaining = self._pending_by_game.get(game_key, 0) - 1
+            if remaining > 0:
+                self._pending_by_game[game_key] = remaining
+            else:
+                self._pending_by_game.pop(game_key, None)
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait=True):
+        for executor in self._shards:
+            executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,146 @@
+# backend/search_stats.py
+
+import threading
+import time
+
+
+class SearchStats:
+    """Số liệu của một lần tìm kiếm, do ChessEngine.search điền vào.
+
+    Trong vòng lặp tìm kiếm engine chỉ tăng vài biến đếm số nguyên sẵn có; các chỉ số
+    (NPS, tỉ lệ cắt ở nước đầu, tỉ lệ trúng bảng chuyển vị) chỉ được tính khi đọc.
+    """
+
+    __slots__ = ('nodes', 'qnodes', 'depth', 'seldepth', 'cutoffs', 'first_move_cutoffs',
+                 'tt_probes', 'tt_hits', 'iterations', 'time_ms',
+                 '_start', '_tt_probes_start', '_tt_hits_start')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.depth = 0
+        self.seldepth = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.iterations = []  # [(độ sâu, thời gian vòng đó ms, số node cộng dồn)]
+        self.time_ms = 0
+        self._start = time.monotonic()
+        self._tt_probes_start = 0
+        self._tt_hits_start = 0
+
+    def start(self, tt):
+        self.reset()
+        self._tt_probes_start = tt.probes
+        self._tt_hits_start = tt.hits
+
+    def end_iteration(self, depth, nodes):
+        elapsed_ms = (time.monotonic() - self._start) * 1000
+        previous_ms = sum(iteration[1] for iteration in self.iterations)
+        self.iterations.append((depth, round(elapsed_ms - previous_ms, 2), nodes))
+        self.depth = depth
+
+    def finish(self, nodes, qnodes, tt):
+        self.nodes = nodes
+        self.qnodes = qnodes
+        self.tt_probes = tt.probes - self._tt_probes_start
+        self.tt_hits = tt.hits - self._tt_hits_start
+        self.time_ms = round((time.monotonic() - self._start) * 1000, 2)
+
+    @property
+    def nps(self):
+        return int(self.nodes * 1000 / self.time_ms) if self.time_ms else 0
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def to_dict(self):
+        return {
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'nps': self.nps,
+            'depth': self.depth,
+            'seldepth': self.seldepth,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_rate': round(self.first_move_cutoff_rate, 4),
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_hit_rate': round(self.tt_hit_rate, 4),
+            'time_ms': self.time_ms,
+            'iterations': [{'depth': depth, 'time_ms': time_ms, 'nodes': nodes}
+                           for depth, time_ms, nodes in self.iterations],
+        }
+
+
+class SearchMetrics:
+    """Cộng dồn số liệu tìm kiếm (dict từ SearchStats.to_dict) cho endpoint /metrics dạng Prometheus."""
+
+    COUNTERS = (
+        ('searches', 'chess_search_total', 'Number of completed searches'),
+        ('nodes', 'chess_search_nodes_total', 'Nodes searched (main + quiescence)'),
+        ('qnodes', 'chess_search_qnodes_total', 'Quiescence nodes searched'),
+        ('cutoffs', 'chess_search_cutoffs_total', 'Beta cutoffs'),
+        ('first_move_cutoffs', 'chess_search_first_move_cutoffs_total', 'Beta cutoffs on the first move tried'),
+        ('tt_probes', 'chess_search_tt_probes_total', 'Transposition table probes'),
+        ('tt_hits', 'chess_search_tt_hits_total', 'Transposition table hits'),
+    )
+    # Các ngưỡng (ms) của histogram thời gian tìm kiếm
+    TIME_BUCKETS = (50, 100, 250, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {name: 0 for name, _, _ in self.COUNTERS}
+        self._time_buckets = [0] * len(self.TIME_BUCKETS)
+        self._time_sum = 0.0
+        self._depth_sum = 0
+        self._seldepth_max = 0
+
+    def observe(self, stats):
+        if not stats:
+            return
+        with self._lock:
+            counters = self._counters
+            counters['searches'] += 1
+            for name in ('nodes', 'qnodes', 'cutoffs', 'first_move_cutoffs', 'tt_probes', 'tt_hits'):
+                counters[name] += stats.get(name, 0)
+            time_ms = stats.get('time_ms', 0)
+            self._time_sum += time_ms
+            for i, bound in enumerate(self.TIME_BUCKETS):
+                if time_ms <= bound:
+                    self._time_buckets[i] += 1
+            self._depth_sum += stats.get('depth', 0)
+            self._seldepth_max = max(self._seldepth_max, stats.get('seldepth', 0))
+
+    def render(self):
+        """Văn bản theo định dạng exposition của Prometheus."""
+        with self._lock:
+            lines = []
+            for name, metric, help_text in self.COUNTERS:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self._counters[name]}")
+            searches = self._counters['searches']
+            lines.append("# HELP chess_search_time_ms Search wall time in milliseconds")
+            lines.append("# TYPE chess_search_time_ms histogram")
+            for bound, count in zip(self.TIME_BUCKETS, self._time_buckets):
+                lines.append(f'chess_search_time_ms_bucket{{le="{bound}"}} {count}')
+            lines.append(f'chess_search_time_ms_bucket{{le="+Inf"}} {searches}')
+            lines.append(f"chess_search_time_ms_sum {self._time_sum}")
+            lines.append(f"chess_search_time_ms_count {searches}")
+            lines.append("# HELP chess_search_depth_avg Average completed depth")
+            lines.append("# TYPE chess_search_depth_avg gauge")
+            lines.append(f"chess_search_depth_avg {self._depth_sum / searches if searches else 0}")
+            lines.append("# HELP chess_search_seldepth_max Maximum selective depth seen")
+            lines.append("# TYPE chess_search_seldepth_max gauge")
+            lines.append(f"chess_search_seldepth_max {self._seldepth_max}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,126 @@
+# backend/tablebase.py
+
+import os
+import threading
+from collections import OrderedDict
+
+import chess # type: ignore
+import chess.syzygy # type: ignore
+
+from transposition import position_key
+
+# Thư mục chứa các file Syzygy (.rtbw/.rtbz), có thể đặt qua biến môi trường
+DEFAULT_TABLEBASE_PATH = os.environ.get('CHESS_SYZYGY_PATH')
+
+# Mỗi tiến trình chỉ mở một lần cho mỗi thư mục; mọi engine dùng chung bộ nhớ đệm tra cứu
+_probers = {}
+_probers_lock = threading.Lock()
+
+
+class TablebaseProber:
+    """Tra bảng tàn cuộc Syzygy (WDL/DTZ) từ thư mục cục bộ, có bộ nhớ đệm LRU cho kết quả.
+
+    WDL: 2 = thắng, 1 = thắng nhưng bị luật 50 nước, 0 = hòa, -1/-2 tương ứng cho bên thua,
+    luôn theo góc nhìn bên đang đi.
+    """
+
+    def __init__(self, directory, cache_size=65536):
+        self.directory = directory
+        self.tablebase = chess.syzygy.open_tablebase(directory)
+        # Số quân tối đa có bảng, suy ra từ tên bảng đã nạp (ví dụ "KQvKR" = 4 quân)
+        names = list(self.tablebase.wdl)
+        self.max_pieces = max((len(name) - 1 for name in names), default=0)
+        self.cache_size = cache_size
+        self._wdl_cache = OrderedDict()
+        self._dtz_cache = OrderedDict()
+        self.probes = 0
+        self.cache_hits = 0
+        self.tb_hits = 0
+        self.failures = 0
+
+    def can_probe(self, board):
+        """Chỉ tra được khi số quân không vượt giới hạn và không còn quyền nhập thành."""
+        return (self.max_pieces > 0
+                and chess.popcount(board.occupied) <= self.max_pieces
+                and not board.castling_rights)
+
+    def _probe(self, cache, probe, board):
+        self.probes += 1
+        key = position_key(board)
+        if key in cache:
+            self.cache_hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        try:
+            value = probe(board)
+            self.tb_hits += 1
+        except KeyError:
+            # Thiếu bảng cho tổ hợp quân này
+            self.failures += 1
+            value = None
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def probe_wdl(self, board):
+        return self._probe(self._wdl_cache, self.tablebase.probe_wdl, board)
+
+    def probe_dtz(self, board):
+        return self._probe(self._dtz_cache, self.tablebase.probe_dtz, board)
+
+    def best_move(self, board):
+        """Chọn nước đi theo bảng tàn cuộc ở gốc, không cần tìm kiếm.
+
+        Ưu tiên kết quả WDL tốt nhất; khi thắng chọn nước đưa tới DTZ ngắn nhất (chiếu hết ngay
+        nếu có), khi thua chọn nước kéo dài nhất. Trả về (nước đi, wdl) hoặc None nếu không tra được.
+        """
+        best = None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    key = (2, 1, 0)
+                else:
+                    wdl = self.probe_wdl(board)
+                    dtz = self.probe_dtz(board)
+                    if wdl is None or dtz is None:
+                        return None
+                    our_wdl = -wdl
+                    # DTZ của đối phương: khi thắng là -n (n nhỏ tốt hơn), khi thua là +n (n lớn tốt hơn)
+                    key = (our_wdl, 0, dtz if our_wdl != 0 else 0)
+            finally:
+                board.pop()
+            if best is None or key > best[0]:
+                best = (key, move)
+        if best is None:
+            return None
+        return best[1], best[0][0]
+
+    def stats(self):
+        return {
+            'max_pieces': self.max_pieces,
+            'probes': self.probes,
+            'cache_hits': self.cache_hits,
+            'tb_hits': self.tb_hits,
+            'failures': self.failures,
+        }
+
+    def close(self):
+        self.tablebase.close()
+
+
+def load_tablebase(directory=None, **kwargs):
+    """Mở bảng tàn cuộc nếu thư mục tồn tại và có bảng, ngược lại trả về None."""
+    directory = directory or DEFAULT_TABLEBASE_PATH
+    if not directory or not os.path.isdir(directory):
+        return None
+    directory = os.path.abspath(directory)
+    with _probers_lock:
+        if directory not in _probers:
+            prober = TablebaseProber(directory, **kwargs)
+            if prober.max_pieces == 0:
+                prober.close()
+                prober = None
+            _probers[directory] = prober
+        return _probers[directory]
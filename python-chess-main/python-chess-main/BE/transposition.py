@@ -0,0 +1,112 @@
+# backend/transposition.py
+
+import chess.polyglot # type: ignore
+
+# Loại cận của điểm số lưu trong bảng
+EXACT = 0  # Điểm chính xác
+LOWER = 1  # Cận dưới (fail-high, điểm thật >= score)
+UPPER = 2  # Cận trên (fail-low, điểm thật <= score)
+
+# Ước lượng kích thước một entry trong bộ nhớ Python (đối tượng + tham chiếu trong list)
+ENTRY_BYTES = 128
+
+
+def position_key(board):
+    """Khóa Zobrist (chuẩn Polyglot) của thế cờ: gồm quân, lượt đi, quyền nhập thành và bắt tốt qua đường."""
+    return chess.polyglot.zobrist_hash(board)
+
+
+class TTEntry:
+    __slots__ = ('key', 'depth', 'score', 'flag', 'move', 'generation')
+
+    def __init__(self, key, depth, score, flag, move, generation):
+        self.key = key
+        self.depth = depth
+        self.score = score
+        self.flag = flag
+        self.move = move
+        self.generation = generation
+
+
+class TranspositionTable:
+    """Bảng chuyển vị kích thước cố định, đánh chỉ mục bằng khóa Zobrist.
+
+    Mỗi khóa chỉ có một ô (key & mask). Chính sách thay thế: ô trống, cùng khóa,
+    entry của lần tìm kiếm cũ hơn, hoặc entry có độ sâu không lớn hơn thì bị ghi đè.
+    Bảng được giữ lại giữa các lần gọi get_ai_move trong cùng một ván.
+    """
+
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        slots = max(1, (size_mb * 1024 * 1024) // ENTRY_BYTES)
+        # Làm tròn xuống lũy thừa của 2 để dùng phép AND thay cho phép chia
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        """Xóa toàn bộ bảng và bộ đếm (dùng khi bắt đầu ván mới)."""
+        self.table = [None] * self.size
+        self.used = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def new_search(self):
+        """Tăng thế hệ: entry của các lần tìm kiếm trước được ưu tiên thay thế."""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """Trả về TTEntry nếu khóa có trong bảng, ngược lại None."""
+        self.probes += 1
+        entry = self.table[key & self.mask]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        index = key & self.mask
+        entry = self.table[index]
+
+        if entry is None:
+            self.used += 1
+        elif entry.key == key:
+            # Giữ nước đi tốt nhất cũ nếu lần này không tìm được nước nào
+            if move is None:
+                move = entry.move
+            if depth < entry.depth and entry.generation == self.generation and flag != EXACT:
+                self.rejected += 1
+                return
+        elif entry.generation == self.generation and depth < entry.depth:
+            # Entry sâu hơn của cùng lần tìm kiếm có giá trị hơn
+            self.rejected += 1
+            return
+        else:
+            self.evictions += 1
+
+        self.stores += 1
+        self.table[index] = TTEntry(key, depth, score, flag, move, self.generation)
+
+    def stats(self):
+        """Bộ đếm thống kê để theo dõi hiệu quả bảng."""
+        return {
+            'size_mb': self.size_mb,
+            'slots': self.size,
+            'used': self.used,
+            'probes': self.probes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,282 @@
+# backend/uci.py
+
+"""Giao thức UCI cho ChessEngine: chạy engine như một tiến trình độc lập để đấu với engine khác
+(cutechess-cli, Arena...), tinh chỉnh bằng công cụ chuẩn hoặc profile mà không qua HTTP.
+
+Chạy: python uci.py   (hoặc python -m uci trong thư mục BE)
+
+Hỗ trợ: uci, isready, setoption (Hash, Threads, MultiPV, Ponder, OwnBook), ucinewgame,
+position startpos|fen ... [moves ...], go depth|movetime|wtime/btime/winc/binc/movestogo|nodes|
+infinite|ponder, stop, ponderhit, quit. Tìm kiếm chạy ở luồng riêng để vẫn đọc được stop.
+"""
+
+import sys
+import threading
+import time
+
+import chess # type: ignore
+
+from chess_engine import ChessEngine, MAX_DEPTH, MATE_SCORE, MATE_BOUND
+
+ENGINE_NAME = 'Chess_gameAI'
+ENGINE_AUTHOR = 'Chess_gameAI contributors'
+
+# Trừ hao mỗi nước (ms) cho độ trễ giao tiếp với GUI để không thua vì hết giờ
+MOVE_OVERHEAD_MS = 50
+# Số nước giả định còn lại khi GUI không gửi movestogo
+DEFAULT_MOVES_TO_GO = 30
+HASH_DEFAULT_MB = 16
+HASH_MAX_MB = 4096
+THREADS_MAX = 64
+MULTIPV_MAX = 10
+
+# Tham số số nguyên của lệnh go
+GO_INT_PARAMS = ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes', 'mate')
+GO_FLAGS = ('infinite', 'ponder')
+
+
+def parse_go(tokens):
+    """Tách tham số của lệnh go thành dict, ví dụ {'wtime': 60000, 'ponder': True}."""
+    params = {}
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in GO_FLAGS:
+            params[token] = True
+        elif token in GO_INT_PARAMS and index + 1 < len(tokens):
+            try:
+                params[token] = int(tokens[index + 1])
+            except ValueError:
+                pass
+            index += 1
+        index += 1
+    return params
+
+
+def allocate_time(params, turn):
+    """Ngân sách thời gian (ms) cho nước này, None nếu không giới hạn thời gian."""
+    if 'movetime' in params:
+        return max(1, params['movetime'] - MOVE_OVERHEAD_MS)
+    remaining = params.get('wtime' if turn == chess.WHITE else 'btime')
+    if remaining is None:
+        return None
+    increment = params.get('winc' if turn == chess.WHITE else 'binc', 0)
+    moves_to_go = params.get('movestogo') or DEFAULT_MOVES_TO_GO
+    budget = min(remaining / moves_to_go + increment * 3 / 4, remaining / 2) - MOVE_OVERHEAD_MS
+    return max(1, int(budget))
+
+
+def format_score(score, turn):
+    """Điểm (góc nhìn Trắng) sang dạng UCI theo góc nhìn bên đang đi: 'cp 35' hoặc 'mate -3'."""
+    if turn == chess.BLACK:
+        score = -score
+    if score > MATE_BOUND:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score < -MATE_BOUND:
+        return f"mate -{(MATE_SCORE + score + 1) // 2}"
+    return f"cp {score}"
+
+
+class UciEngine:
+    """Vòng lặp lệnh UCI quanh một ChessEngine."""
+
+    def __init__(self, engine=None, output=None):
+        self.engine = engine or ChessEngine(hash_mb=HASH_DEFAULT_MB)
+        self.engine.stop_callback = self._should_stop
+        self.engine.info_callback = self._send_info
+        self.output = output or sys.stdout
+        self._output_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Được set khi được phép gửi bestmove (go thường; sau ponderhit/stop với ponder; sau stop với infinite)
+        self._release = threading.Event()
+        self._deadline = None
+        self._ponder_budget = None
+        self._search_turn = chess.WHITE
+        self.multipv = 1
+
+    def send(self, line):
+        with self._output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def _should_stop(self):
+        return self._stop.is_set() or (self._deadline is not None and time.monotonic() >= self._deadline)
+
+    def _send_info(self, info):
+        lines = info.get('lines') or [{'score': info.get('score'), 'pv': info.get('pv')}]
+        if self.multipv == 1:
+            lines = lines[:1]
+        time_ms = info.get('time_ms', 0)
+        tt = self.engine.tt
+        for rank, line in enumerate(lines, 1):
+            parts = [f"info depth {info['depth']}", f"seldepth {max(info['depth'], self.engine.stats.seldepth)}"]
+            if self.multipv > 1:
+                parts.append(f"multipv {rank}")
+            if line.get('score') is not None:
+                parts.append(f"score {format_score(line['score'], self._search_turn)}")
+            parts.append(f"nodes {info['nodes']}")
+            parts.append(f"nps {int(info['nodes'] * 1000 / time_ms) if time_ms else 0}")
+            parts.append(f"time {time_ms}")
+            parts.append(f"hashfull {tt.used * 1000 // tt.size}")
+            if line.get('pv'):
+                parts.append("pv " + ' '.join(move.uci() for move in line['pv']))
+            self.send(' '.join(parts))
+
+    # --- Lệnh ---
+
+    def handle(self, line):
+        """Xử lý một dòng lệnh. Trả về False khi nhận quit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {HASH_DEFAULT_MB} min 1 max {HASH_MAX_MB}")
+            self.send(f"option name Threads type spin default 1 min 1 max {THREADS_MAX}")
+            self.send(f"option name MultiPV type spin default 1 min 1 max {MULTIPV_MAX}")
+            self.send("option name Ponder type check default false")
+            self.send(f"option name OwnBook type check default {'true' if self.engine.use_book else 'false'}")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            self._wait()
+            self._set_option(args)
+        elif command == 'ucinewgame':
+            self._wait()
+            self.engine.reset_board()
+        elif command == 'position':
+            self._wait()
+            self._set_position(args)
+        elif command == 'go':
+            self._wait()
+            self._go(parse_go(args))
+        elif command == 'stop':
+            self._stop.set()
+            self._release.set()
+            self._wait()
+        elif command == 'ponderhit':
+            # Người chơi đã đi đúng nước dự đoán: chuyển sang tìm kiếm thường với ngân sách của nước này
+            if self._ponder_budget is not None:
+                self._deadline = time.monotonic() + self._ponder_budget / 1000.0
+            self._ponder_budget = None
+            self._release.set()
+        elif command == 'quit':
+            self._stop.set()
+            self._release.set()
+            self._wait()
+            self.engine.close()
+            return False
+        elif command == 'debug' or command == 'register':
+            pass
+        else:
+            self.send(f"info string unknown command: {command}")
+        return True
+
+    def _set_option(self, args):
+        if 'name' not in args:
+            return
+        name_end = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[args.index('name') + 1:name_end]).lower()
+        value = ' '.join(args[name_end + 1:])
+        try:
+            if name == 'hash':
+                self.engine.set_hash(min(max(1, int(value)), HASH_MAX_MB))
+            elif name == 'threads':
+                self.engine.set_threads(min(max(1, int(value)), THREADS_MAX))
+            elif name == 'multipv':
+                self.multipv = min(max(1, int(value)), MULTIPV_MAX)
+            elif name == 'ownbook':
+                self.engine.use_book = value.lower() == 'true'
+            elif name == 'ponder':
+                pass  # GUI tự gửi go ponder khi bật
+            else:
+                self.send(f"info string unknown option: {name}")
+        except ValueError:
+            self.send(f"info string invalid value for {name}: {value}")
+
+    def _set_position(self, args):
+        board = self.engine.board
+        if 'moves' in args:
+            moves = args[args.index('moves') + 1:]
+            args = args[:args.index('moves')]
+        else:
+            moves = []
+        try:
+            if args and args[0] == 'startpos':
+                board.reset()
+            elif args and args[0] == 'fen':
+                board.set_fen(' '.join(args[1:]))
+            else:
+                return
+            for uci in moves:
+                board.push_uci(uci)
+        except ValueError as exc:
+            self.send(f"info string invalid position: {exc}")
+            board.reset()
+        self.engine.rebuild_captures()
+
+    def _go(self, params):
+        board = self.engine.board
+        self._search_turn = board.turn
+        self._stop.clear()
+        self._deadline = None
+        self._ponder_budget = None
+        budget = allocate_time(params, board.turn)
+        max_depth = min(params.get('depth', MAX_DEPTH), MAX_DEPTH)
+        if 'mate' in params:
+            max_depth = min(max_depth, 2 * params['mate'])
+
+        if params.get('infinite') or params.get('ponder'):
+            # Tìm tới khi có stop (hoặc ponderhit + hết ngân sách); chỉ gửi bestmove khi được phép
+            self._release.clear()
+            if params.get('ponder'):
+                self._ponder_budget = budget
+            movetime_ms = None
+        else:
+            self._release.set()
+            movetime_ms = budget
+
+        self._thread = threading.Thread(target=self._search, args=(max_depth, movetime_ms, params.get('nodes')),
+                                        daemon=True)
+        self._thread.start()
+
+    def _search(self, max_depth, movetime_ms, max_nodes):
+        engine = self.engine
+        try:
+            move = engine.search(max_depth=max_depth, movetime_ms=movetime_ms, max_nodes=max_nodes,
+                                 multipv=self.multipv)
+        except Exception as exc:  # không để luồng tìm kiếm chết mà GUI chờ bestmove mãi
+            self.send(f"info string search error: {exc}")
+            move = None
+        # Với go infinite/ponder, UCI yêu cầu giữ bestmove tới khi có stop/ponderhit
+        self._release.wait()
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        pv = (engine.last_search or {}).get('pv') or [move]
+        if len(pv) > 1 and pv[0] == move:
+            self.send(f"bestmove {move.uci()} ponder {pv[1].uci()}")
+        else:
+            self.send(f"bestmove {move.uci()}")
+
+    def _wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main(input_stream=None):
+    uci = UciEngine()
+    for line in input_stream or sys.stdin:
+        if not uci.handle(line.strip()):
+            break
+    else:
+        uci.handle('quit')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,12 @@
 import pygame # type: ignore
 import os
-import sys 
+import sys
+import time
 
-# Đảm bảo thư mục data nằm trong PATH hoặc sử dụng đường dẫn tương đối
-# from data.classes.Board import Board # Giả định lớp Board tồn tại
-# Nếu bạn chưa có lớp Board, bạn cần tạo nó hoặc thay thế bằng một dummy class.
-class Board:
-    def __init__(self, width, height):
-        # Đây là một lớp giả định (dummy) để mã có thể chạy
-        print("Board object initialized. Assume piece images are loaded.")
-        self.width = width
-        self.height = height
-        self.turn = 'white'
-        self.selected_piece = None
-        self.last_move = None
+import chess # type: ignore
 
-    def draw(self, display):
-        # Vẽ một bàn cờ đơn giản 8x8
-        square_size = self.width // 8
-        colors = [(240, 217, 181), (181, 136, 99)] # Màu bàn cờ gỗ
-        
-        for row in range(8):
-            for col in range(8):
-                color = colors[(row + col) % 2]
-                pygame.draw.rect(display, color, (col * square_size, row * square_size, square_size, square_size))
-        
-        # Thêm Placeholder Text
-        font = pygame.font.SysFont('arial', 70)
-        text = font.render("CHESS BOARD", True, (0, 0, 0, 50))
-        text.set_alpha(50) 
-        display.blit(text, text.get_rect(center=(self.width // 2, self.height // 2)))
-
-    def handle_click(self, mx, my):
-        # Logic xử lý click (chọn/di chuyển quân cờ)
-        print(f"Click at: ({mx}, {my})")
-        pass
+from net_client import NetworkClient, NET_EVENT, SERVER_URL
 
-    def is_in_checkmate(self, color):
-        # Trả về False để game chạy liên tục trong ví dụ này
-        return False
-        
 # --- Khởi tạo Pygame ---
 pygame.init()
 
@@ -47,15 +14,26 @@ pygame.init()
 WINDOW_SIZE = (1000, 1000)
 screen = pygame.display.set_mode(WINDOW_SIZE)
 pygame.display.set_caption("Cờ Vua Chuyên Nghiệp")
+# Chỉ đánh thức vòng lặp với các sự kiện cần xử lý (chuột, phím, cửa sổ, mạng, thoát)
+pygame.event.set_blocked(None)
+pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION, pygame.KEYDOWN,
+                          pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.WINDOWLEAVE, NET_EVENT])
 
 # --- Hằng số Màu sắc & Font ---
-# Cố gắng sử dụng Font có sẵn hoặc fallback
-def get_font(size):
-    try:
-        # Thử sử dụng một font phổ biến (cần có trong hệ thống)
-        return pygame.font.SysFont('Arial', size)
-    except:
-        return pygame.font.SysFont('sans', size)
+# Font được tạo một lần cho mỗi (tên, cỡ chữ) (SysFont phải dò font hệ thống nên rất chậm)
+_fonts = {}
+
+def get_font(size, name='Arial'):
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        try:
+            # Thử sử dụng một font phổ biến (cần có trong hệ thống)
+            font = pygame.font.SysFont(name, size)
+        except:
+            font = pygame.font.SysFont('sans', size)
+        _fonts[key] = font
+    return font
 
 FONT = get_font(40)
 HEADER_FONT = get_font(60)
@@ -69,241 +47,809 @@ HOVER_COLOR = (84, 182, 172)     # Xanh Teal Nhạt hơn
 WHITE = (255, 255, 255)
 BLACK = (33, 33, 33)             # Đen Đậm
 
+# Màu bàn cờ gỗ; ô tô sáng có hai sắc (ô sáng, ô tối)
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+HIGHLIGHT_COLORS = {
+    'selected': ((246, 246, 105), (218, 196, 72)),
+    'last': ((205, 210, 106), (170, 162, 58)),
+    'check': ((235, 97, 80), (205, 70, 60)),
+}
+TARGET_COLOR = (0, 0, 0, 60)
+
+# Bàn cờ 800x800 giữa cửa sổ; phía trên là lượt đi, phía dưới là thông báo
+BOARD_ORIGIN = (100, 100)
+BOARD_SIZE = 800
+
+# Font có ký tự quân cờ Unicode; không có thì vẽ quân bằng chữ cái trong hình tròn
+PIECE_FONTS = 'segoeuisymbol,dejavusans,freeserif,arialunicodems'
+PIECE_GLYPHS = {'K': '♚', 'Q': '♛', 'R': '♜', 'B': '♝', 'N': '♞', 'P': '♟'}
+PIECE_OUTLINES = {'K': '♔', 'Q': '♕', 'R': '♖', 'B': '♗', 'N': '♘', 'P': '♙'}
+
+# Nước đi chưa được server xác nhận sau chừng này giây thì trả về thế cờ đã xác nhận
+PENDING_TIMEOUT = 10
+
+# Dữ liệu cấp độ: (chữ trên nút, tên nút, màu); chữ trên nút cũng là tên cấp độ của backend
+LEVELS = [
+    ("Nhập Môn", "Novice", WHITE),
+    ("Thành Thạo", "Skilled", WHITE),
+    ("Cao Thủ", "Expert", ACCENT_COLOR),
+    ("Kiện Tướng", "Master", (200, 0, 0)) # Đỏ để làm nổi bật
+]
+LEVEL_NAMES = {name: text for text, name, _ in LEVELS}
+
 # --- Trạng thái Game ---
 GAME_STATE = "MENU"
-board = Board(WINDOW_SIZE[0], WINDOW_SIZE[1])
-
-# --- Khai báo Rects (Sẽ được gán giá trị trong các hàm draw_*) ---
-# Sử dụng global để các hàm handle_* có thể truy cập được các Rect này
-machine_button = None
-player_button = None
-# ... và các nút khác
-
-
-# --- Chức năng Vẽ Nút Tương tác ---
-def draw_interactive_button(surface, rect, text, font, base_color, hover_color, text_color, mouse_pos, border_radius=8):
-    """Vẽ nút, thay đổi màu khi di chuột và thêm bo góc."""
-    is_hovering = rect and rect.collidepoint(mouse_pos)
-    color = hover_color if is_hovering else base_color
-    
-    # Vẽ nền nút
-    pygame.draw.rect(surface, color, rect, border_radius=border_radius)
-    # Vẽ viền
-    pygame.draw.rect(surface, BLACK, rect, 2, border_radius=border_radius)
-    
-    # Vẽ chữ
-    text_surf = font.render(text, True, text_color)
-    text_rect = text_surf.get_rect(center=rect.center)
-    surface.blit(text_surf, text_rect)
-    return is_hovering # Trả về trạng thái hover (nếu cần)
+board = None
+room_code = '' # Mã phòng đang gõ ở màn hình Đánh với Người
+
+
+# --- Lớp vẽ: bề mặt vẽ sẵn và cập nhật theo vùng thay đổi ---
+# Chữ đã render theo (font, nội dung, màu): mỗi nhãn chỉ render một lần
+_text_cache = {}
+# Thông báo từ server có nội dung tùy ý nên bộ đệm được giới hạn
+TEXT_CACHE_SIZE = 256
+
+def render_text(font, text, color):
+    key = (id(font), text, color)
+    surface = _text_cache.get(key)
+    if surface is None:
+        if len(_text_cache) >= TEXT_CACHE_SIZE:
+            _text_cache.clear()
+        surface = _text_cache[key] = font.render(text, True, color)
+    return surface
+
+
+class Board:
+    """Bàn cờ của client trên python-chess: chọn/đi quân bằng chuột, chỉ vẽ lại các ô thay đổi.
+
+    Nước đi của người chơi được hiển thị ngay (lạc quan) và chờ server xác nhận: sync() đối chiếu
+    với FEN của server, revert() bỏ nước đi bị server từ chối.
+    """
+
+    def __init__(self, width, height, origin=(0, 0), player_color=None):
+        self.width = width
+        self.height = height
+        self.origin = origin
+        self.square_size = min(width, height) // 8
+        self.position = chess.Board()
+        # Bên do người chơi trên máy này điều khiển; None = cả hai bên
+        self.player_color = player_color
+        self.selected_piece = None # Ô đang chọn
+        self.last_move = None
+        self.pending = None        # Nước đã hiển thị nhưng server chưa xác nhận
+        self.locked = False        # Chờ server (tạo ván, chờ đối thủ) hoặc mất kết nối
+        # (quân, tô sáng, là ô đích) của từng ô đang hiển thị; chỉ ô đổi trạng thái mới vẽ lại
+        self._drawn = {}
+        self._changed = True
+        self._pieces = {}          # Bề mặt quân cờ theo ký hiệu
+        self._target_dot = None
+
+    @property
+    def turn(self):
+        return 'white' if self.position.turn == chess.WHITE else 'black'
+
+    @property
+    def flipped(self):
+        return self.player_color == chess.BLACK
+
+    def set_player_color(self, color):
+        if color != self.player_color:
+            self.player_color = color
+            # Đổi hướng bàn cờ: mọi ô đều phải vẽ lại
+            self._drawn = {}
+            self._changed = True
+
+    # --- Tọa độ ---
+
+    def square_rect(self, square):
+        size = self.square_size
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        col, row = (7 - file, rank) if self.flipped else (file, 7 - rank)
+        return pygame.Rect(self.origin[0] + col * size, self.origin[1] + row * size, size, size)
+
+    def square_at(self, mx, my):
+        col = (mx - self.origin[0]) // self.square_size
+        row = (my - self.origin[1]) // self.square_size
+        if not (0 <= col < 8 and 0 <= row < 8):
+            return None
+        return chess.square(7 - col, row) if self.flipped else chess.square(col, 7 - row)
+
+    # --- Nước đi ---
+
+    def can_move(self):
+        return (not self.locked and self.pending is None and not self.position.is_game_over()
+                and self.player_color in (None, self.position.turn))
+
+    def handle_click(self, mx, my):
+        """Chọn quân hoặc đi quân đã chọn. Trả về UCI của nước vừa đi (để gửi lên server), hoặc None."""
+        square = self.square_at(mx, my)
+        if square is None or not self.can_move():
+            return None
+        if self.selected_piece is not None:
+            move = self._find_move(self.selected_piece, square)
+            if move is not None:
+                self.selected_piece = None
+                self.push(move)
+                return move.uci()
+        piece = self.position.piece_at(square)
+        if piece is not None and piece.color == self.position.turn and square != self.selected_piece:
+            self.selected_piece = square
+        else:
+            self.selected_piece = None
+        self._changed = True
+        return None
+
+    def _find_move(self, from_square, to_square):
+        move = chess.Move(from_square, to_square)
+        piece = self.position.piece_at(from_square)
+        # Phong cấp mặc định thành Hậu
+        if piece is not None and piece.piece_type == chess.PAWN and chess.square_rank(to_square) in (0, 7):
+            move.promotion = chess.QUEEN
+        return move if self.position.is_legal(move) else None
+
+    def push(self, move):
+        """Đi nước của người chơi (hiển thị lạc quan, chờ server xác nhận)."""
+        self.position.push(move)
+        self.last_move = move
+        self.pending = move
+        self._changed = True
+
+    def revert(self):
+        """Bỏ nước đi chưa được xác nhận (server từ chối hoặc lỗi mạng)."""
+        position = self.position
+        if self.pending is not None and position.move_stack and position.peek() == self.pending:
+            position.pop()
+            self.last_move = position.peek() if position.move_stack else None
+        self.pending = None
+        self._changed = True
+
+    def sync(self, fen, last_move=None):
+        """Đồng bộ với thế cờ của server.
+
+        Trùng thế cờ đang hiển thị thì chỉ xác nhận nước đang chờ; bằng thế cờ hiện tại cộng last_move
+        (nước của đối thủ/AI) thì đi thêm nước đó; còn lại dựng lại bàn cờ từ FEN.
+        """
+        position = self.position
+        self.pending = None
+        self._changed = True
+        if position.fen() == fen:
+            return
+        move = chess.Move.from_uci(last_move) if last_move else None
+        self.selected_piece = None
+        if move is not None and position.is_legal(move):
+            position.push(move)
+            if position.fen() == fen:
+                self.last_move = move
+                return
+            position.pop()
+        position.set_fen(fen)
+        self.last_move = move
+
+    def is_in_checkmate(self, color):
+        return self.position.is_checkmate() and self.turn == color
+
+    # --- Vẽ ---
+
+    def draw(self, display):
+        """Vẽ toàn bộ bàn cờ."""
+        self._drawn = {}
+        self._changed = True
+        self.update(display)
+        return pygame.Rect(self.origin, (self.square_size * 8, self.square_size * 8))
+
+    def update(self, display):
+        """Vẽ lại các ô đổi trạng thái kể từ lần vẽ trước; trả về danh sách vùng thay đổi."""
+        if not self._changed:
+            return []
+        self._changed = False
+        position = self.position
+        highlights = {}
+        if self.last_move is not None:
+            highlights[self.last_move.from_square] = highlights[self.last_move.to_square] = 'last'
+        if position.is_check():
+            highlights[position.king(position.turn)] = 'check'
+        targets = ()
+        if self.selected_piece is not None:
+            highlights[self.selected_piece] = 'selected'
+            targets = {move.to_square for move in position.legal_moves if move.from_square == self.selected_piece}
+
+        dirty = []
+        for square in chess.SQUARES:
+            piece = position.piece_at(square)
+            state = (piece.symbol() if piece else None, highlights.get(square), square in targets)
+            if self._drawn.get(square) != state:
+                self._drawn[square] = state
+                dirty.append(self._draw_square(display, square, state))
+        return dirty
+
+    def _draw_square(self, display, square, state):
+        symbol, highlight, target = state
+        rect = self.square_rect(square)
+        light = (chess.square_file(square) + chess.square_rank(square)) % 2 == 1
+        if highlight is None:
+            color = LIGHT_SQUARE if light else DARK_SQUARE
+        else:
+            color = HIGHLIGHT_COLORS[highlight][0 if light else 1]
+        display.fill(color, rect)
+        if target and symbol is not None:
+            # Ô đích có quân bị bắt: vòng tròn quanh quân
+            pygame.draw.circle(display, BLACK, rect.center, self.square_size // 2 - 4, 4)
+        if symbol is not None:
+            surface = self._piece_surface(symbol)
+            display.blit(surface, surface.get_rect(center=rect.center))
+        elif target:
+            dot = self._dot_surface()
+            display.blit(dot, dot.get_rect(center=rect.center))
+        return rect
+
+    def _dot_surface(self):
+        if self._target_dot is None:
+            radius = self.square_size // 6
+            self._target_dot = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(self._target_dot, TARGET_COLOR, (radius, radius), radius)
+        return self._target_dot
+
+    def _piece_surface(self, symbol):
+        surface = self._pieces.get(symbol)
+        if surface is not None:
+            return surface
+        font = get_font(self.square_size * 4 // 5, PIECE_FONTS)
+        kind = symbol.upper()
+        is_white = symbol.isupper()
+        if font.metrics(PIECE_GLYPHS[kind])[0] is not None:
+            # Quân đặc màu trắng/đen; quân Trắng thêm nét viền từ ký tự rỗng
+            surface = font.render(PIECE_GLYPHS[kind], True, WHITE if is_white else BLACK)
+            if is_white and font.metrics(PIECE_OUTLINES[kind])[0] is not None:
+                outline = font.render(PIECE_OUTLINES[kind], True, BLACK)
+                surface.blit(outline, outline.get_rect(center=surface.get_rect().center))
+        else:
+            size = self.square_size * 3 // 4
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            center = (size // 2, size // 2)
+            pygame.draw.circle(surface, WHITE if is_white else BLACK, center, size // 2)
+            pygame.draw.circle(surface, BLACK if is_white else WHITE, center, size // 2, 3)
+            label = get_font(size * 2 // 3).render(kind, True, BLACK if is_white else WHITE)
+            surface.blit(label, label.get_rect(center=center))
+        self._pieces[symbol] = surface
+        return surface
+
+
+class Label:
+    """Dòng chữ thay đổi được; chỉ vẽ lại khi nội dung đổi."""
+
+    def __init__(self, font, color, **anchor):
+        self.font = font
+        self.color = color
+        self.anchor = anchor # Ví dụ topleft=(50, 10) hoặc center=(500, 950)
+        self.text = ''
+        self.rect = None     # Vùng chữ đang hiển thị
+        self.changed = True
+
+    def set(self, text):
+        if text != self.text:
+            self.text = text
+            self.changed = True
+
+    def draw(self, display, background):
+        """Xóa chữ cũ bằng nền rồi vẽ chữ mới; trả về vùng thay đổi, None nếu không đổi."""
+        if not self.changed:
+            return None
+        self.changed = False
+        dirty = self.rect
+        if dirty is not None:
+            display.blit(background, dirty, dirty)
+        self.rect = None
+        if self.text:
+            surface = render_text(self.font, self.text, self.color)
+            self.rect = surface.get_rect(**self.anchor)
+            display.blit(surface, self.rect)
+            dirty = self.rect.union(dirty) if dirty else self.rect
+        return dirty
+
+
+class Button:
+    """Nút bo góc với hai bề mặt vẽ sẵn (thường và khi di chuột)."""
+
+    def __init__(self, rect, text, font, base_color, hover_color, text_color, border_radius=8):
+        self.rect = pygame.Rect(rect)
+        self.hovering = False
+        label = render_text(font, text, text_color)
+        self._surfaces = (self._render(base_color, label, border_radius),
+                          self._render(hover_color, label, border_radius))
+
+    def _render(self, color, label, border_radius):
+        surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        local = surface.get_rect()
+        # Vẽ nền nút
+        pygame.draw.rect(surface, color, local, border_radius=border_radius)
+        # Vẽ viền
+        pygame.draw.rect(surface, BLACK, local, 2, border_radius=border_radius)
+        # Vẽ chữ
+        surface.blit(label, label.get_rect(center=local.center))
+        return surface
+
+    def update_hover(self, mouse_pos):
+        """Cập nhật trạng thái hover; trả về True nếu nút cần vẽ lại."""
+        hovering = self.rect.collidepoint(mouse_pos)
+        if hovering == self.hovering:
+            return False
+        self.hovering = hovering
+        return True
+
+    def draw(self, display):
+        display.blit(self._surfaces[self.hovering], self.rect)
+        return self.rect
+
+
+class Screen:
+    """Một màn hình: nền tĩnh (màu nền, chữ) vẽ sẵn một lần, các nút và nhãn động theo tên.
+
+    Chỉ vẽ toàn bộ khi chuyển màn hình; di chuột chỉ vẽ lại các nút đổi trạng thái hover,
+    nhãn động chỉ vẽ lại khi nội dung đổi.
+    """
+
+    def __init__(self, labels=(), buttons=None, dynamic_labels=None):
+        self.buttons = buttons or {}
+        self.labels = dynamic_labels or {}
+        self.background = pygame.Surface(WINDOW_SIZE)
+        self.background.fill(BACKGROUND_COLOR)
+        for surface, center in labels:
+            self.background.blit(surface, surface.get_rect(center=center))
+
+    def set_label(self, name, text):
+        self.labels[name].set(text)
+
+    def draw(self, display, mouse_pos):
+        """Vẽ toàn bộ màn hình."""
+        display.blit(self.background, (0, 0))
+        for label in self.labels.values():
+            label.rect = None
+            label.changed = True
+            label.draw(display, self.background)
+        for button in self.buttons.values():
+            button.update_hover(mouse_pos)
+            button.draw(display)
+
+    def update(self, display, mouse_pos):
+        """Vẽ lại phần thay đổi; trả về danh sách vùng cần đẩy ra màn hình."""
+        dirty = []
+        for label in self.labels.values():
+            rect = label.draw(display, self.background)
+            if rect is not None:
+                dirty.append(rect)
+        for button in self.buttons.values():
+            if button.update_hover(mouse_pos):
+                display.blit(self.background, button.rect, button.rect)
+                dirty.append(button.draw(display))
+        return dirty
+
+    def button_at(self, pos):
+        for name, button in self.buttons.items():
+            if button.rect.collidepoint(pos):
+                return name
+        return None
+
+
+def _lighter(color, amount=30):
+    return tuple(min(255, channel + amount) for channel in color)
+
+
+def build_menu():
+    button_width, button_height = 400, 80
+    center_x = WINDOW_SIZE[0] // 2
+    return Screen(
+        labels=[
+            # Tiêu đề
+            (render_text(HEADER_FONT, "CHESS VIETNAM", BLACK), (center_x, 150)),
+            # Footer
+            (render_text(SMALL_FONT, "Made with Pygame", (100, 100, 100)), (center_x, WINDOW_SIZE[1] - 50)),
+        ],
+        buttons={
+            'machine': Button((center_x - button_width // 2, 350, button_width, button_height),
+                              "Đánh với Máy (AI)", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE),
+            'player': Button((center_x - button_width // 2, 500, button_width, button_height),
+                             "Đánh với Người", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE),
+        })
+
+
+def build_level_selection():
+    button_width, button_height = 350, 65
+    center_x = WINDOW_SIZE[0] // 2
+    y_start = 250
+    spacing = 85
+
+    buttons = {}
+    for i, (text, name, color) in enumerate(LEVELS):
+        hover = HOVER_COLOR if color == WHITE else _lighter(color)
+        buttons[name] = Button((center_x - button_width // 2, y_start + i * spacing, button_width, button_height),
+                               text, SMALL_FONT, color, hover, BLACK)
+    # Nút Quay lại
+    buttons['back'] = Button((50, WINDOW_SIZE[1] - 80, 150, 50), "Quay lại", SMALL_FONT,
+                             (150, 150, 150), (180, 180, 180), BLACK)
+    return Screen(labels=[(render_text(HEADER_FONT, "CHỌN CẤP ĐỘ AI", BLACK), (center_x, 100))], buttons=buttons)
+
+
+def build_mode_selection():
+    button_width, button_height = 400, 80
+    center_x = WINDOW_SIZE[0] // 2
+    return Screen(
+        labels=[
+            (render_text(HEADER_FONT, "ĐÁNH VỚI NGƯỜI", BLACK), (center_x, 150)),
+            # Hướng dẫn vào phòng có sẵn và địa chỉ server
+            (render_text(SMALL_FONT, "Gõ mã phòng rồi bấm Tạo phòng / Gia nhập để vào phòng.", (100, 100, 100)),
+             (center_x, 650)),
+            (render_text(SMALL_FONT, f"Server: {SERVER_URL}", (100, 100, 100)), (center_x, 800)),
+        ],
+        buttons={
+            'random': Button((center_x - button_width // 2, 350, button_width, button_height),
+                             "Ngẫu nhiên (Online)", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE),
+            'create_room': Button((center_x - button_width // 2, 500, button_width, button_height),
+                                  "Tạo phòng / Gia nhập", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE),
+            # Nút Quay lại
+            'back': Button((50, WINDOW_SIZE[1] - 80, 150, 50), "Quay lại", SMALL_FONT,
+                           (150, 150, 150), (180, 180, 180), BLACK),
+        },
+        dynamic_labels={
+            'room_code': Label(FONT, PRIMARY_COLOR, center=(center_x, 720)),
+        })
+
+
+class GameScreen(Screen):
+    """Màn hình Game: bàn cờ vẽ theo ô thay đổi, lượt đi, thông báo và nút Quay lại Menu."""
+
+    def __init__(self, board):
+        super().__init__(
+            buttons={
+                'menu': Button((WINDOW_SIZE[0] - 200, 10, 150, 50), "MENU", SMALL_FONT,
+                               (200, 50, 50), (255, 70, 70), WHITE),
+            },
+            dynamic_labels={
+                'turn': Label(FONT, BLACK, topleft=(50, 10)),
+                'message': Label(SMALL_FONT, BLACK, center=(WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] - 50)),
+            })
+        self.board = board
+
+    def draw(self, display, mouse_pos):
+        self.set_label('turn', f"Lượt đi: {self.board.turn.capitalize()}")
+        super().draw(display, mouse_pos)
+        self.board.draw(display)
+
+    def update(self, display, mouse_pos):
+        # Hiển thị Lượt đi; nhãn chỉ vẽ lại khi lượt đổi
+        self.set_label('turn', f"Lượt đi: {self.board.turn.capitalize()}")
+        return super().update(display, mouse_pos) + self.board.update(display)
+
+
+class GameSession:
+    """Ván đang chơi với backend: gửi nước đi qua NetworkClient và xử lý phản hồi (sự kiện NET_EVENT).
+
+    Mỗi ván mới tăng `generation`; phản hồi mang generation cũ (của ván đã rời) bị bỏ qua.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.mode = None      # 'AI' | 'ONLINE'
+        self.game_id = None
+        self.board = None
+        self.message = ''
+        self.generation = 0
+        self.sent_at = None   # Thời điểm gửi nước đi đang chờ xác nhận
+        self.confirmed_fen = chess.STARTING_FEN
+
+    def _new_game(self, mode, player_color, message):
+        self.leave()
+        self.mode = mode
+        self.game_id = None
+        self.sent_at = None
+        self.confirmed_fen = chess.STARTING_FEN
+        self.board = Board(BOARD_SIZE, BOARD_SIZE, BOARD_ORIGIN, player_color)
+        self.board.locked = True
+        self.message = message
+        return self.board
+
+    def start_ai(self, level):
+        board = self._new_game('AI', chess.WHITE, f"Đang tạo ván với AI {level}...")
+        self.network.request('POST', '/api/start_ai', {'level': level}, tag=('start_ai', self.generation))
+        return board
+
+    def find_random(self):
+        board = self._new_game('ONLINE', chess.WHITE, "Đang tìm đối thủ...")
+        self.network.send({'action': 'match_random'}, tag=('ws', self.generation))
+        return board
+
+    def create_room(self):
+        board = self._new_game('ONLINE', chess.WHITE, "Đang tạo phòng...")
+        self.network.send({'action': 'create_room'}, tag=('ws', self.generation))
+        return board
+
+    def join_room(self, code):
+        board = self._new_game('ONLINE', chess.BLACK, f"Đang vào phòng {code}...")
+        self.network.send({'action': 'join_room', 'room_code': code}, tag=('ws', self.generation))
+        return board
+
+    def leave(self):
+        if self.mode == 'ONLINE':
+            # Đóng WebSocket: server hủy hàng chờ ghép đôi và báo đối thủ
+            self.network.disconnect()
+        self.generation += 1
+        self.mode = None
+        self.board = None
+        self.sent_at = None
+
+    def play(self, uci):
+        """Gửi nước đi vừa hiển thị lạc quan trên bàn cờ."""
+        self.sent_at = time.monotonic()
+        if self.mode == 'AI':
+            self.message = "AI đang suy nghĩ..."
+            self.network.request('POST', f"/api/ai_move/{self.game_id}",
+                                 {'uci': uci, 'delta': True, 'legal_moves': False},
+                                 tag=('ai_move', self.generation))
+        else:
+            self.network.send({'action': 'move', 'game_id': self.game_id, 'uci': uci},
+                              tag=('ws', self.generation))
+
+    # --- Phản hồi từ server ---
+
+    def handle(self, event):
+        """Xử lý một sự kiện NET_EVENT; trả về True nếu ván thay đổi."""
+        name, generation = event.tag
+        if self.board is None or generation != self.generation:
+            return False
+        if event.kind in ('error', 'closed'):
+            self.board.revert()
+            self.sent_at = None
+            if event.kind == 'error':
+                self.message = f"Lỗi kết nối: {event.data.get('error')}"
+            else:
+                self.message = "Server đã đóng kết nối."
+            # Ván AI vẫn gửi lại được nước đi; ván Online cần kết nối mới
+            if self.mode == 'ONLINE' or self.game_id is None:
+                self.board.locked = True
+            return True
+        if event.kind == 'http':
+            return self._handle_http(name, event.status, event.data)
+        return self._handle_ws(event.data)
+
+    def _handle_http(self, name, status, data):
+        if status != 200:
+            # Server đã hoàn tác nước đi của người chơi (AI bận/quá tải): bỏ nước lạc quan để đi lại
+            self.board.revert()
+            self.sent_at = None
+            self.message = f"Lỗi server ({status}): {data.get('error', '')}"
+            return True
+        if name == 'start_ai':
+            self.game_id = data['game_id']
+            self.board.locked = False
+            self._apply(data['status'])
+            self.message = "Bạn cầm quân Trắng."
+        else:
+            self._apply(data)
+            self.message = ''
+        self._check_game_over()
+        return True
+
+    def _handle_ws(self, data):
+        board = self.board
+        status = data.get('status')
+        if status == 'waiting':
+            self.message = "Đang chờ đối thủ..."
+        elif status == 'room_created':
+            self.game_id = data['game_id']
+            self._apply(data['game_status'])
+            self.message = f"Mã phòng: {data['room_code']} - đang chờ đối thủ..."
+        elif status in ('room_joined', 'matched'):
+            self.game_id = data['game_id']
+            color = chess.WHITE if data['player_color'] == 'white' else chess.BLACK
+            board.set_player_color(color)
+            board.locked = False
+            self._apply(data['game_status'])
+            self.message = f"Bạn cầm quân {'Trắng' if color == chess.WHITE else 'Đen'}."
+        elif status == 'player_joined':
+            board.locked = False
+            self.message = "Đối thủ đã vào phòng."
+        elif status == 'player_left':
+            board.locked = True
+            self.message = "Đối thủ đã rời ván."
+        elif status in ('update', 'history'):
+            self._apply(data['game_status'])
+            self.message = ''
+        elif status == 'error':
+            board.revert()
+            self.sent_at = None
+            self.message = f"Lỗi: {data.get('message', '')}"
+        else:
+            return False
+        self._check_game_over()
+        return True
+
+    def _apply(self, status):
+        """Đối chiếu bàn cờ với trạng thái của server (bản đầy đủ hoặc rút gọn)."""
+        self.board.sync(status['fen'], status.get('last_move'))
+        self.confirmed_fen = status['fen']
+        self.sent_at = None
+
+    def _check_game_over(self):
+        position = self.board.position
+        if not position.is_game_over():
+            return
+        if position.is_checkmate():
+            self.message = "Trắng thắng!" if position.turn == chess.BLACK else "Đen thắng!"
+        else:
+            self.message = "Hòa!"
+
+    # --- Nước đi không được xác nhận ---
+
+    def timeout_ms(self):
+        """Số ms tới khi nước đi đang chờ hết hạn; None nếu không có nước nào chờ."""
+        if self.sent_at is None:
+            return None
+        return max(1, int((self.sent_at + PENDING_TIMEOUT - time.monotonic()) * 1000))
+
+    def check_timeout(self):
+        """Server không phản hồi nước đi (ví dụ từ chối mà không báo lỗi): về thế cờ đã xác nhận."""
+        if self.sent_at is None or time.monotonic() < self.sent_at + PENDING_TIMEOUT:
+            return False
+        self.sent_at = None
+        self.board.revert()
+        self.board.sync(self.confirmed_fen)
+        self.message = "Server không xác nhận nước đi."
+        return True
+
+
+SCREENS = {
+    "MENU": build_menu(),
+    "LEVEL_SELECTION": build_level_selection(),
+    "MODE_SELECTION": build_mode_selection(),
+}
+# Màn hình Game được dựng lại mỗi khi có bàn cờ mới
+game_screen = None
+
+def current_screen():
+    global game_screen
+    if GAME_STATE.startswith("GAME"):
+        if game_screen is None or game_screen.board is not board:
+            game_screen = GameScreen(board)
+        return game_screen
+    return SCREENS[GAME_STATE]
+
+
+# --- Kết nối tới backend (luồng nền) ---
+network = NetworkClient()
+session = GameSession(network)
+
 
 # --- Chức năng Xử lý Menu ---
 def handle_menu_click(mouse_x, mouse_y):
-    global GAME_STATE, board, machine_button, player_button
-    
-    if machine_button and machine_button.collidepoint(mouse_x, mouse_y):
+    global GAME_STATE
+
+    clicked = SCREENS["MENU"].button_at((mouse_x, mouse_y))
+    if clicked == 'machine':
         GAME_STATE = "LEVEL_SELECTION"
-    
-    elif player_button and player_button.collidepoint(mouse_x, mouse_y):
+
+    elif clicked == 'player':
         GAME_STATE = "MODE_SELECTION"
 
 def handle_level_selection_click(mouse_x, mouse_y):
-    global GAME_STATE, board, novice_button, skilled_button, expert_button, master_button, back_level_button
-    
-    level_buttons = {
-        'Novice': novice_button,
-        'Skilled': skilled_button,
-        'Expert': expert_button,
-        'Master': master_button
-    }
-    
-    for level_name, button in level_buttons.items():
-        if button and button.collidepoint(mouse_x, mouse_y):
-            print(f"Bắt đầu game với AI cấp độ: {level_name}")
-            board = Board(WINDOW_SIZE[0], WINDOW_SIZE[1]) 
-            GAME_STATE = "GAME_AI"
-            return 
-            
-    if back_level_button and back_level_button.collidepoint(mouse_x, mouse_y):
+    global GAME_STATE, board
+
+    clicked = SCREENS["LEVEL_SELECTION"].button_at((mouse_x, mouse_y))
+    if clicked in LEVEL_NAMES:
+        print(f"Bắt đầu game với AI cấp độ: {clicked}")
+        board = session.start_ai(LEVEL_NAMES[clicked])
+        GAME_STATE = "GAME_AI"
+
+    elif clicked == 'back':
         GAME_STATE = "MENU"
 
 def handle_mode_selection_click(mouse_x, mouse_y):
-    global GAME_STATE, board, random_button, create_room_button, back_mode_button
-    
-    if random_button and random_button.collidepoint(mouse_x, mouse_y):
+    global GAME_STATE, board, room_code
+
+    clicked = SCREENS["MODE_SELECTION"].button_at((mouse_x, mouse_y))
+    if clicked == 'random':
         print("Đang tìm kiếm người chơi ngẫu nhiên...")
-        board = Board(WINDOW_SIZE[0], WINDOW_SIZE[1])
-        GAME_STATE = "GAME_LOCAL" 
-    
-    elif create_room_button and create_room_button.collidepoint(mouse_x, mouse_y):
-        print("Mở giao diện Tạo phòng...")
-        board = Board(WINDOW_SIZE[0], WINDOW_SIZE[1])
-        GAME_STATE = "GAME_LOCAL"
-
-    elif back_mode_button and back_mode_button.collidepoint(mouse_x, my):
+        board = session.find_random()
+        GAME_STATE = "GAME_ONLINE"
+
+    elif clicked == 'create_room':
+        # Đã gõ mã phòng thì vào phòng đó, chưa thì tạo phòng mới
+        board = session.join_room(room_code) if room_code else session.create_room()
+        room_code = ''
+        SCREENS["MODE_SELECTION"].set_label('room_code', '')
+        GAME_STATE = "GAME_ONLINE"
+
+    elif clicked == 'back':
         GAME_STATE = "MENU"
-		
-def draw_menu(display, mouse_pos):
-    global machine_button, player_button
-    display.fill(BACKGROUND_COLOR)
-    
-    # Tiêu đề
-    title_text = HEADER_FONT.render("CHESS VIETNAM", True, BLACK)
-    display.blit(title_text, title_text.get_rect(center=(WINDOW_SIZE[0] // 2, 150)))
-    
-    # Định nghĩa và Vẽ các nút
-    button_width, button_height = 400, 80
-    center_x = WINDOW_SIZE[0] // 2
-    
-    machine_button = pygame.Rect(center_x - button_width // 2, 350, button_width, button_height)
-    player_button = pygame.Rect(center_x - button_width // 2, 500, button_width, button_height)
-    
-    draw_interactive_button(display, machine_button, "Đánh với Máy (AI)", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE, mouse_pos)
-    draw_interactive_button(display, player_button, "Đánh với Người", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE, mouse_pos)
-    
-    # Footer
-    footer_text = SMALL_FONT.render("Made with Pygame", True, (100, 100, 100))
-    display.blit(footer_text, footer_text.get_rect(center=(WINDOW_SIZE[0] // 2, WINDOW_SIZE[1] - 50)))
-
-def draw_level_selection(display, mouse_pos):
-    global novice_button, skilled_button, expert_button, master_button, back_level_button
-    display.fill(BACKGROUND_COLOR)
-    
-    # Tiêu đề
-    title_text = HEADER_FONT.render("CHỌN CẤP ĐỘ AI", True, BLACK)
-    display.blit(title_text, title_text.get_rect(center=(WINDOW_SIZE[0] // 2, 100)))
-    
-    # Dữ liệu cấp độ
-    levels = [
-        ("Nhập Môn", "Novice", WHITE),
-        ("Thành Thạo", "Skilled", WHITE),
-        ("Cao Thủ", "Expert", ACCENT_COLOR),
-        ("Kiện Tướng", "Master", (200, 0, 0)) # Đỏ để làm nổi bật
-    ]
-    
-    button_width, button_height = 350, 65
-    center_x = WINDOW_SIZE[0] // 2
-    y_start = 250
-    spacing = 85
 
-    novice_button = pygame.Rect(center_x - button_width // 2, y_start, button_width, button_height)
-    skilled_button = pygame.Rect(center_x - button_width // 2, y_start + spacing, button_width, button_height)
-    expert_button = pygame.Rect(center_x - button_width // 2, y_start + 2 * spacing, button_width, button_height)
-    master_button = pygame.Rect(center_x - button_width // 2, y_start + 3 * spacing, button_width, button_height)
-    
-    buttons = [novice_button, skilled_button, expert_button, master_button]
+def handle_mode_selection_key(event):
+    global room_code
 
-    for i, (text, _, color) in enumerate(levels):
-        draw_interactive_button(display, buttons[i], text, SMALL_FONT, color, HOVER_COLOR if color == WHITE else (color[0] + 30, color[1] + 30, color[2] + 30), BLACK, mouse_pos)
+    if event.key == pygame.K_BACKSPACE:
+        room_code = room_code[:-1]
+    elif event.unicode.isdigit() and len(room_code) < 6:
+        room_code += event.unicode
+    SCREENS["MODE_SELECTION"].set_label('room_code', f"Mã phòng: {room_code}" if room_code else '')
 
-    # Nút Quay lại
-    back_level_button = pygame.Rect(50, WINDOW_SIZE[1] - 80, 150, 50)
-    draw_interactive_button(display, back_level_button, "Quay lại", SMALL_FONT, (150, 150, 150), (180, 180, 180), BLACK, mouse_pos)
-
-def draw_mode_selection(display, mouse_pos):
-    global random_button, create_room_button, back_mode_button
-    display.fill(BACKGROUND_COLOR)
-    
-    # Tiêu đề
-    title_text = HEADER_FONT.render("ĐÁNH VỚI NGƯỜI", True, BLACK)
-    display.blit(title_text, title_text.get_rect(center=(WINDOW_SIZE[0] // 2, 150)))
-    
-    # Định nghĩa và Vẽ các nút
-    button_width, button_height = 400, 80
-    center_x = WINDOW_SIZE[0] // 2
-    
-    random_button = pygame.Rect(center_x - button_width // 2, 350, button_width, button_height)
-    create_room_button = pygame.Rect(center_x - button_width // 2, 500, button_width, button_height)
-    
-    draw_interactive_button(display, random_button, "Ngẫu nhiên (Online)", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE, mouse_pos)
-    draw_interactive_button(display, create_room_button, "Tạo phòng / Gia nhập", FONT, PRIMARY_COLOR, HOVER_COLOR, WHITE, mouse_pos)
-    
-    # Ghi chú về mạng
-    note_text = SMALL_FONT.render("Tính năng Online yêu cầu triển khai Server/Client.", True, (150, 0, 0))
-    display.blit(note_text, note_text.get_rect(center=(center_x, 650)))
-    
-    # Nút Quay lại
-    back_mode_button = pygame.Rect(50, WINDOW_SIZE[1] - 80, 150, 50)
-    draw_interactive_button(display, back_mode_button, "Quay lại", SMALL_FONT, (150, 150, 150), (180, 180, 180), BLACK, mouse_pos)
-
-def draw_game(display, mouse_pos):
-    """Vẽ màn hình Game (Bàn cờ và Bảng thông tin)."""
-    display.fill(BACKGROUND_COLOR) 
-    
-    # Bàn cờ chiếm gần hết màn hình
-    board.draw(display) 
-
-    # --- Bảng Thông tin (Menu trong Game) ---
-    
-    # Hiển thị Lượt đi
-    turn_text = FONT.render(f"Lượt đi: {board.turn.capitalize()}", True, BLACK)
-    display.blit(turn_text, (50, 10))
-    
-    # Nút Quay lại Menu
-    quit_button = pygame.Rect(WINDOW_SIZE[0] - 200, 10, 150, 50)
-    draw_interactive_button(display, quit_button, "MENU", SMALL_FONT, (200, 50, 50), (255, 70, 70), WHITE, mouse_pos)
-    
-    return quit_button
 # --- Vòng lặp Chính ---
+# Vẽ theo nhu cầu: ngủ chờ sự kiện khi không có gì thay đổi, vẽ toàn màn hình chỉ khi đổi
+# màn hình/bàn cờ hoặc cửa sổ cần vẽ lại, còn lại chỉ đẩy các vùng thay đổi ra màn hình.
+# Mạng chạy ở luồng nền (net_client): phản hồi tới dưới dạng NET_EVENT và đánh thức vòng lặp.
 running = True
-clock = pygame.time.Clock() # Dùng clock để kiểm soát FPS
+shown = None # Màn hình đang hiển thị; khác màn hình hiện tại thì vẽ lại toàn bộ
+mouse_pos = pygame.mouse.get_pos()
 
 while running:
-    # Lấy vị trí chuột
-    mx, my = pygame.mouse.get_pos()
-    quit_rect = None
+    # Chặn tới khi có sự kiện (không tốn CPU khi rảnh), rồi gom mọi sự kiện đang chờ;
+    # có nước đi chờ server xác nhận thì chỉ chờ tới hạn của nước đó
+    timeout = session.timeout_ms()
+    first = pygame.event.wait(timeout) if timeout is not None else pygame.event.wait()
+    events = [first] + pygame.event.get()
 
-    for event in pygame.event.get():
+    for event in events:
         if event.type == pygame.QUIT:
             running = False
 
+        elif event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+            shown = None
+
+        elif event.type == pygame.MOUSEMOTION:
+            mouse_pos = event.pos
+
+        elif event.type == pygame.WINDOWLEAVE:
+            # Chuột rời cửa sổ thì coi như không hover nút nào
+            mouse_pos = (-1, -1)
+
+        elif event.type == NET_EVENT:
+            session.handle(event)
+
+        elif event.type == pygame.KEYDOWN:
+            if GAME_STATE == "MODE_SELECTION":
+                handle_mode_selection_key(event)
+
         elif event.type == pygame.MOUSEBUTTONDOWN:
+            mouse_pos = event.pos
             if event.button == 1:
+                mx, my = event.pos
                 # Xử lý click dựa trên trạng thái game
                 if GAME_STATE == "MENU":
                     handle_menu_click(mx, my)
-                
+
                 elif GAME_STATE == "LEVEL_SELECTION":
                     handle_level_selection_click(mx, my)
 
                 elif GAME_STATE == "MODE_SELECTION":
                     handle_mode_selection_click(mx, my)
-                
-                elif GAME_STATE.startswith("GAME"): 
+
+                elif GAME_STATE.startswith("GAME"):
                     # Kiểm tra nút Quay lại Menu
-                    if quit_rect and quit_rect.collidepoint(mx, my):
+                    if current_screen().button_at((mx, my)) == 'menu':
+                        session.leave()
                         GAME_STATE = "MENU"
                         print("Quay lại Menu.")
-                        continue 
-                        
-                    # Xử lý click bàn cờ
-                    board.handle_click(mx, my)
-
-    # --- Cập nhật Trạng thái Game và Vẽ ---
-    
-    if GAME_STATE == "MENU":
-        draw_menu(screen, (mx, my))
-    
-    elif GAME_STATE == "LEVEL_SELECTION":
-        draw_level_selection(screen, (mx, my))
-    
-    elif GAME_STATE == "MODE_SELECTION":
-        draw_mode_selection(screen, (mx, my))
-
-    elif GAME_STATE.startswith("GAME"):
-        quit_rect = draw_game(screen, (mx, my))
-
-        # Kiểm tra điều kiện thắng
-        if board.is_in_checkmate('black'):
-            print('White wins!')
-            # Có thể chuyển sang màn hình "Game Over" thay vì Menu
-            GAME_STATE = "MENU" 
-        elif board.is_in_checkmate('white'):
-            print('Black wins!')
-            GAME_STATE = "MENU" 
-    
-    pygame.display.update()
-    clock.tick(60) # Giới hạn 60 FPS để giảm tải CPU
+                        continue
+
+                    # Xử lý click bàn cờ: nước đi hiện ngay, gửi lên server ở luồng nền
+                    uci = board.handle_click(mx, my)
+                    if uci is not None:
+                        session.play(uci)
+
+    if not running:
+        break
+    session.check_timeout()
+
+    # --- Vẽ ---
+    active = current_screen()
+    if active is game_screen:
+        active.set_label('message', session.message)
+    if active is not shown:
+        active.draw(screen, mouse_pos)
+        pygame.display.flip()
+        shown = active
+    else:
+        dirty = active.update(screen, mouse_pos)
+        if dirty:
+            pygame.display.update(dirty)
 
+network.close()
 pygame.quit()
-sys.exit()
\ No newline at end of file
+sys.exit()
@@ -0,0 +1,180 @@
+"""Lớp mạng của client pygame: một luồng nền chạy vòng lặp asyncio, giữ kết nối HTTP keep-alive
+và WebSocket /ws/multiplayer tới backend.
+
+Vòng lặp vẽ không bao giờ chờ mạng: request() và send() chỉ xếp việc cho luồng nền rồi trả về ngay.
+Kết quả tới sau dưới dạng sự kiện NET_EVENT trong hàng đợi của pygame (đồng thời đánh thức
+pygame.event.wait), với các thuộc tính:
+    kind    'http' (phản hồi HTTP, kèm status), 'ws' (message từ server), 'error' (lỗi mạng),
+            'closed' (WebSocket đã đóng)
+    tag     nhãn người gọi gắn vào request/kết nối, để bỏ qua phản hồi của ván cũ
+    data    JSON đã giải mã (với 'error' là {'error': mô tả lỗi})
+
+Địa chỉ server lấy từ biến môi trường CHESS_SERVER_URL (mặc định http://localhost:5000).
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pygame # type: ignore
+
+try:
+    from websockets.asyncio.client import connect as ws_connect # type: ignore
+    from websockets.exceptions import WebSocketException # type: ignore
+except ImportError:
+    # websockets chỉ cần cho chế độ Online; chế độ đánh với máy chỉ dùng HTTP
+    ws_connect = None
+    WebSocketException = OSError
+
+SERVER_URL = os.environ.get('CHESS_SERVER_URL', 'http://localhost:5000')
+WS_PATH = '/ws/multiplayer'
+# Thời gian chờ tối đa (giây) cho một request HTTP; /api/ai_move chờ AI tìm nước đi
+HTTP_TIMEOUT = 30
+
+NET_EVENT = pygame.event.custom_type()
+
+
+def _post(kind, tag, data, **extra):
+    # pygame.event.post an toàn khi gọi từ luồng khác luồng chính
+    pygame.event.post(pygame.event.Event(NET_EVENT, kind=kind, tag=tag, data=data, **extra))
+
+
+class NetworkClient:
+    """Kết nối tới backend dùng chung cho cả phiên chơi.
+
+    HTTP đi qua một kết nối keep-alive duy nhất trên một luồng riêng (các request được gửi lần lượt);
+    WebSocket được mở khi gửi message đầu tiên và giữ tới khi disconnect().
+    """
+
+    def __init__(self, server_url=SERVER_URL):
+        parts = urlsplit(server_url)
+        self._host = parts.netloc
+        self._https = parts.scheme == 'https'
+        self.ws_url = ('wss://' if self._https else 'ws://') + parts.netloc + WS_PATH
+        # Kết nối HTTP chỉ được dùng trong luồng của _http
+        self._connection = None
+        self._http = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chess-http')
+        self._loop = asyncio.new_event_loop()
+        # Các thuộc tính dưới đây chỉ được dùng trong luồng của vòng lặp asyncio
+        self._outbox = None
+        self._ws_task = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name='chess-net', daemon=True)
+        self._thread.start()
+
+    # --- API cho luồng chính (không chặn) ---
+
+    def request(self, method, path, payload=None, tag=None):
+        """Gửi request HTTP; phản hồi tới sau qua NET_EVENT kind='http' (hoặc 'error')."""
+        asyncio.run_coroutine_threadsafe(self._request(method, path, payload, tag), self._loop)
+
+    def send(self, message, tag=None):
+        """Gửi message JSON qua WebSocket, tự mở kết nối nếu chưa có.
+
+        tag chỉ có tác dụng khi phải mở kết nối mới: mọi message nhận được trên kết nối đó mang tag này.
+        """
+        self._loop.call_soon_threadsafe(self._send_ws, message, tag)
+
+    def disconnect(self):
+        """Đóng WebSocket (server sẽ hủy hàng chờ ghép đôi và báo người chơi còn lại)."""
+        self._loop.call_soon_threadsafe(self._close_ws)
+
+    def close(self):
+        """Đóng mọi kết nối và dừng luồng mạng."""
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        self._thread.join(timeout=2)
+        self._http.shutdown(wait=False)
+
+    # --- HTTP ---
+
+    async def _request(self, method, path, payload, tag):
+        try:
+            status, data = await self._loop.run_in_executor(self._http, self._send_http, method, path, payload)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            _post('error', tag, {'error': str(e) or type(e).__name__})
+            return
+        _post('http', tag, data, status=status)
+
+    def _send_http(self, method, path, payload):
+        """Chạy trong luồng HTTP: gửi request trên kết nối keep-alive, trả về (mã trạng thái, JSON)."""
+        body = json.dumps(payload) if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            if self._connection is None:
+                connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+                self._connection = connection_class(self._host, timeout=HTTP_TIMEOUT)
+            try:
+                self._connection.request(method, path, body, headers)
+                response = self._connection.getresponse()
+                raw = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Server đã đóng kết nối keep-alive lúc rảnh: mở kết nối mới và gửi lại một lần
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise
+                continue
+            except (OSError, http.client.HTTPException):
+                self._connection.close()
+                self._connection = None
+                raise
+            return response.status, json.loads(raw) if raw else {}
+
+    # --- WebSocket ---
+
+    def _send_ws(self, message, tag):
+        if self._ws_task is None or self._ws_task.done():
+            # Mỗi kết nối có hàng đợi riêng: message chưa gửi của kết nối cũ bị bỏ
+            self._outbox = asyncio.Queue()
+            self._ws_task = self._loop.create_task(self._run_ws(self._outbox, tag))
+        self._outbox.put_nowait(message)
+
+    def _close_ws(self):
+        if self._ws_task is not None:
+            self._ws_task.cancel()
+            self._ws_task = None
+
+    async def _run_ws(self, outbox, tag):
+        if ws_connect is None:
+            _post('error', tag, {'error': 'Online mode requires the websockets package'})
+            return
+        try:
+            async with ws_connect(self.ws_url) as ws:
+                writer = asyncio.create_task(self._write_ws(ws, outbox))
+                try:
+                    async for data in ws:
+                        try:
+                            message = json.loads(data)
+                        except ValueError:
+                            continue
+                        _post('ws', tag, message)
+                finally:
+                    writer.cancel()
+        except asyncio.CancelledError:
+            # disconnect() chủ động đóng: không báo lỗi
+            raise
+        except (OSError, WebSocketException) as e:
+            _post('error', tag, {'error': str(e) or type(e).__name__})
+            return
+        _post('closed', tag, {})
+
+    async def _write_ws(self, ws, outbox):
+        try:
+            while True:
+                message = await outbox.get()
+                await ws.send(json.dumps(message))
+        except WebSocketException:
+            pass  # vòng đọc sẽ thấy kết nối đóng và báo lại
+
+    async def _shutdown(self):
+        task = self._ws_task
+        self._close_ws()
+        if task is not None:
+            # Chờ WebSocket đóng hẳn (gửi close frame) trước khi dừng vòng lặp
+            await asyncio.gather(task, return_exceptions=True)
+        self._loop.stop()